@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script para escribir la tabla de tarifas e indicadores como dataset Parquet
+particionado por año (y opcionalmente por municipio), de modo que el visor,
+el dashboard principal y la API lean solo los años y columnas que usan
+
+Ejemplos:
+    python build_data_lake.py
+    python build_data_lake.py --origen data/tarifas_con_indicadores.csv --destino data/lago_tarifas
+    python build_data_lake.py --desde 2025                 # reescribir solo los años desde 2025 (mes nuevo)
+    python build_data_lake.py --origen sqlite:////tmp/tarifas.sqlite --por-municipio
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from tarifas import datos, lago
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Dataset Parquet particionado de la tabla de tarifas")
+    parser.add_argument('--origen', help="URL de base de datos o archivo de tarifas (por defecto la base configurada)")
+    parser.add_argument('--tabla', default=datos.TABLA_TARIFAS)
+    parser.add_argument('--destino', default=lago.RUTA_LAGO, help="Carpeta del dataset")
+    parser.add_argument('--desde', type=int, help="Leer y reescribir solo los años desde este (los demás no se tocan)")
+    parser.add_argument('--por-municipio', action='store_true', help="Particionar también por municipio")
+    parser.add_argument('--filas-por-grupo', type=int, default=lago.FILAS_POR_GRUPO,
+                        help="Filas máximas por grupo de filas de Parquet")
+    return parser.parse_args(argv)
+
+
+def build_data_lake(args):
+    """Leer la tabla (o los años pedidos) y escribir sus particiones"""
+    inicio = time.perf_counter()
+    años = (args.desde, 9999) if args.desde else None
+    df = datos.cargar_tarifas(args.origen or datos.crear_engine(), args.tabla, años=años)
+    if 'fecha' in df.columns:
+        df = df.drop(columns='fecha')
+    if 'Año' not in df.columns:
+        df['Año'] = df['Fecha'].dt.year
+    print(f"Leídas {len(df):,} filas en {time.perf_counter() - inicio:.2f} s")
+
+    inicio = time.perf_counter()
+    lago.escribir_lago(df, args.destino, args.por_municipio, args.filas_por_grupo)
+    años_escritos = sorted(df['Año'].unique())
+    tamaño = sum(os.path.getsize(os.path.join(raiz, nombre))
+                 for raiz, _, nombres in os.walk(args.destino) for nombre in nombres)
+    print(f"Años {años_escritos[0]}-{años_escritos[-1]} escritos en {args.destino} "
+          f"({tamaño / 1024 ** 2:.1f} MB en total, {time.perf_counter() - inicio:.2f} s)")
+
+
+if __name__ == "__main__":
+    try:
+        build_data_lake(parse_args())
+    except Exception as e:
+        print(f"Error al escribir el dataset particionado: {str(e)}")
+        sys.exit(1)
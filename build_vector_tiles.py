@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script para generar la pirámide de teselas vectoriales (MVT) de una capa de
+polígonos (por defecto el shapefile de municipios del visor). El resultado
+es un MBTiles que sirve run_tiles.py; el visor lo usa en lugar de incrustar
+todo el GeoJSON en la página (ver tarifas/mvt.py). También guarda una copia
+del cliente de teselas vectoriales de Leaflet en <directorio>/js, para que el
+visor no dependa de unpkg
+
+Ejemplos:
+    python build_vector_tiles.py
+    python build_vector_tiles.py --zoom-maximo 14
+    python build_vector_tiles.py --shapefile data/shp/veredas.shp --capa veredas --clave CODIGO_VER --propiedades NOMBRE_VER
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from tarifas import geo, mvt, teselas
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pirámide de teselas vectoriales de una capa de polígonos")
+    parser.add_argument('--shapefile', default=geo.RUTA_MUNICIPIOS)
+    parser.add_argument('--capa', default=geo.CAPA_VECTORIAL, help="Nombre de la capa y del MBTiles")
+    parser.add_argument('--directorio', help="Directorio de los MBTiles (por defecto data/teselas o TARIFAS_TESELAS_DIR)")
+    parser.add_argument('--clave', default='MpNombre_norm', help="Columna con la que el navegador une los valores")
+    parser.add_argument('--propiedades', nargs='*', default=['MpNombre'], help="Columnas que viajan en las teselas")
+    parser.add_argument('--zoom-minimo', type=int, default=mvt.ZOOM_MINIMO)
+    parser.add_argument('--zoom-maximo', type=int, default=mvt.ZOOM_MAXIMO)
+    parser.add_argument('--url-cliente', default=geo.VECTORGRID_JS,
+                        help="URL de Leaflet.VectorGrid que se guarda para servirla localmente")
+    return parser.parse_args(argv)
+
+
+def build_vector_tiles(args):
+    """Leer la capa y escribir su pirámide"""
+    import geopandas as gpd
+
+    inicio = time.perf_counter()
+    gdf = gpd.read_file(args.shapefile)
+    if args.clave not in gdf.columns:
+        # La clave por defecto es el nombre normalizado del municipio, como en el visor
+        gdf = geo.preparar_municipios(gdf)
+    ruta = teselas.ruta_capa(args.capa, args.directorio)
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    print(f"Leídos {len(gdf):,} polígonos de {args.shapefile}")
+
+    resumen = mvt.construir_piramide(
+        gdf, ruta, args.capa, args.clave, args.propiedades, args.zoom_minimo, args.zoom_maximo,
+        progreso=lambda z, r: print(f"  zoom {z}: {r['teselas']:,} teselas, {r['bytes'] / 1024:.1f} KB"),
+    )
+    total = sum(r['teselas'] for r in resumen.values())
+    print(f"{total:,} teselas escritas en {ruta} ({os.path.getsize(ruta) / 1024 ** 2:.1f} MB, "
+          f"{time.perf_counter() - inicio:.1f} s)")
+    guardar_cliente(args)
+
+
+def guardar_cliente(args):
+    """Copia local de Leaflet.VectorGrid (si ya está o no se puede descargar, se sigue sin ella)"""
+    import requests
+
+    directorio = os.path.join(args.directorio or teselas.directorio_teselas(), teselas.CARPETA_JS)
+    ruta = os.path.join(directorio, geo.ARCHIVO_VECTORGRID)
+    if os.path.isfile(ruta):
+        return
+    try:
+        respuesta = requests.get(args.url_cliente, timeout=30)
+        respuesta.raise_for_status()
+    except requests.RequestException as e:
+        print(f"No se pudo descargar el cliente de teselas vectoriales ({e}); el visor lo cargará de {geo.VECTORGRID_JS}")
+        return
+    os.makedirs(directorio, exist_ok=True)
+    with open(ruta, 'wb') as archivo:
+        archivo.write(respuesta.content)
+    print(f"Cliente de teselas vectoriales guardado en {ruta}")
+
+
+if __name__ == "__main__":
+    try:
+        build_vector_tiles(parse_args())
+    except Exception as e:
+        print(f"Error al generar las teselas vectoriales: {str(e)}")
+        sys.exit(1)
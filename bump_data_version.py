@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script para registrar una nueva versión de los datos después de una carga
+manual (por ejemplo, las tarifas de un mes nuevo), de modo que los dashboards
+y la API recarguen solo los municipios afectados sin reiniciar el servidor
+
+Ejemplos:
+    python bump_data_version.py
+    python bump_data_version.py --municipios Medellín Bello
+    python bump_data_version.py --origen sqlite:////tmp/tarifas.sqlite --ver
+"""
+
+import argparse
+import sys
+
+from tarifas import datos, versiones
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Registro de versiones de los datos de tarifas")
+    parser.add_argument('--origen', help="URL de base de datos (por defecto la base configurada)")
+    parser.add_argument('--tabla', default=datos.TABLA_TARIFAS)
+    parser.add_argument('--municipios', nargs='+', help="Municipios cambiados (por defecto toda la tabla)")
+    parser.add_argument('--descripcion', default='bump_data_version')
+    parser.add_argument('--ver', action='store_true', help="Solo mostrar la versión actual")
+    return parser.parse_args(argv)
+
+
+def bump_data_version(args):
+    """Registrar el cambio (o mostrar la versión actual)"""
+    origen = args.origen or datos.crear_engine()
+    if args.ver:
+        print(f"Versión actual de {args.tabla}: {versiones.version_actual(origen, args.tabla)}")
+        return
+    version = versiones.registrar_cambio(origen, args.municipios, args.tabla, args.descripcion)
+    alcance = ', '.join(args.municipios) if args.municipios else "toda la tabla"
+    print(f"Versión {version} registrada para {args.tabla} ({alcance})")
+
+
+if __name__ == "__main__":
+    try:
+        bump_data_version(parse_args())
+    except Exception as e:
+        print(f"Error al registrar la versión de los datos: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script para detectar anomalías y cambios estructurales en todas las series
+de tarifas y guardarlos (tabla eventos_series_tarifas o archivo)
+
+Ejemplos:
+    python detect_anomalies.py
+    python detect_anomalies.py --origen data/tarifas_con_indicadores_excel.xlsx --destino data/eventos.parquet
+    python detect_anomalies.py --origen sqlite:////tmp/tarifas.sqlite --umbral-z 6 --min-salto 0.15
+"""
+
+import argparse
+import sys
+import time
+
+from tarifas import anomalias, datos
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Detección de anomalías y cambios estructurales en las tarifas")
+    parser.add_argument('--origen', help="URL de base de datos o archivo de tarifas (por defecto la base configurada)")
+    parser.add_argument('--destino', help="URL de base de datos o archivo .parquet/.csv (por defecto la base de "
+                                          "origen; obligatorio si el origen es un archivo o un dataset)")
+    parser.add_argument('--tabla', default=anomalias.TABLA_EVENTOS)
+    parser.add_argument('--columnas', nargs='+', default=['Cargo Fijo', 'Cargo por Consumo'])
+    parser.add_argument('--umbral-z', type=float, default=anomalias.UMBRAL_Z)
+    parser.add_argument('--min-salto', type=float, default=anomalias.MIN_SALTO,
+                        help="Cambio mínimo de nivel en escala logarítmica")
+    parser.add_argument('--ventana', type=int, default=anomalias.VENTANA, help="Meses de la mediana móvil")
+    args = parser.parse_args(argv)
+    if args.origen and '://' not in args.origen and not args.destino:
+        parser.error("--destino es obligatorio cuando --origen es un archivo o un dataset")
+    return args
+
+
+def detect_anomalies(args):
+    """Detectar los eventos de todas las series y guardarlos"""
+    origen = args.origen or datos.crear_engine()
+    inicio = time.perf_counter()
+    df = datos.compactar_tarifas(datos.cargar_tarifas(origen))
+    print(f"Leídas {len(df):,} filas en {time.perf_counter() - inicio:.2f} s")
+
+    inicio = time.perf_counter()
+    eventos = anomalias.detectar_eventos(df, args.columnas, args.umbral_z, args.min_salto, args.ventana)
+    print(f"Detectados {len(eventos):,} eventos en {time.perf_counter() - inicio:.2f} s")
+    print(eventos.groupby(['Columna', 'Tipo']).size().to_string())
+
+    anomalos = eventos[eventos['Tipo'] == anomalias.ANOMALIA]
+    if len(anomalos):
+        print("\nAnomalías más fuertes:")
+        print(anomalos.reindex(anomalos['Puntaje'].abs().sort_values(ascending=False).index).head(10).to_string(index=False))
+
+    destino = args.destino or origen
+    anomalias.guardar_eventos(eventos, destino, args.tabla)
+    print(f"\nEventos guardados en {args.destino or args.tabla}")
+
+
+if __name__ == "__main__":
+    try:
+        detect_anomalies(parse_args())
+    except Exception as e:
+        print(f"Error al detectar anomalías: {str(e)}")
+        sys.exit(1)
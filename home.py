@@ -3,12 +3,10 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+import uuid
 from datetime import datetime, timedelta
-from prophet import Prophet
-import os
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-import pandas as pd
+from tarifas import anomalias, cache_compartido, calidad, datos, graficos, indicadores, lago, modelos, planificador, precision, versiones
+from tarifas.precarga import iniciar_precarga
 
 
 # Configuración de la página
@@ -19,20 +17,14 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Importar Prophet y las librerías de mapas en segundo plano mientras se pinta la página
+iniciar_precarga()
+
 
 def crear_engine():
     try:
-        load_dotenv()
-        DB_USER = os.getenv("DB_USER")
-        DB_PASSWORD = os.getenv("DB_PASSWORD")
-        DB_HOST = os.getenv("DB_HOST")
-        DB_PORT = os.getenv("DB_PORT")
-        DB_NAME = os.getenv("DB_NAME")
-
         # URL de conexión para Supabase
-        DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        
-        return create_engine(DATABASE_URL)
+        return datos.crear_engine()
     except Exception as e:
         st.error(f"Error al conectar con la base de datos: {str(e)}")
         st.stop()
@@ -41,49 +33,134 @@ engine = crear_engine()
 
 
 
-@st.cache_data
-def cargar_datos():
+# DataFrame compacto de todos los municipios (o solo de `municipios` al recargar por cambios)
+def cargar_datos(municipios=None):
+    # Primero, veamos la estructura de la tabla
+    query_structure = f"""
+        SELECT column_name, data_type 
+        FROM information_schema.columns 
+        WHERE table_name = '{datos.TABLA_TARIFAS}'
+        ORDER BY ordinal_position;
+    """
+    df_structure = pd.read_sql(query_structure, engine)
+    print("Estructura de la tabla:", df_structure)
+    
+    # Ahora cargamos los datos
+    df = datos.leer_tarifas(engine, municipios=municipios)
+    
+    # Convertir la columna fecha a datetime y renombrar columnas; un error de
+    # lectura se propaga para que una recarga fallida no deje la tabla vacía
+    return datos.compactar_tarifas(datos.preparar_tarifas(df))
+
+# Tabla compartida por todas las sesiones; al cambiar la versión de los datos
+# solo se recargan los municipios afectados
+@st.cache_resource
+def cargar_tabla():
     try:
-        # Primero, veamos la estructura de la tabla
-        query_structure = """
-            SELECT column_name, data_type 
-            FROM information_schema.columns 
-            WHERE table_name = 'tarifas_acueductos_aguas_residuales_med_ing_caracteristicas'
-            ORDER BY ordinal_position;
-        """
-        df_structure = pd.read_sql(query_structure, engine)
-        print("Estructura de la tabla:", df_structure)
-        
-        # Ahora cargamos los datos
-        query = "SELECT * FROM tarifas_acueductos_aguas_residuales_med_ing_caracteristicas"
-        df = pd.read_sql(query, engine)
-        
-        # Convertir la columna fecha a datetime
-        if 'Fecha' in df.columns:
-            df['Fecha'] = pd.to_datetime(df['Fecha'])
-        elif 'fecha' in df.columns:
-            df['Fecha'] = pd.to_datetime(df['fecha'])
-        else:
-            st.error(f"No se encontró la columna de fecha. Columnas disponibles: {df.columns.tolist()}")
-            st.stop()
-        
-        # Renombrar columnas para mantener compatibilidad
-        df = df.rename(columns={
-            'municipio': 'Municipio',
-            'estrato': 'Estrato',
-            'servicio': 'Servicio',
-            'Cargo Fijo': 'Cargo Fijo',
-            'Cargo por Consumo': 'Cargo por Consumo',
-            'año': 'Año'
-        })
-            
-        return df
+        vigilante = versiones.vigilante(engine)
+    except Exception as e:
+        print("Sin seguimiento de versiones de los datos:", e)
+        vigilante = None
+    try:
+        return versiones.DatosVersionados(cargar_datos, vigilante, nombre=datos.TABLA_TARIFAS)
     except Exception as e:
+        # Sin tabla no se guarda nada en la caché: la próxima ejecución vuelve a intentarlo
         st.error("Error al cargar los datos desde la base de datos.")
         st.exception(e)
-        return pd.DataFrame()
+        st.stop()
 
-df_real = cargar_datos()
+# Índice de series sobre la tabla ordenada: cada selección es un bloque contiguo de filas
+def cargar_indice():
+    return cargar_tabla().indice
+
+tabla_datos = cargar_tabla()
+tabla_datos.actualizar()
+indice_series = tabla_datos.indice
+df_real = indice_series.df
+
+# Reporte de calidad de la tabla cruda en cada versión de los datos, compartido por
+# todas las sesiones y, con la caché compartida, revisado por un solo proceso
+@st.cache_resource(max_entries=2)
+def cargar_reporte_calidad(version):
+    def revisar_tabla_cruda():
+        try:
+            return calidad.revisar_tabla(datos.leer_tarifas(engine))
+        except Exception as e:
+            print("No se pudo revisar la calidad de la tabla:", e)
+            return None
+
+    return cache_compartido.memorizar('calidad', (datos.TABLA_TARIFAS, version), revisar_tabla_cruda)
+
+reporte_calidad = cargar_reporte_calidad(tabla_datos.version)
+if reporte_calidad is not None and not reporte_calidad.empty:
+    # Los errores se muestran siempre; las advertencias quedan en el desplegable
+    errores_calidad = calidad.errores(reporte_calidad)
+    if len(errores_calidad):
+        st.error(f"La revisión de calidad encontró {len(errores_calidad)} errores en los datos.")
+    with st.expander(f"⚠️ Calidad de los datos: {len(errores_calidad)} errores, "
+                     f"{len(reporte_calidad) - len(errores_calidad)} advertencias"):
+        st.dataframe(reporte_calidad, hide_index=True, use_container_width=True)
+
+
+# Anomalías y cambios estructurales de todas las series, detectados en una sola pasada
+# (se recalculan solo cuando cambia la versión de los datos)
+@st.cache_resource(max_entries=2)
+def cargar_eventos(version):
+    return anomalias.detectar_eventos(cargar_indice().df)
+
+# Identificador de la sesión para el límite de ajustes simultáneos por sesión
+if 'id_sesion' not in st.session_state:
+    st.session_state.id_sesion = uuid.uuid4().hex
+
+# Ajuste Prophet de una serie sin anomalías (corre en el pool del planificador)
+def ajustar_prophet_serie(municipio, estrato, servicio, version, eventos_todos):
+    def ajustar():
+        eventos = anomalias.eventos_serie(eventos_todos, municipio, estrato, servicio)
+        df_prophet = anomalias.depurar_serie(modelos.preparar_serie(indice_series.serie(municipio, estrato, servicio)), eventos)
+        forecast = modelos.ajustar_prophet(
+            df_prophet, 12, frecuencia='M', interval_width=0.95, cambios=anomalias.fechas_cambio(eventos)
+        )
+        futuro = forecast[forecast['ds'] > df_prophet['ds'].max()]
+        precision.registrar_pronostico(
+            municipio, estrato, servicio, 'Prophet', df_prophet, futuro['ds'],
+            futuro['yhat'], futuro['yhat_lower'], futuro['yhat_upper'], fuente='home', variante='eventos'
+        )
+        return eventos, df_prophet, forecast
+    return cache_compartido.memorizar('pronosticos', ('home', municipio, estrato, servicio, version), ajustar)
+
+# Pronóstico Prophet de una serie; la clave lleva la versión del municipio, así
+# un cambio en otro municipio no obliga a reentrenar este
+@st.cache_data(max_entries=64, show_spinner=False)
+def pronostico_prophet(municipio, estrato, servicio, version, _sesion=None):
+    return planificador.planificador().ejecutar(
+        ajustar_prophet_serie, municipio, estrato, servicio, version, cargar_eventos(tabla_datos.version),
+        prioridad=planificador.INTERACTIVA, sesion=_sesion
+    )
+
+# Series precalculándose en segundo plano (compartido por las sesiones del proceso)
+@st.cache_resource
+def precalculos():
+    return set()
+
+# Con la caché compartida, los demás estratos del municipio se ajustan con prioridad
+# de fondo para que cambiar de estrato no espere al modelo
+def precalcular_estratos(municipio, servicio, version):
+    if cache_compartido.cache_compartido() is None:
+        return
+    pendientes = precalculos()
+    eventos_todos = cargar_eventos(tabla_datos.version)
+    for otro in indice_series.estratos:
+        clave = (municipio, otro, servicio, version)
+        if clave in pendientes or (municipio, otro, servicio) not in indice_series:
+            continue
+        try:
+            futuro = planificador.planificador().enviar(
+                ajustar_prophet_serie, *clave, eventos_todos, prioridad=planificador.FONDO
+            )
+        except planificador.ColaLlena:
+            return
+        pendientes.add(clave)
+        futuro.add_done_callback(lambda _, clave=clave: pendientes.discard(clave))
 
 if df_real.empty:
     st.error("No se pudo cargar la información desde la base de datos. Verifica la conexión o el contenido.")
@@ -217,26 +294,61 @@ st.markdown("<h1 class='main-header'>💧 Sistema de Predicción de Tarifas de A
 st.markdown("<p style='text-align: center;'>Evaluación y predicción de tarifas en el Valle de Aburrá</p>", unsafe_allow_html=True)
 
 
-# Calcular métricas reales y mostrarlas
+# ======================== Nodos de cálculo ========================
+# Cada panel es un nodo en caché cuya clave lleva solo las entradas que usa:
+#
+#   pronostico_prophet(municipio, estrato, servicio)  -> KPI y gráfico de pronóstico
+#   estructura_estratos(municipio, servicio)          -> IET
+#   variacion_municipios(estrato, servicio)           -> IVG
+#   matriz_municipios(columna, estrato, servicio, período, tipo) -> promedios y matriz
+#   indicadores_municipios(tipo de indicador)         -> indicadores tarifarios
+#
+# y las secciones de la página son fragmentos: un widget vuelve a ejecutar solo su
+# sección, y dentro de ella solo se recalculan los nodos cuyas entradas cambiaron.
+version_datos = tabla_datos.version
+
+# Dataset particionado (build_data_lake.py) solo si se configuró en TARIFAS_LAGO
+RUTA_LAGO = lago.lago_configurado()
+
+# Diferencias de todos los municipios contra todos (matriz N×N en una operación);
+# cambiar el municipio base es tomar otra columna de la matriz ya calculada. Con el
+# dataset particionado solo se leen los años, el estrato, el servicio y la columna pedidos
+@st.cache_data(max_entries=32, show_spinner=False)
+def matriz_municipios(columna, estrato, servicio, anno_inicio, anno_fin, relativa, version):
+    def calcular():
+        if RUTA_LAGO:
+            df_periodo = lago.leer_lago(
+                RUTA_LAGO, ['Municipio', columna], anno_inicio, anno_fin, Estrato=estrato, Servicio=servicio
+            )
+            promedios = indicadores.promedio_por_municipio(df_periodo, columna, municipios=cargar_indice().municipios)
+        else:
+            promedios = indicadores.promedio_por_municipio(
+                cargar_indice().df, columna, estrato, servicio, anno_inicio, anno_fin, cargar_indice().municipios
+            )
+        return promedios, indicadores.matriz_comparacion(promedios, relativa)
+    return cache_compartido.memorizar(
+        'comparacion', (columna, estrato, servicio, anno_inicio, anno_fin, relativa, version), calcular
+    )
 
-# === Selección de filtros ===
-col1, col2, col3 = st.columns(3)
-with col1:
-    municipio = st.selectbox("Municipio", sorted(df_real['Municipio'].unique()))
-with col2:
-    estrato = st.selectbox("Estrato", sorted(df_real['Estrato'].unique()))
-with col3:
-    servicio = st.selectbox("Tipo de Servicio", sorted(df_real['Servicio'].unique()))
-
-# === Filtrar datos según selección ===
-df_filtrado = df_real[
-    (df_real['Municipio'] == municipio) &
-    (df_real['Estrato'] == estrato) &
-    (df_real['Servicio'] == servicio)
-].sort_values('Fecha')
-
-# === Validar existencia de datos ===
-if df_filtrado.empty:
+# Estructura tarifaria (IET): solo depende del municipio y el servicio
+@st.cache_data(max_entries=64, show_spinner=False)
+def estructura_estratos(municipio, servicio, version):
+    return indicadores.estructura_tarifaria(cargar_indice().df, municipio, servicio)
+
+# Variación geográfica (IVG): solo depende del estrato y el servicio
+@st.cache_data(max_entries=64, show_spinner=False)
+def variacion_municipios(estrato, servicio, version):
+    return indicadores.variacion_geografica(cargar_indice().df, estrato, servicio)
+
+# Indicadores tarifarios por municipio: solo dependen del tipo de indicador
+@st.cache_data(max_entries=16, show_spinner=False)
+def indicadores_municipios(tipo_indicador, version):
+    return indicadores.indicadores_por_municipio(cargar_indice().df, indicadores.INDICADORES_CLAVE[tipo_indicador])
+
+version_comparacion = (tabla_datos.version, lago.version(RUTA_LAGO) if RUTA_LAGO else 0)
+
+# KPI vacíos cuando la combinación no tiene datos
+def panel_sin_datos():
     st.warning("⚠️ No hay datos disponibles para esta combinación.")
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -249,23 +361,21 @@ if df_filtrado.empty:
         st.markdown("<div class='metric-big'>–</div>", unsafe_allow_html=True)
         st.markdown("<div class='metric-label'>Variación estimada anual</div>", unsafe_allow_html=True)
 
-else:
-
-    
-    # === Preparar datos para Prophet ===
-    df_prophet = df_filtrado[['Fecha', 'Cargo Fijo']].rename(columns={'Fecha': 'ds', 'Cargo Fijo': 'y'})
-
-    # === Entrenar modelo Prophet ===
-    modelo = Prophet(interval_width=0.95)
-    modelo.fit(df_prophet)
-
-    future = modelo.make_future_dataframe(periods=12, freq='M')
-    forecast = modelo.predict(future)
+# KPI y gráfico del pronóstico de la serie elegida
+def panel_pronostico(municipio, estrato, servicio):
+    # === Prophet sin anomalías y con los cambios estructurales como regresores escalón de nivel ===
+    try:
+        eventos, df_prophet, forecast = pronostico_prophet(
+            municipio, estrato, servicio, tabla_datos.version_municipio(municipio), _sesion=st.session_state.id_sesion
+        )
+    except planificador.ColaLlena:
+        st.warning("⏳ El servidor está ocupado ajustando modelos. Intenta de nuevo en unos segundos.")
+        return
+    precalcular_estratos(municipio, servicio, tabla_datos.version_municipio(municipio))
 
     historico = forecast[forecast['ds'] <= df_prophet['ds'].max()]
     prediccion = forecast[forecast['ds'] > df_prophet['ds'].max()]
 
-
         # === Métricas reales ===
     tarifa_actual = df_prophet['y'].iloc[-1]
     tarifa_3m = prediccion['yhat'].iloc[2] if len(prediccion) >= 3 else prediccion['yhat'].mean()
@@ -283,12 +393,11 @@ else:
         st.markdown(f"<div class='metric-big'>{variacion_anual:.1f}%</div>", unsafe_allow_html=True)
         st.markdown("<div class='metric-label'>Variación estimada anual</div>", unsafe_allow_html=True)
 
-
     # === Crear gráfico ===
     fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=historico['ds'],
-        y=historico['yhat'],
+    fig.add_trace(graficos.traza_linea(
+        historico['ds'],
+        historico['yhat'],
         mode='lines',
         name='Datos históricos',
         line=dict(color='#1E88E5', width=3)
@@ -309,6 +418,7 @@ else:
         hoverinfo='skip',
         name='Intervalo de confianza'
     ))
+    graficos.marcar_eventos(fig, eventos)
 
     fig.update_layout(
         title='Evolución y Predicción de Tarifas',
@@ -322,190 +432,229 @@ else:
 
     st.plotly_chart(fig, use_container_width=True)
 
-
-
     with st.expander("¿Cómo interpretar esta gráfica?"):
         st.markdown("""
         - **Línea azul**: datos históricos reales de tarifas.
         - **Línea punteada naranja**: predicción futura basada en Prophet.
         - **Área sombreada**: intervalo de confianza del 95%.
+        - **Cruces**: meses con un valor anómalo (posible error de datos), excluidos del entrenamiento; la etiqueta muestra el valor observado.
+        - **Líneas verticales moradas**: cambios estructurales (p. ej. reajustes regulatorios), que Prophet usa como regresores escalón: cada uno cambia el nivel de la serie desde su fecha.
         """)
 
+# Serie elegida: filtros, pronóstico e indicadores IET e IVG. Un cambio en estos
+# filtros vuelve a ejecutar solo esta sección
+@st.fragment
+def seccion_serie():
+    # === Selección de filtros ===
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        municipio = st.selectbox("Municipio", indice_series.municipios)
+    with col2:
+        estrato = st.selectbox("Estrato", indice_series.estratos)
+    with col3:
+        servicio = st.selectbox("Tipo de Servicio", indice_series.servicios)
 
-
-
-# Indicadores clave
-st.markdown("<h2 class='sub-header'>Indicadores de Análisis Tarifario</h2>", unsafe_allow_html=True)
-
-col1, col2 = st.columns(2)
-
-# ======= ESTRUCTURA TARIFARIA (IET) =======
-with col1:
-    st.subheader("Estructura Tarifaria (IET)")
-
-    # Agrupamos por estrato para obtener promedio de Cargo Fijo y Cargo por Consumo
-    df_iet = df_real[
-        (df_real['Municipio'] == municipio) &
-        (df_real['Servicio'] == servicio)
-    ].groupby('Estrato')[['Cargo Fijo', 'Cargo por Consumo']].mean().reset_index()
-
-    # Ordenar por estrato numérico si es posible
-    df_iet = df_iet[df_iet['Estrato'].astype(str).str.isnumeric()]
-    df_iet['Estrato'] = df_iet['Estrato'].astype(int)
-    df_iet = df_iet.sort_values(by='Estrato')
-    estratos_graf = [f"Estrato {e}" for e in df_iet['Estrato']]
-
-    fig_iet = go.Figure()
-    fig_iet.add_trace(go.Bar(
-        x=estratos_graf,
-        y=df_iet['Cargo Fijo'],
-        name='Cargo Fijo',
-        marker_color='#1E88E5'
-    ))
-
-    fig_iet.update_layout(
-        title='Composición de Tarifas por Estrato',
-        xaxis_title='Estrato',
-        yaxis_title='Valor Promedio ($COP)',
-        barmode='group',
-        height=300,
-        margin=dict(l=20, r=20, t=50, b=20)
-    )
-
-    st.plotly_chart(fig_iet, use_container_width=True)
-
-    # Cálculo de indicadores simples
-    if not df_iet.empty:
-        #ratio_fijo_variable = (df_iet['Cargo Fijo'].mean() / df_iet['Cargo por Consumo'].mean())
-        progresividad = (df_iet['Cargo Fijo'].max() / df_iet['Cargo Fijo'].min())
-        st.markdown(f"**Indicador de Progresividad:** {progresividad:.2f}")
-        #st.markdown(f"**Ratio Cargo Fijo/Variable:** {ratio_fijo_variable:.2f}")
-    else:
-        st.markdown("**Indicador de Progresividad:** –")
-        #st.markdown("**Ratio Cargo Fijo/Variable:** –")
-
-
-# ======= VARIACIÓN GEOGRÁFICA (IVG) =======
-with col2:
-    st.subheader("Variación Geográfica (IVG)")
-
-    # Agrupamos por municipio para obtener estadísticas de dispersión y promedios
-    df_ivg = df_real[
-        (df_real['Estrato'] == estrato) &
-        (df_real['Servicio'] == servicio)
-    ].groupby('Municipio')['Cargo Fijo'].agg(['std', 'mean']).reset_index()
-    df_ivg.columns = ['Municipio', 'Dispersión Municipal', 'Tarifa Promedio']
-
-    # Ratio Municipal respecto al promedio regional
-    promedio_total = df_ivg['Tarifa Promedio'].mean()
-    df_ivg['Ratio Municipal'] = df_ivg['Tarifa Promedio'] / promedio_total
-
-    fig_ivg = px.scatter(
-        df_ivg,
-        x='Dispersión Municipal',
-        y='Ratio Municipal',
-        size=[30] * len(df_ivg),
-        color=df_ivg['Municipio'],
-        hover_name='Municipio',
-        text='Municipio',
-        color_discrete_sequence=px.colors.qualitative.Plotly
-    )
-
-    fig_ivg.update_traces(
-        textposition='top center',
-        marker=dict(line=dict(width=2, color='DarkSlateGrey'))
-    )
-
-    fig_ivg.update_layout(
-        title='Variación Geográfica de Tarifas',
-        xaxis_title='Dispersión Municipal (σ)',
-        yaxis_title='Ratio Municipal (vs. promedio)',
-        height=300,
-        showlegend=False,
-        margin=dict(l=20, r=20, t=50, b=20)
-    )
-
-    st.plotly_chart(fig_ivg, use_container_width=True)
-
-    # Mostrar métricas clave
-    if not df_ivg.empty:
-        dispersion_regional = df_ivg['Dispersión Municipal'].mean()
-        indice_variabilidad = df_ivg['Ratio Municipal'].std()
-        st.markdown(f"**Índice de Variabilidad:** {indice_variabilidad:.2f}")
-        st.markdown(f"**Dispersión Regional:** {dispersion_regional:.2f}")
+    # === Validar existencia de datos ===
+    if indice_series.serie(municipio, estrato, servicio).empty:
+        panel_sin_datos()
     else:
-        st.markdown("**Índice de Variabilidad:** –")
-        st.markdown("**Dispersión Regional:** –")
-
-
+        panel_pronostico(municipio, estrato, servicio)
 
-# ======================== Comparativas y Análisis Avanzados ========================
-st.markdown("<h2 class='sub-header'>Comparativas y Análisis Avanzados</h2>", unsafe_allow_html=True)
-
-# Controles de análisis comparativo
-col1, col3 = st.columns(2)
-
-with col1:
-    st.write("### Municipio de referencia")
-    municipios_unicos = sorted(df_real["Municipio"].unique())
-    municipio_ref = st.selectbox("Seleccione municipio base", municipios_unicos, key="mun_ref")
-    st.markdown(f"Las comparativas utilizan **{municipio_ref}** como base de referencia")
+    # Indicadores clave
+    st.markdown("<h2 class='sub-header'>Indicadores de Análisis Tarifario</h2>", unsafe_allow_html=True)
 
+    col1, col2 = st.columns(2)
 
+    # ======= ESTRUCTURA TARIFARIA (IET) =======
+    with col1:
+        st.subheader("Estructura Tarifaria (IET)")
+
+        # Agrupamos por estrato para obtener promedio de Cargo Fijo y Cargo por Consumo
+        # (ordenados por estrato numérico)
+        df_iet = estructura_estratos(municipio, servicio, tabla_datos.version_municipio(municipio))
+        estratos_graf = [f"Estrato {e}" for e in df_iet['Estrato']]
+
+        fig_iet = go.Figure()
+        fig_iet.add_trace(go.Bar(
+            x=estratos_graf,
+            y=df_iet['Cargo Fijo'],
+            name='Cargo Fijo',
+            marker_color='#1E88E5'
+        ))
+
+        fig_iet.update_layout(
+            title='Composición de Tarifas por Estrato',
+            xaxis_title='Estrato',
+            yaxis_title='Valor Promedio ($COP)',
+            barmode='group',
+            height=300,
+            margin=dict(l=20, r=20, t=50, b=20)
+        )
+
+        st.plotly_chart(fig_iet, use_container_width=True)
+
+        # Cálculo de indicadores simples
+        if not df_iet.empty:
+            #ratio_fijo_variable = (df_iet['Cargo Fijo'].mean() / df_iet['Cargo por Consumo'].mean())
+            progresividad = (df_iet['Cargo Fijo'].max() / df_iet['Cargo Fijo'].min())
+            st.markdown(f"**Indicador de Progresividad:** {progresividad:.2f}")
+            #st.markdown(f"**Ratio Cargo Fijo/Variable:** {ratio_fijo_variable:.2f}")
+        else:
+            st.markdown("**Indicador de Progresividad:** –")
+            #st.markdown("**Ratio Cargo Fijo/Variable:** –")
 
-with col3:
-    st.write("### Período de análisis")
-    años_disponibles = sorted(df_real["Año"].unique())
-    anno_inicio = st.selectbox("Desde", años_disponibles, index=0)
-    anno_fin = st.selectbox("Hasta", años_disponibles[::-1], index=0)
 
-# Tab de análisis comparativo
-tabs = st.tabs(["Promedio tarifa", "Indicadores Tarifarios"])
+    # ======= VARIACIÓN GEOGRÁFICA (IVG) =======
+    with col2:
+        st.subheader("Variación Geográfica (IVG)")
+
+        # Agrupamos por municipio para obtener estadísticas de dispersión y promedios
+        # y el ratio municipal respecto al promedio regional
+        df_ivg = variacion_municipios(estrato, servicio, version_datos)
+
+        fig_ivg = px.scatter(
+            df_ivg,
+            x='Dispersión Municipal',
+            y='Ratio Municipal',
+            size=[30] * len(df_ivg),
+            color=df_ivg['Municipio'],
+            hover_name='Municipio',
+            text='Municipio',
+            color_discrete_sequence=px.colors.qualitative.Plotly
+        )
+
+        fig_ivg.update_traces(
+            textposition='top center',
+            marker=dict(line=dict(width=2, color='DarkSlateGrey'))
+        )
+
+        fig_ivg.update_layout(
+            title='Variación Geográfica de Tarifas',
+            xaxis_title='Dispersión Municipal (σ)',
+            yaxis_title='Ratio Municipal (vs. promedio)',
+            height=300,
+            showlegend=False,
+            margin=dict(l=20, r=20, t=50, b=20)
+        )
+
+        st.plotly_chart(fig_ivg, use_container_width=True)
+
+        # Mostrar métricas clave
+        if not df_ivg.empty:
+            dispersion_regional = df_ivg['Dispersión Municipal'].mean()
+            indice_variabilidad = df_ivg['Ratio Municipal'].std()
+            st.markdown(f"**Índice de Variabilidad:** {indice_variabilidad:.2f}")
+            st.markdown(f"**Dispersión Regional:** {dispersion_regional:.2f}")
+        else:
+            st.markdown("**Índice de Variabilidad:** –")
+            st.markdown("**Dispersión Regional:** –")
 
-with tabs[0]:
-    st.write("### Promedio de tarifa por municipio")
+# Comparativas: municipio base, período y pestañas. Cambiar el período vuelve a
+# ejecutar solo esta sección (ni el pronóstico ni el IET/IVG)
+@st.fragment
+def seccion_comparativas():
+    # Controles de análisis comparativo
+    col1, col3 = st.columns(2)
 
-    df_periodo = df_real[(df_real["Año"] >= anno_inicio) & (df_real["Año"] <= anno_fin)]
-    df_tarifa_mun = df_periodo.groupby("Municipio")["Cargo Fijo"].mean().reset_index()
-    df_tarifa_mun.columns = ["Municipio", "Tarifa Promedio"]
+    with col1:
+        st.write("### Municipio de referencia")
+        municipios_unicos = indice_series.municipios
+        municipio_ref = st.selectbox("Seleccione municipio base", municipios_unicos, key="mun_ref")
+        st.markdown(f"Las comparativas utilizan **{municipio_ref}** como base de referencia")
 
-    tarifa_base = df_tarifa_mun[df_tarifa_mun["Municipio"] == municipio_ref]["Tarifa Promedio"].values[0]
-    df_tarifa_mun["Diferencia %"] = df_tarifa_mun["Tarifa Promedio"].apply(lambda x: "Base" if x == tarifa_base else f"{((x / tarifa_base - 1)*100):+.1f}%")
+    with col3:
+        st.write("### Período de análisis")
+        años_disponibles = indice_series.años
+        anno_inicio = st.selectbox("Desde", años_disponibles, index=0)
+        anno_fin = st.selectbox("Hasta", años_disponibles[::-1], index=0)
+
+    # Tab de análisis comparativo
+    tabs = st.tabs(["Promedio tarifa", "Matriz de comparación", "Indicadores Tarifarios"])
+
+    with tabs[0]:
+        st.write("### Promedio de tarifa por municipio")
+
+        # Promedios y diferencias salen de la matriz del Cargo Fijo en caché
+        promedios_cargo_fijo, matriz_cargo_fijo = matriz_municipios(
+            'Cargo Fijo', None, None, anno_inicio, anno_fin, True, version_comparacion
+        )
+        df_tarifa_mun = promedios_cargo_fijo.dropna().rename_axis("Municipio").reset_index(name="Tarifa Promedio")
+        nombres = [str(m) for m in df_tarifa_mun["Municipio"]]
+        diferencia = matriz_cargo_fijo[municipio_ref].reindex(nombres).to_numpy()
+        if np.isnan(diferencia).all():
+            st.warning(f"{municipio_ref} no tiene datos entre {anno_inicio} y {anno_fin}; no hay diferencias que calcular.")
+        df_tarifa_mun["Diferencia %"] = np.where(
+            np.array(nombres, dtype=object) == municipio_ref, "Base",
+            [f"{d:+.1f}%" if np.isfinite(d) else "–" for d in diferencia]
+        )
+
+        fig = px.bar(df_tarifa_mun, x="Municipio", y="Tarifa Promedio", color="Tarifa Promedio",
+                     color_continuous_scale=px.colors.sequential.Blues,
+                     title="Tarifa Promedio por Municipio")
+        fig.update_layout(margin=dict(l=20, r=20, t=50, b=20), height=400)
 
-    fig = px.bar(df_tarifa_mun, x="Municipio", y="Tarifa Promedio", color="Tarifa Promedio",
-                 color_continuous_scale=px.colors.sequential.Blues,
-                 title="Tarifa Promedio por Municipio")
-    fig.update_layout(margin=dict(l=20, r=20, t=50, b=20), height=400)
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(df_tarifa_mun, use_container_width=True)
+
+    with tabs[1]:
+        st.write("### Comparación entre todos los municipios")
+
+        columnas_comparables = [c for c in ['Cargo Fijo', 'Cargo por Consumo', 'Cargo por Consumo Menor', 'Cargo por Consumo Mayor']
+                                + indicadores.COLUMNAS_INDICADORES if c in df_real.columns]
+        col_a, col_b, col_c, col_d = st.columns(4)
+        with col_a:
+            columna_matriz = st.selectbox("Indicador", columnas_comparables, key="matriz_columna")
+        with col_b:
+            estrato_matriz = st.selectbox("Estrato", ["Todos"] + list(indice_series.estratos), key="matriz_estrato")
+        with col_c:
+            servicio_matriz = st.selectbox("Servicio", ["Todos"] + list(indice_series.servicios), key="matriz_servicio")
+        with col_d:
+            relativa = st.radio("Diferencia", ["Porcentual", "Absoluta"], key="matriz_tipo", horizontal=True) == "Porcentual"
+
+        promedios, matriz = matriz_municipios(
+            columna_matriz, None if estrato_matriz == "Todos" else estrato_matriz,
+            None if servicio_matriz == "Todos" else servicio_matriz, anno_inicio, anno_fin, relativa, version_comparacion
+        )
+        sin_datos = promedios.index[promedios.isna()].tolist()
+        if sin_datos:
+            st.caption(f"Sin datos en el período para: {', '.join(sin_datos)}")
+
+        fig = graficos.mapa_calor_comparacion(
+            matriz, f"{columna_matriz}: fila vs. municipio base ({anno_inicio}–{anno_fin})", relativa, municipio_ref
+        )
+        st.plotly_chart(fig, use_container_width=True)
 
-    st.plotly_chart(fig, use_container_width=True)
-    st.dataframe(df_tarifa_mun, use_container_width=True)
+        st.markdown(f"**Contra {municipio_ref}:**")
+        df_ref = pd.DataFrame({
+            "Municipio": matriz.index, columna_matriz: promedios.to_numpy(), "Diferencia": matriz[municipio_ref].to_numpy()
+        })
+        st.dataframe(
+            df_ref.style.format({columna_matriz: "{:,.3f}", "Diferencia": "{:+.2f}%" if relativa else "{:+,.3f}"}, na_rep="–"),
+            hide_index=True, use_container_width=True
+        )
 
-with tabs[1]:
-    st.write("### Indicadores Tarifarios por Municipio")
+    with tabs[2]:
+        st.write("### Indicadores Tarifarios por Municipio")
 
-    indicadores_clave = {
-        "IET - Estructura Tarifaria": ["ratio_cargo_fijo_variable", "indice_progresividad", "diferencial_estratos", "indice_sectorial"],
-        "IVG - Variación Geográfica": ["dispersion_municipal", "ratio_municipal", "indice_variabilidad"],
-        "ISD - Servicio Diferencial": ["ratio_servicios", "diferencial_por_estrato", "indice_carga"],
-        "ICO - Costos Operativos": ["ratio_penalizacion", "factor_operativo", "indice_penalizacion"]
-    }
+        indicadores_clave = indicadores.INDICADORES_CLAVE
 
-    tipo_indicador = st.selectbox("Seleccione tipo de indicador", list(indicadores_clave.keys()))
+        tipo_indicador = st.selectbox("Seleccione tipo de indicador", list(indicadores_clave.keys()))
 
-    columnas = indicadores_clave[tipo_indicador]
-    df_indicador = df_real.groupby("Municipio")[columnas].mean().reset_index()
+        columnas = indicadores_clave[tipo_indicador]
+        df_indicador = indicadores_municipios(tipo_indicador, version_datos)
 
-    for columna in columnas:
-        fig = px.bar(df_indicador, x="Municipio", y=columna, color=columna,
-                     color_continuous_scale=px.colors.sequential.Viridis,
-                     title=columna.replace("_", " ").title())
-        fig.update_layout(margin=dict(l=20, r=20, t=50, b=20), height=400)
+        # Una sola figura con un subgráfico por indicador (eje de municipios compartido)
+        fig = graficos.barras_indicadores(df_indicador, columnas)
         st.plotly_chart(fig, use_container_width=True)
 
-    st.dataframe(df_indicador, use_container_width=True)
+        st.dataframe(df_indicador, use_container_width=True)
 
+seccion_serie()
 
+# ======================== Comparativas y Análisis Avanzados ========================
+st.markdown("<h2 class='sub-header'>Comparativas y Análisis Avanzados</h2>", unsafe_allow_html=True)
 
+seccion_comparativas()
 
 # Sección final informativa
 st.markdown("---")
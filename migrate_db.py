@@ -15,6 +15,8 @@ from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 import unidecode
 
+from tarifas import calidad, versiones
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -42,22 +44,34 @@ def get_tables(conn):
         """)
         return [row[0] for row in cur.fetchall()]
 
-def check_problematic_chars(data):
-    """Identificar caracteres problemáticos en los datos"""
-    problematic_rows = []
-    for i, row in enumerate(data):
-        for j, value in enumerate(row):
-            if isinstance(value, str):
+def check_data_quality(data, column_names):
+    """Reporte de calidad de los datos (columna por columna, ver tarifas.calidad)"""
+    return calidad.revisar_tabla(data, column_names)
+
+def insert_batches(conn, cur, table_name, column_names, data, batch_size=1000):
+    """Insertar los datos en lotes, registro por registro si un lote falla"""
+    # Escapar nombres de columnas con espacios
+    columns_str = ', '.join([f'"{col}"' if ' ' in col else col for col in column_names])
+    insert_sql = f"INSERT INTO {table_name} ({columns_str}) VALUES %s"
+    
+    for i in range(0, len(data), batch_size):
+        batch = data[i:i + batch_size]
+        try:
+            execute_values(cur, insert_sql, batch)
+            conn.commit()
+            print(f"  Migrados {min(i + batch_size, len(data))} registros de {len(data)}")
+        except Exception as e:
+            print(f"  Error en lote {i}-{i+batch_size}: {str(e)}")
+            conn.rollback()
+            # Intentar insertar registro por registro
+            for j, row in enumerate(batch):
                 try:
-                    value.encode('utf-8')
-                except UnicodeEncodeError as e:
-                    problematic_rows.append({
-                        'row_index': i,
-                        'column_index': j,
-                        'value': value,
-                        'error': str(e)
-                    })
-    return problematic_rows
+                    cur.execute(f"INSERT INTO {table_name} ({columns_str}) VALUES %s", (row,))
+                    conn.commit()
+                except Exception as e2:
+                    conn.rollback()
+                    print(f"    Error en registro {i+j}: {str(e2)}")
+                    continue
 
 def migrate_table(local_conn, supabase_conn, table_name):
     """Migrar una tabla específica"""
@@ -78,15 +92,12 @@ def migrate_table(local_conn, supabase_conn, table_name):
             cur.execute(f"SELECT * FROM {table_name}")
             data = cur.fetchall()
             
-            # Verificar caracteres problemáticos
-            print(f"\nVerificando caracteres problemáticos en la tabla {table_name}...")
-            problematic_chars = check_problematic_chars(data)
-            if problematic_chars:
-                print("\nSe encontraron caracteres problemáticos:")
-                for prob in problematic_chars:
-                    print(f"Fila {prob['row_index']}, Columna {prob['column_index']}:")
-                    print(f"Valor: {prob['value']}")
-                    print(f"Error: {prob['error']}\n")
+            # Verificar la calidad de los datos; los errores detienen la migración
+            print(f"\nVerificando la calidad de los datos de la tabla {table_name}...")
+            reporte = check_data_quality(data, [col[0] for col in columns])
+            print(calidad.formatear_reporte(reporte))
+            if not calidad.errores(reporte).empty:
+                print("\nSe encontraron errores de calidad; corrija los datos antes de migrar")
                 return False
         
         # Crear tabla en Supabase
@@ -119,27 +130,7 @@ def migrate_table(local_conn, supabase_conn, table_name):
             
             # Insertar datos en lotes
             if data:
-                # Escapar nombres de columnas con espacios
-                columns_str = ', '.join([f'"{col[0]}"' if ' ' in col[0] else col[0] for col in columns])
-                insert_sql = f"INSERT INTO {table_name} ({columns_str}) VALUES %s"
-                
-                batch_size = 1000
-                for i in range(0, len(data), batch_size):
-                    batch = data[i:i + batch_size]
-                    try:
-                        execute_values(cur, insert_sql, batch)
-                        supabase_conn.commit()
-                        print(f"  Migrados {min(i + batch_size, len(data))} registros de {len(data)}")
-                    except Exception as e:
-                        print(f"  Error en lote {i}-{i+batch_size}: {str(e)}")
-                        # Intentar insertar registro por registro
-                        for j, row in enumerate(batch):
-                            try:
-                                cur.execute(f"INSERT INTO {table_name} ({columns_str}) VALUES %s", (row,))
-                                supabase_conn.commit()
-                            except Exception as e2:
-                                print(f"    Error en registro {i+j}: {str(e2)}")
-                                continue
+                insert_batches(supabase_conn, cur, table_name, [col[0] for col in columns], data)
         
         print(f"Tabla {table_name} migrada exitosamente")
         return True
@@ -173,6 +164,12 @@ def migrate_database():
                 print(f"Error en la migración de la tabla {table}")
                 return False
         
+        # Registrar la nueva versión de cada tabla para que los dashboards recarguen
+        for table in tables:
+            if table != versiones.TABLA_VERSIONES:
+                version = versiones.registrar_cambio(SUPABASE_DB_URL, tabla=table, descripcion='migrate_db')
+                print(f"Tabla {table}: versión de datos {version}")
+        
         print("\nMigración completada con éxito")
         return True
         
@@ -1,14 +1,13 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import folium
-from streamlit_folium import st_folium
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
-import geopandas as gpd
 import os
-import unidecode
+import streamlit.components.v1 as components
+from tarifas import animacion, datos, espacial, geo, lago, teselas, versiones
+from tarifas.precarga import iniciar_precarga
 
 
 # Configuración de la página
@@ -18,8 +17,9 @@ st.set_page_config(
     layout="wide"
 )
 
-if 'last_indicador' not in st.session_state:
-    st.session_state.last_indicador = None
+# Importar geopandas/folium y los modelos en segundo plano mientras se pinta la página
+iniciar_precarga()
+
 if 'map_container' not in st.session_state:
     st.session_state.map_container = None
 
@@ -87,48 +87,75 @@ ESCALAS_COLORES = {
     "Índice de Variabilidad": ['#fff7ec', '#fee8c8', '#fdd49e', '#fdbb84', '#fc8d59']  # Amarillo-Naranja
 }
 
-# Función para normalizar nombres de municipios
-def normalizar_nombre(texto):
-    if pd.isna(texto):
-        return texto
-    texto = str(texto).lower()
-    texto = unidecode.unidecode(texto)
-    texto = texto.replace(' ', '')
-    return texto
-
-# Cargar datos
-@st.cache_data
+RUTA_TARIFAS = 'data/tarifas_con_indicadores.csv'
+
+# Dataset particionado por año (build_data_lake.py): si se configuró en TARIFAS_LAGO,
+# cada rango de años lee solo sus particiones y las columnas del visor en lugar de
+# tener toda la tabla en memoria
+RUTA_LAGO = lago.lago_configurado()
+USAR_LAGO = RUTA_LAGO is not None
+COLUMNAS_VISOR = ['Municipio', 'Fecha', 'Año', *INDICADORES.values()]
+
+# Tarifas e indicadores con los nombres de municipio normalizados
+def normalizar_tarifas(df):
+    df_tarifas = datos.compactar_tarifas(datos.preparar_tarifas(df))
+    df_tarifas['Municipio_norm'] = df_tarifas['Municipio'].map(geo.normalizar_nombre).astype('category')
+    return df_tarifas
+
+def cargar_tarifas(municipios=None):
+    return normalizar_tarifas(pd.read_csv(RUTA_TARIFAS))
+
+# Cargar datos (compartidos por todas las sesiones, sin copias por sesión); las
+# tarifas se recargan cuando cambia el archivo
+@st.cache_resource
 def cargar_datos():
     try:
-        # Cargar shapefile de municipios
-        gdf_municipios = gpd.read_file('data/shp/municipios.shp')
-        
-        # Cargar datos de tarifas e indicadores
-        df_tarifas = pd.read_csv('data/tarifas_con_indicadores.csv')
+        # Cargar shapefile de municipios (con nombres normalizados y CRS EPSG:4326)
+        gdf_municipios = geo.cargar_municipios()
         
-        # Normalizar nombres de municipios
-        gdf_municipios['MpNombre_norm'] = gdf_municipios['MpNombre'].apply(normalizar_nombre)
-        df_tarifas['Municipio_norm'] = df_tarifas['Municipio'].apply(normalizar_nombre)
+        # Cargar datos de tarifas e indicadores (con el dataset particionado solo se sigue su versión)
+        if USAR_LAGO:
+            tabla_tarifas = versiones.vigilante(RUTA_LAGO)
+        else:
+            tabla_tarifas = versiones.DatosVersionados(cargar_tarifas, versiones.VigilanteArchivo(RUTA_TARIFAS), nombre='visor')
         
-        return gdf_municipios, df_tarifas
+        return gdf_municipios, tabla_tarifas
     except Exception as e:
         st.error(f"Error al cargar los datos: {str(e)}")
         return None, None
 
-gdf_municipios, df_tarifas = cargar_datos()
+gdf_municipios, tabla_tarifas = cargar_datos()
 
-if gdf_municipios is None or df_tarifas is None:
+if gdf_municipios is None or tabla_tarifas is None:
     st.error("No se pudieron cargar los datos necesarios. Por favor, verifica que los archivos existan y sean accesibles.")
     st.stop()
 
-try:
-    if gdf_municipios.crs is None:
-        gdf_municipios.set_crs(epsg=4326, inplace=True)
-    elif gdf_municipios.crs.to_string() != "EPSG:4326":
-        gdf_municipios = gdf_municipios.to_crs("EPSG:4326")
-except Exception as e:
-    st.error(f"Error al configurar el CRS: {str(e)}")
-    st.stop()
+# Municipios y años del dataset particionado, sin leer las demás columnas
+@st.cache_data(max_entries=2, show_spinner=False)
+def opciones_lago(version):
+    return lago.valores(RUTA_LAGO, 'Municipio'), lago.años(RUTA_LAGO)
+
+# Filas de un rango de años: solo esas particiones y columnas (compartidas entre sesiones)
+@st.cache_resource(max_entries=16, show_spinner="Leyendo el período...")
+def leer_periodo(años, version):
+    return normalizar_tarifas(lago.leer_lago(RUTA_LAGO, COLUMNAS_VISOR, *años))
+
+def tarifas_periodo(años):
+    if USAR_LAGO:
+        return leer_periodo(tuple(años), version_datos)
+    return df_tarifas[(df_tarifas['Año'] >= años[0]) & (df_tarifas['Año'] <= años[1])]
+
+# Los mapas y la autocorrelación en caché llevan la versión de los datos en su clave
+if USAR_LAGO:
+    tabla_tarifas.cambios()
+    version_datos = tabla_tarifas.version
+    municipios_con_datos, años_disponibles = opciones_lago(version_datos)
+else:
+    tabla_tarifas.actualizar()
+    df_tarifas = tabla_tarifas.indice.df
+    version_datos = tabla_tarifas.version
+    municipios_con_datos = sorted(df_tarifas['Municipio'].unique().tolist())
+    años_disponibles = tabla_tarifas.indice.años
 
 # Panel lateral para controles
 st.sidebar.markdown("## Configuración del Visor")
@@ -140,15 +167,24 @@ mapa_base = st.sidebar.selectbox(
     index=0  # Satélite por defecto
 )
 
+# Modo del mapa: promedio del período o animación periodo a periodo
+modo_mapa = st.sidebar.radio("Modo del mapa", ["Promedio del período", "Animación"])
+if modo_mapa == "Animación":
+    paso_animacion = st.sidebar.radio("Paso de la animación", ["Anual", "Mensual"], horizontal=True)
+
 # Capas disponibles
 st.sidebar.markdown("### Capas disponibles")
 mostrar_municipios = st.sidebar.checkbox("Mostrar Municipios", value=True)
+mostrar_lisa = st.sidebar.checkbox(
+    "Clústeres espaciales (LISA)",
+    value=False,
+    help="Agrupaciones de municipios con valores altos o bajos del indicador junto a vecinos similares (I de Moran local)"
+)
 
 # Filtros adicionales
 st.sidebar.markdown("### Filtros")
 
-# Obtener lista de municipios con datos disponibles
-municipios_con_datos = sorted(df_tarifas['Municipio'].unique().tolist())
+# Municipios con datos disponibles
 municipio_seleccionado = st.sidebar.selectbox(
     "Municipio",
     ["Todos"] + municipios_con_datos,
@@ -156,8 +192,8 @@ municipio_seleccionado = st.sidebar.selectbox(
 )
 
 # Obtener el rango de años disponible en los datos
-año_min = int(df_tarifas['Año'].min())
-año_max = int(df_tarifas['Año'].max())
+año_min = int(min(años_disponibles))
+año_max = int(max(años_disponibles))
 año_seleccionado = st.sidebar.slider(
     "Rango de años",
     min_value=año_min,
@@ -167,35 +203,27 @@ año_seleccionado = st.sidebar.slider(
 )
 
 # Filtrar datos por el rango de años seleccionado
-df_tarifas_filtrado = df_tarifas[
-    (df_tarifas['Año'] >= año_seleccionado[0]) & 
-    (df_tarifas['Año'] <= año_seleccionado[1])
-]
-
-# Función para obtener el mapa base según la selección
-def get_base_map(selection):
-    if selection == "OpenStreetMap":
-        return "OpenStreetMap"
-    elif selection == "Cartografía":
-        return "CartoDB positron"
-    elif selection == "Satélite":
-        return "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}"
-    elif selection == "Terreno":
-        return "https://stamen-tiles-{s}.a.ssl.fastly.net/terrain/{z}/{x}/{y}.jpg"
-    else:
-        return "OpenStreetMap"
-
-# Función para obtener la atribución según el mapa base
-def get_attribution(selection):
-    if selection == "Satélite":
-        return "Tiles &copy; Esri &mdash; Source: Esri, i-cubed, USDA, USGS, AEX, GeoEye, Getmapping, Aerogrid, IGN, IGP, UPR-EGP, and the GIS User Community"
-    elif selection == "Terreno":
-        return "Map tiles by <a href='http://stamen.com'>Stamen Design</a>, <a href='http://creativecommons.org/licenses/by/3.0'>CC BY 3.0</a> &mdash; Map data &copy; <a href='https://www.openstreetmap.org/copyright'>OpenStreetMap</a> contributors"
-    else:
-        return "© OpenStreetMap contributors"
+df_tarifas_filtrado = tarifas_periodo(año_seleccionado)
+
+# Capa de teselas de cada mapa base: del servidor local si está sembrada
+# (seed_tiles.py / run_tiles.py), del proveedor remoto si no
+CAPAS_MAPA_BASE = {"Satélite": 'satelite', "OpenStreetMap": 'osm', "Cartografía": 'cartografia', "Terreno": 'terreno'}
+
+def capa_mapa_base(selection):
+    return teselas.capa_base(CAPAS_MAPA_BASE.get(selection, 'osm'))
+
+# Las capas sembradas (si el servidor de teselas está configurado y responde) van en
+# la clave de los mapas en caché
+capas_teselas = tuple(teselas.capas_disponibles())
+
+# Con la pirámide MVT de municipios (build_vector_tiles.py) el navegador pide solo
+# la geometría visible y la página lleva únicamente la tabla de valores
+capa_vectorial = geo.CAPA_VECTORIAL in capas_teselas
 
 # Función para crear el mapa
-def crear_mapa(geojson_data, columna_indicador, indicador_seleccionado, mapa_base, vmin, vmax, municipio_seleccionado=None):
+def crear_mapa(geojson_data, columna_indicador, indicador_seleccionado, mapa_base, vmin, vmax, gdf_lisa=None, valores=None):
+    import folium
+
     m = folium.Map(
         location=CENTRO_VALLE_ABURRA,
         zoom_start=10,
@@ -203,10 +231,12 @@ def crear_mapa(geojson_data, columna_indicador, indicador_seleccionado, mapa_bas
     )
     
     # Añadir capa base
+    capa_base = capa_mapa_base(mapa_base)
     folium.TileLayer(
-        tiles=get_base_map(mapa_base),
-        attr=get_attribution(mapa_base),
-        name=mapa_base
+        tiles=capa_base['url'],
+        attr=capa_base['atribucion'],
+        name=mapa_base,
+        max_native_zoom=capa_base['zoom_nativo']
     ).add_to(m)
     
     # Definir la escala de colores
@@ -224,19 +254,9 @@ def crear_mapa(geojson_data, columna_indicador, indicador_seleccionado, mapa_bas
         'weight': 1
     }
     
-    # Función para el estilo de cada polígono
+    # Función para el estilo de cada polígono (el resaltado se aplica sobre el HTML)
     def style_function(feature):
         valor = feature['properties'].get(columna_indicador)
-        nombre = feature['properties'].get('MpNombre')
-        
-        # Si hay un municipio seleccionado, resaltarlo
-        if municipio_seleccionado and nombre == municipio_seleccionado:
-            return {
-                'fillColor': colormap(valor) if not pd.isna(valor) else '#808080',
-                'color': '#FF0000',  # Borde rojo para el municipio seleccionado
-                'fillOpacity': 0.9,
-                'weight': 3
-            }
         
         return {
             'fillColor': '#808080' if pd.isna(valor) else colormap(valor),
@@ -245,17 +265,44 @@ def crear_mapa(geojson_data, columna_indicador, indicador_seleccionado, mapa_bas
             'weight': 1
         }
     
-    # Añadir capa de municipios al mapa
-    folium.GeoJson(
-        geojson_data,
-        name='Municipios',
-        style_function=style_function,
-        tooltip=folium.GeoJsonTooltip(
-            fields=['MpNombre', columna_indicador],
-            aliases=['Municipio:', f'{indicador_seleccionado}:'],
-            style=("background-color: white; color: #333333; font-family: arial; font-size: 12px; padding: 10px;")
+    # Añadir capa de municipios al mapa: teselas vectoriales con los valores
+    # unidos en el navegador, o el GeoJSON completo si no hay pirámide
+    if valores is not None:
+        capa_teselas = teselas.capa_base(geo.CAPA_VECTORIAL)
+        tabla = {clave: [round(float(valor), 4), colormap(valor)] for clave, valor in valores.items()}
+        nombre_capa = geo.agregar_capa_vectorial(
+            m, capa_teselas['url'], tabla, indicador_seleccionado, zoom_nativo=capa_teselas['zoom_nativo'],
+            estilo=base_style, url_js=teselas.url_libreria(geo.ARCHIVO_VECTORGRID)
         )
-    ).add_to(m)
+    else:
+        nombre_capa = folium.GeoJson(
+            geojson_data,
+            name='Municipios',
+            style_function=style_function,
+            tooltip=folium.GeoJsonTooltip(
+                fields=['MpNombre', columna_indicador],
+                aliases=['Municipio:', f'{indicador_seleccionado}:'],
+                style=("background-color: white; color: #333333; font-family: arial; font-size: 12px; padding: 10px;")
+            )
+        ).add_to(m).get_name()
+    
+    # Capa de clústeres LISA (I de Moran local) sobre los municipios
+    if gdf_lisa is not None:
+        folium.GeoJson(
+            gdf_lisa[['MpNombre', 'cluster', 'Ii', 'p_valor', 'geometry']].to_json(),
+            name='Clústeres LISA',
+            style_function=lambda feature: {
+                'fillColor': espacial.COLORES_CUADRANTES.get(feature['properties'].get('cluster'), '#808080'),
+                'color': '#555555',
+                'fillOpacity': 0.8,
+                'weight': 1
+            },
+            tooltip=folium.GeoJsonTooltip(
+                fields=['MpNombre', 'cluster', 'Ii', 'p_valor'],
+                aliases=['Municipio:', 'Clúster:', 'I local:', 'p-valor:'],
+                style=("background-color: white; color: #333333; font-family: arial; font-size: 12px; padding: 10px;")
+            )
+        ).add_to(m)
     
     # Añadir la leyenda de colores
     colormap.add_to(m)
@@ -263,7 +310,59 @@ def crear_mapa(geojson_data, columna_indicador, indicador_seleccionado, mapa_bas
     # Añadir control de capas
     folium.LayerControl().add_to(m)
     
-    return m
+    return m, nombre_capa
+
+# Matriz de pesos espaciales entre municipios (contigüidad), calculada una sola vez
+@st.cache_resource
+def cargar_pesos():
+    return espacial.pesos_municipios(gdf_municipios)
+
+# Moran global y LISA del indicador promediado en el rango de años
+@st.cache_data(max_entries=32, show_spinner="Calculando autocorrelación espacial...")
+def calcular_lisa(indicador_seleccionado, años, version):
+    columna_indicador = INDICADORES[indicador_seleccionado]
+    df_periodo = tarifas_periodo(años)
+    return espacial.lisa_indicador(gdf_municipios, df_periodo, columna_indicador, cargar_pesos())
+
+# HTML del mapa por (indicador, rango de años, mapa base, capa LISA, capas de teselas sembradas); el municipio
+# resaltado se aplica después con geo.resaltar_municipio sin volver a construir el mapa
+@st.cache_data(max_entries=32, show_spinner=False)
+def renderizar_mapa(indicador_seleccionado, años, mapa_base, version, con_lisa=False, capas=()):
+    columna_indicador = INDICADORES[indicador_seleccionado]
+    df_periodo = tarifas_periodo(años)
+    if capa_vectorial:
+        geojson_data = None
+        valores, vmin, vmax = geo.valores_indicador(gdf_municipios, df_periodo, columna_indicador)
+    else:
+        valores = None
+        geojson_data, vmin, vmax = geo.geojson_indicador(gdf_municipios, df_periodo, columna_indicador)
+    gdf_lisa = calcular_lisa(indicador_seleccionado, años, version)[0] if con_lisa else None
+    m, capa = crear_mapa(geojson_data, columna_indicador, indicador_seleccionado, mapa_base, vmin, vmax, gdf_lisa, valores)
+    return m.get_root().render(), capa
+
+# Animación del indicador: todos los cuadros se calculan en una sola agregación y
+# se reproducen en el navegador (geometría una vez y matriz periodos x municipios)
+@st.cache_data(max_entries=16, show_spinner=False)
+def renderizar_animacion(indicador_seleccionado, años, mapa_base, paso, version, municipio=None, capas=()):
+    columna_indicador = INDICADORES[indicador_seleccionado]
+    df_periodo = tarifas_periodo(años)
+    periodos, matriz = geo.matriz_indicador(
+        gdf_municipios, df_periodo, columna_indicador, 'Año' if paso == "Anual" else 'Periodo'
+    )
+    if len(periodos) == 0:
+        return None
+    capa_base = capa_mapa_base(mapa_base)
+    return animacion.html_animacion(
+        gdf_municipios, periodos, matriz,
+        colores=ESCALAS_COLORES[indicador_seleccionado],
+        titulo=f'Valor de {indicador_seleccionado}',
+        centro=CENTRO_VALLE_ABURRA,
+        tiles=capa_base['url'],
+        atribucion=capa_base['atribucion'],
+        zoom_nativo=capa_base['zoom_nativo'],
+        resaltado=municipio,
+        intervalo_ms=800 if paso == "Anual" else 250
+    )
 
 # Disposición principal
 col1, col2 = st.columns([2, 1])
@@ -279,58 +378,53 @@ with col1:
     )
     
     try:
-        # Calcular promedio del indicador por municipio para el rango de años
-        columna_indicador = INDICADORES[indicador_seleccionado]
-        promedios_municipio = df_tarifas_filtrado.groupby('Municipio_norm')[columna_indicador].mean().reset_index()
-        
-        # Unir los datos con el GeoDataFrame
-        gdf_municipios_temp = gdf_municipios.copy()
-        gdf_municipios_temp = gdf_municipios_temp.merge(
-            promedios_municipio,
-            left_on='MpNombre_norm',
-            right_on='Municipio_norm',
-            how='left'
-        )
-        
-        # Calcular vmin y vmax
-        vmin = gdf_municipios_temp[columna_indicador].min()
-        vmax = gdf_municipios_temp[columna_indicador].max()
-        
-        # Convertir GeoDataFrame a GeoJSON
-        geojson_data = gdf_municipios_temp.to_json()
-        
-        # Crear el mapa
-        m = crear_mapa(
-            geojson_data, 
-            columna_indicador, 
-            indicador_seleccionado, 
-            mapa_base, 
-            vmin, 
-            vmax,
-            municipio_seleccionado if municipio_seleccionado != "Todos" else None
-        )
+        municipio_resaltado = municipio_seleccionado if municipio_seleccionado != "Todos" else None
+
+        if modo_mapa == "Animación":
+            html_mapa = renderizar_animacion(
+                indicador_seleccionado, año_seleccionado, mapa_base, paso_animacion, version_datos, municipio_resaltado,
+                capas=capas_teselas
+            )
+            if html_mapa is None:
+                st.warning("No hay datos del indicador para el rango de años seleccionado.")
+                st.stop()
+            altura_mapa = 650
+            nota = f"Use ▶ o el deslizador para recorrer el indicador {indicador_seleccionado} {'año a año' if paso_animacion == 'Anual' else 'mes a mes'} entre {año_seleccionado[0]} y {año_seleccionado[1]}. La escala de colores es común a todos los periodos."
+        else:
+            # Mapa renderizado (promedio del indicador por municipio para el rango de años)
+            # tomado de la caché y con el municipio seleccionado resaltado
+            html_mapa, capa_municipios = renderizar_mapa(
+                indicador_seleccionado, año_seleccionado, mapa_base, version_datos, mostrar_lisa, capas=capas_teselas
+            )
+            html_mapa = geo.resaltar_municipio(html_mapa, capa_municipios, municipio_resaltado, vectorial=capa_vectorial)
+            altura_mapa = 600
+            nota = f"Este mapa muestra la distribución del indicador {indicador_seleccionado} por municipio para el período {año_seleccionado[0]}-{año_seleccionado[1]}."
         
         # Crear un contenedor fijo para el mapa
         map_container = st.container()
-        
+
         with map_container:
             st.markdown("<div class='map-container'>", unsafe_allow_html=True)
-            st_folium(
-                m,
-                width=1000,
-                height=600,
-                key=f"mapa_{indicador_seleccionado}_{st.session_state.last_indicador}"
-            )
+            components.html(html_mapa, height=altura_mapa)
             st.markdown("</div>", unsafe_allow_html=True)
         
-        # Actualizar el último indicador
-        st.session_state.last_indicador = indicador_seleccionado
-        
         st.markdown("<div class='info-box'>", unsafe_allow_html=True)
         st.markdown(f"""
-        **Nota:** Este mapa muestra la distribución del indicador {indicador_seleccionado} por municipio para el período {año_seleccionado[0]}-{año_seleccionado[1]}. Los municipios en gris no tienen datos disponibles.
+        **Nota:** {nota} Los municipios en gris no tienen datos disponibles.
         """)
         st.markdown("</div>", unsafe_allow_html=True)
+
+        # Autocorrelación espacial global del indicador
+        if mostrar_lisa:
+            _, moran = calcular_lisa(indicador_seleccionado, año_seleccionado, version_datos)
+            col_i, col_z, col_p = st.columns(3)
+            col_i.metric("I de Moran global", f"{moran['I']:.3f}", help=f"Valor esperado sin autocorrelación: {moran['esperado']:.3f}")
+            col_z.metric("Puntaje z", f"{moran['z']:.2f}")
+            col_p.metric("p-valor (999 permutaciones)", f"{moran['p_valor']:.3f}")
+            st.caption(
+                "Capa 'Clústeres LISA': Alto-Alto y Bajo-Bajo son municipios con valores altos o bajos "
+                "rodeados de valores similares; Alto-Bajo y Bajo-Alto son atípicos espaciales (p ≤ 0.05)."
+            )
         
     except Exception as e:
         st.error(f"Error al generar el mapa: {str(e)}")
@@ -342,7 +436,7 @@ with col2:
     try:
         # Calcular promedio del indicador por municipio para el rango de años
         columna_indicador = INDICADORES[indicador_seleccionado]
-        df_promedios = df_tarifas_filtrado.groupby('Municipio')[columna_indicador].mean().reset_index()
+        df_promedios = df_tarifas_filtrado.groupby('Municipio', observed=True)[columna_indicador].mean().reset_index()
 
         if municipio_seleccionado != "Todos":
             df_promedios = df_promedios[df_promedios['Municipio'] == municipio_seleccionado]
@@ -1,17 +1,16 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 import plotly.graph_objects as go
+import uuid
 from datetime import datetime
-from prophet import Prophet
-from statsmodels.tsa.arima.model import ARIMA
-from xgboost import XGBRegressor
-import os
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from tarifas import anomalias, cache_compartido, datos, graficos, jerarquia, modelos, planificador, precision, versiones
+from tarifas.precarga import iniciar_precarga
 
 # Configuración de la app
 st.set_page_config(page_title="Predicciones Tarifas", page_icon="🔮", layout="wide")
+
+# Importar Prophet, statsmodels y xgboost en segundo plano mientras se pinta la página
+iniciar_precarga()
 st.title("📈 Predicciones de Tarifas de Servicios Públicos")
 st.markdown("Análisis detallado de predicciones de tarifas utilizando diferentes modelos")
 
@@ -19,48 +18,52 @@ st.markdown("Análisis detallado de predicciones de tarifas utilizando diferente
 
 def crear_engine():
     try:
-        load_dotenv()
-        DB_USER = os.getenv("DB_USER")
-        DB_PASSWORD = os.getenv("DB_PASSWORD")
-        DB_HOST = os.getenv("DB_HOST")
-        DB_PORT = os.getenv("DB_PORT")
-        DB_NAME = os.getenv("DB_NAME")
-
-        return create_engine(f'postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
+        return datos.crear_engine('postgresql+psycopg2')
     except Exception as e:
         st.error("Error al conectar con la base de datos.")
         st.stop()
 
 engine = crear_engine()
 
-@st.cache_data
-def cargar_datos():
+# DataFrame compacto de todos los municipios (o solo de `municipios` al recargar por cambios)
+def cargar_datos(municipios=None):
+    # Convertir la columna fecha a datetime y renombrar columnas; un error de
+    # lectura se propaga para que una recarga fallida no deje la tabla vacía
+    return datos.compactar_tarifas(datos.cargar_tarifas(engine, municipios=municipios))
+
+
+# Tabla compartida por todas las sesiones; al cambiar la versión de los datos
+# solo se recargan los municipios afectados
+@st.cache_resource
+def cargar_tabla():
     try:
-        query = "SELECT * FROM tarifas_acueductos_aguas_residuales_med_ing_caracteristicas"
-        df = pd.read_sql(query, engine)
-        
-        # Convertir la columna fecha a datetime
-        df['Fecha'] = pd.to_datetime(df['fecha'])
-        
-        # Renombrar columnas para mantener compatibilidad
-        df = df.rename(columns={
-            'municipio': 'Municipio',
-            'estrato': 'Estrato',
-            'servicio': 'Servicio',
-            'Cargo Fijo': 'Cargo Fijo',
-            'Cargo por Consumo': 'Cargo por Consumo',
-            'año': 'Año'
-        })
-        
-        return df
+        vigilante = versiones.vigilante(engine)
+    except Exception as e:
+        print("Sin seguimiento de versiones de los datos:", e)
+        vigilante = None
+    try:
+        return versiones.DatosVersionados(cargar_datos, vigilante, nombre=datos.TABLA_TARIFAS)
     except Exception as e:
+        # Sin tabla no se guarda nada en la caché: la próxima ejecución vuelve a intentarlo
         st.error("Error al cargar los datos desde la base de datos.")
         st.exception(e)
-        return pd.DataFrame()
+        st.stop()
+
+# Índice de series sobre la tabla ordenada: cada selección es un bloque contiguo de filas
+def cargar_indice():
+    return cargar_tabla().indice
 
+tabla_datos = cargar_tabla()
+tabla_datos.actualizar()
+indice_series = tabla_datos.indice
+df = indice_series.df
 
 
-df = cargar_datos()
+# Anomalías y cambios estructurales de todas las series, detectados en una sola pasada
+# (se recalculan solo cuando cambia la versión de los datos)
+@st.cache_resource(max_entries=2)
+def cargar_eventos(version):
+    return anomalias.detectar_eventos(cargar_indice().df)
 
 if df.empty:
     st.error("No se pudo cargar la información desde la base de datos. Verifica la conexión o el contenido.")
@@ -81,15 +84,88 @@ def hex_to_rgba(hex_color, alpha=0.2):
 # Cargar datos reales
 #df = pd.read_excel("tarifas_con_indicadores_excel.xlsx")
 
+modo = st.sidebar.radio("Modo de predicción", ["Serie individual", "Jerárquico"], horizontal=True)
+
+
+# Toda la jerarquía se pronostica y reconcilia en una sola pasada; se guarda por configuración
+@st.cache_data(max_entries=16, show_spinner="Reconciliando la jerarquía de series...")
+def pronostico_jerarquico(columna, horizonte, metodo, metodo_base, agregacion, version):
+    return cache_compartido.memorizar(
+        'jerarquia', (columna, horizonte, metodo, metodo_base, agregacion, version),
+        lambda: jerarquia.pronostico_jerarquico(indice_series.df, columna, horizonte, metodo, metodo_base, agregacion)
+    )
+
+
+if modo == "Jerárquico":
+    st.sidebar.subheader("Configuración Jerárquica")
+    columna_jerarquia = st.sidebar.selectbox("Cargo", ['Cargo Fijo', 'Cargo por Consumo'])
+    horizonte_jerarquia = st.sidebar.slider("Horizonte de predicción (meses)", 3, 24, 12)
+    metodo_reconciliacion = st.sidebar.selectbox("Reconciliación", jerarquia.METODOS_RECONCILIACION)
+    metodo_base = st.sidebar.selectbox("Pronóstico base", jerarquia.METODOS_BASE)
+    agregacion = st.sidebar.radio("Agregados como", jerarquia.AGREGACIONES, horizontal=True)
+
+    resultado = pronostico_jerarquico(columna_jerarquia, horizonte_jerarquia, metodo_reconciliacion, metodo_base, agregacion, tabla_datos.version)
+    nodos = resultado['nodos']
+
+    st.markdown("## 🧩 Pronóstico Jerárquico")
+    st.markdown("Región → Municipio → Servicio → Estrato: los pronósticos reconciliados de cada nivel coinciden con el "
+                f"{'promedio' if agregacion == 'promedio' else 'total'} de los niveles inferiores.")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Series por estrato", f"{(nodos['Nivel'] == 'Estrato').sum():,}")
+    with col2:
+        st.metric("Nodos de la jerarquía", f"{len(nodos):,}")
+    with col3:
+        st.metric("Incoherencia base", f"${resultado['incoherencia_base']:,.2f}")
+    with col4:
+        st.metric("Incoherencia reconciliada", f"${resultado['incoherencia_reconciliado']:,.2f}")
+
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        nivel = st.selectbox("Nivel", jerarquia.NIVELES, index=1)
+    with col2:
+        nodo = st.selectbox("Nodo", nodos.loc[nodos['Nivel'] == nivel, 'Nodo'])
+    fila = nodos.index[nodos['Nodo'] == nodo][0]
+
+    historico = resultado['historico'].iloc[fila]
+    base = resultado['base'].iloc[fila]
+    reconciliado = resultado['reconciliado'].iloc[fila]
+    fig = go.Figure()
+    fig.add_trace(graficos.traza_linea(historico.index, historico.to_numpy(), mode='lines', name='Histórico', line=dict(color='gray')))
+    fig.add_trace(go.Scatter(x=base.index, y=base.to_numpy(), mode='lines', name=f'Base ({metodo_base})', line=dict(color='#E53935', dash='dash')))
+    fig.add_trace(go.Scatter(x=reconciliado.index, y=reconciliado.to_numpy(), mode='lines', name=f'Reconciliado ({metodo_reconciliacion})', line=dict(color='#1E88E5')))
+    fig.update_layout(
+        title=f"Predicción Jerárquica - {nodo}",
+        xaxis_title="Fecha",
+        yaxis_title=f"{columna_jerarquia} ($COP)",
+        hovermode="x unified",
+        height=550
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    # Pronóstico al final del horizonte para todos los nodos del nivel
+    del_nivel = nodos['Nivel'] == nivel
+    tabla = nodos.loc[del_nivel, ['Nodo']].assign(
+        Base=resultado['base'].iloc[:, -1][del_nivel],
+        Reconciliado=resultado['reconciliado'].iloc[:, -1][del_nivel],
+    )
+    tabla['Ajuste (%)'] = (tabla['Reconciliado'] / tabla['Base'] - 1) * 100
+    st.markdown(f"**{nivel}: pronóstico a {horizonte_jerarquia} meses ({resultado['reconciliado'].columns[-1]:%Y-%m})**")
+    st.dataframe(tabla.set_index('Nodo').style.format({'Base': '${:,.2f}', 'Reconciliado': '${:,.2f}', 'Ajuste (%)': '{:+.2f}%'}), use_container_width=True)
+
+    st.markdown("---")
+    st.caption("© 2025 Sistema de Predicción de Tarifas de acueducto y alcantarillado | Módulo de Predicciones")
+    st.stop()
+
 
 # Filtros
 col1, col2, col3 = st.columns(3)
 with col1:
-    municipio = st.selectbox("Municipio", sorted(df['Municipio'].unique()))
+    municipio = st.selectbox("Municipio", indice_series.municipios)
 with col2:
-    estrato = st.selectbox("Estrato", sorted(df['Estrato'].unique()))
+    estrato = st.selectbox("Estrato", indice_series.estratos)
 with col3:
-    servicio = st.selectbox("Tipo de Servicio", sorted(df['Servicio'].unique()))
+    servicio = st.selectbox("Tipo de Servicio", indice_series.servicios)
 
 # Configuración
 st.sidebar.subheader("Configuración de Predicción")
@@ -97,77 +173,94 @@ st.sidebar.subheader("Configuración de Predicción")
 horizonte = st.sidebar.slider("Horizonte de predicción (meses)", 3, 24, 12)
 mostrar_intervalos = st.sidebar.checkbox("Mostrar intervalos de confianza", True)
 nivel_confianza = st.sidebar.slider("Nivel de confianza (%)", 80, 99, 95)
-modelos = st.sidebar.multiselect("Modelos", ["Prophet", "ARIMA", "XGBoost"], default=["Prophet", "ARIMA", "XGBoost"])
+modelos_seleccionados = st.sidebar.multiselect("Modelos", modelos.MODELOS_DISPONIBLES, default=modelos.MODELOS_DISPONIBLES)
+usar_eventos = st.sidebar.checkbox("Excluir anomalías y usar cambios estructurales", True)
 
 # Filtrar los datos
-df_filtrado = df[
-    (df['Municipio'] == municipio) &
-    (df['Estrato'] == estrato) &
-    (df['Servicio'] == servicio)
-].sort_values('Fecha')
+df_filtrado = indice_series.serie(municipio, estrato, servicio)
 
 if df_filtrado.empty:
     st.warning("No hay datos disponibles.")
     st.stop()
 
-serie = df_filtrado[['Fecha', 'Cargo Fijo']].rename(columns={'Fecha': 'ds', 'Cargo Fijo': 'y'})
+eventos = anomalias.eventos_serie(cargar_eventos(tabla_datos.version), municipio, estrato, servicio)
+serie = modelos.preparar_serie(df_filtrado)
+cambios = None
+if usar_eventos:
+    serie = anomalias.depurar_serie(serie, eventos)
+    cambios = anomalias.fechas_cambio(eventos)
 fechas_historicas = serie['ds']
 valores_historicos = serie['y'].values
 
-frecuencia = pd.infer_freq(fechas_historicas) or 'M'
-fechas_futuras = pd.date_range(start=fechas_historicas.iloc[-1] + pd.tseries.frequencies.to_offset(frecuencia), periods=horizonte, freq=frecuencia)
+frecuencia = modelos.inferir_frecuencia(fechas_historicas)
+fechas_futuras = modelos.fechas_futuras(fechas_historicas, horizonte, frecuencia)
+
+# Identificador de la sesión para el límite de ajustes simultáneos por sesión
+if 'id_sesion' not in st.session_state:
+    st.session_state.id_sesion = uuid.uuid4().hex
+
+
+def ajustar_modelo(clave, serie, modelo, horizonte, nivel_confianza, frecuencia, cambios):
+    def ajustar():
+        resultado = modelos.pronosticar(serie, modelo, horizonte, nivel_confianza, frecuencia, cambios)
+        # Instantánea para comparar con los valores reales cuando lleguen
+        municipio, estrato, servicio = clave[1:4]
+        precision.registrar_pronostico(
+            municipio, estrato, servicio, modelo, serie, modelos.fechas_futuras(serie['ds'], horizonte, frecuencia),
+            *resultado, nivel_confianza, fuente='predicciones', variante='eventos' if clave[7] else ''
+        )
+        return resultado
+    return cache_compartido.memorizar('pronosticos', clave, ajustar)
+
+
+# Ajuste de un modelo para la serie en el planificador (en curso o terminado); la
+# clave lleva la versión del municipio, así un cambio en otro municipio no obliga a
+# reentrenar, y dos sesiones que piden la misma serie esperan el mismo ajuste
+@st.cache_resource(max_entries=256, show_spinner=False)
+def pronostico_modelo(municipio, estrato, servicio, modelo, horizonte, nivel_confianza, usar_eventos, version,
+                      _serie=None, _frecuencia=None, _cambios=None, _sesion=None):
+    clave = ('predicciones', municipio, estrato, servicio, modelo, horizonte, nivel_confianza, usar_eventos, version)
+    return planificador.planificador().enviar(
+        ajustar_modelo, clave, _serie, modelo, horizonte, nivel_confianza, _frecuencia, _cambios,
+        prioridad=planificador.COMPARACION, sesion=_sesion
+    )
+
 
 predicciones, intervalos_inf, intervalos_sup = {}, {}, {}
 
-# Prophet
-if "Prophet" in modelos:
-    modelo = Prophet(interval_width=nivel_confianza / 100)
-    modelo.fit(serie)
-    future = modelo.make_future_dataframe(periods=horizonte, freq=frecuencia)
-    forecast = modelo.predict(future).tail(horizonte)
-    predicciones["Prophet"] = forecast['yhat'].values
-    intervalos_inf["Prophet"] = forecast['yhat_lower'].values
-    intervalos_sup["Prophet"] = forecast['yhat_upper'].values
-
-# ARIMA
-if "ARIMA" in modelos:
-    modelo_arima = ARIMA(serie['y'], order=(1, 1, 1)).fit()
-    forecast = modelo_arima.get_forecast(steps=horizonte)
-    predicciones["ARIMA"] = forecast.predicted_mean.values
-    conf = forecast.conf_int(alpha=1 - nivel_confianza / 100)
-    intervalos_inf["ARIMA"] = conf.iloc[:, 0].values
-    intervalos_sup["ARIMA"] = conf.iloc[:, 1].values
-
-# XGBoost
-if "XGBoost" in modelos:
-    df_xgb = serie.copy()
-    df_xgb['mes'] = df_xgb['ds'].dt.month
-    df_xgb['año'] = df_xgb['ds'].dt.year
-    X = df_xgb[['mes', 'año']]
-    y = df_xgb['y']
-    modelo_xgb = XGBRegressor(n_estimators=100)
-    modelo_xgb.fit(X, y)
-    futuras = pd.DataFrame({'ds': fechas_futuras})
-    futuras['mes'] = futuras['ds'].dt.month
-    futuras['año'] = futuras['ds'].dt.year
-    pred = modelo_xgb.predict(futuras[['mes', 'año']])
-    predicciones["XGBoost"] = pred
-    std = np.std(y - modelo_xgb.predict(X))
-    intervalos_inf["XGBoost"] = pred - 1.96 * std
-    intervalos_sup["XGBoost"] = pred + 1.96 * std
+# Prophet, ARIMA y XGBoost: se encolan todos y se ajustan en paralelo
+argumentos = {
+    modelo: (municipio, estrato, servicio, modelo, horizonte, nivel_confianza, usar_eventos,
+             tabla_datos.version_municipio(municipio), serie, frecuencia, cambios, st.session_state.id_sesion)
+    for modelo in modelos_seleccionados
+}
+try:
+    ajustes = {modelo: pronostico_modelo(*args) for modelo, args in argumentos.items()}
+except planificador.ColaLlena:
+    st.warning("⏳ El servidor está ocupado ajustando modelos. Intenta de nuevo en unos segundos.")
+    st.stop()
+for modelo, ajuste in ajustes.items():
+    try:
+        predicciones[modelo], intervalos_inf[modelo], intervalos_sup[modelo] = ajuste.result()
+    except Exception:
+        # Un ajuste fallido no queda en la caché
+        pronostico_modelo.clear(*argumentos[modelo])
+        raise
 
 # Colores
 colores = {"Prophet": "#1E88E5", "ARIMA": "#E53935", "XGBoost": "#43A047"}
 
 # Gráfico
 fig = go.Figure()
-fig.add_trace(go.Scatter(x=fechas_historicas, y=valores_historicos, mode='lines+markers', name='Histórico', line=dict(color='gray')))
+# Histórico reducido con LTTB y en WebGL cuando la serie es larga
+fig.add_trace(graficos.traza_linea(fechas_historicas, valores_historicos, mode='lines+markers', name='Histórico', line=dict(color='gray')))
 
-for modelo in modelos:
+for modelo in modelos_seleccionados:
     fig.add_trace(go.Scatter(x=fechas_futuras, y=predicciones[modelo], mode='lines', name=f'Predicción {modelo}', line=dict(color=colores[modelo])))
     if mostrar_intervalos:
         fig.add_trace(go.Scatter(x=fechas_futuras, y=intervalos_sup[modelo], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
         fig.add_trace(go.Scatter(x=fechas_futuras, y=intervalos_inf[modelo], mode='lines', line=dict(width=0), fill='tonexty', fillcolor=hex_to_rgba(colores[modelo]), showlegend=False, hoverinfo='skip'))
+graficos.marcar_eventos(fig, eventos)
 
 fig.update_layout(
     title=f"Predicción Tarifaria - {municipio}, {estrato}, {servicio}",
@@ -184,83 +277,138 @@ with st.expander("¿Cómo interpretar este gráfico?"):
     - **Línea gris**: Datos históricos reales de tarifas
     - **Líneas coloreadas**: Predicciones según diferentes modelos
     - **Áreas sombreadas**: Intervalos de confianza % para cada modelo
+    - **Cruces**: valores anómalos (posibles errores de datos), excluidos del entrenamiento si la opción está activa
+    - **Líneas verticales moradas**: cambios estructurales detectados; Prophet y ARIMA los usan como regresores escalón de nivel y XGBoost como régimen
     
     La incertidumbre de las predicciones aumenta con el horizonte de tiempo, lo que se refleja en el ensanchamiento de los intervalos de confianza.
     """)
 
+if not eventos.empty:
+    with st.expander(f"Anomalías y cambios estructurales detectados ({len(eventos)})"):
+        st.dataframe(
+            eventos[['Fecha', 'Tipo', 'Valor', 'Referencia', 'Puntaje']].style.format(
+                {'Fecha': '{:%Y-%m}', 'Valor': '{:,.0f}', 'Referencia': '{:,.0f}', 'Puntaje': '{:+.1f}'}
+            ),
+            hide_index=True, use_container_width=True
+        )
+        st.caption("Puntaje: z robusto para las anomalías y cambio porcentual entre niveles para los cambios estructurales")
+
 
 # --------------------------
 # Evaluación de los Modelos
 # --------------------------
 
-import numpy as np
-
-# Simular métricas para los modelos seleccionados
-metricas = {}
-for modelo in modelos:
-    if modelo == "XGBoost":
-        mape = np.random.uniform(3.0, 5.0)
-        rmse = np.random.uniform(2000, 3000)
-    elif modelo == "Prophet":
-        mape = np.random.uniform(3.5, 5.5)
-        rmse = np.random.uniform(2200, 3200)
-    elif modelo == "ARIMA":
-        mape = np.random.uniform(4.5, 6.5)
-        rmse = np.random.uniform(2800, 3800)
-    else:
-        continue
-    metricas[modelo] = {"MAPE": mape, "RMSE": rmse}
-
-# Ordenar por MAPE
-modelos_ordenados = sorted(metricas, key=lambda x: metricas[x]["MAPE"])
-mejor_modelo = modelos_ordenados[0]
+# Errores de los pronósticos guardados contra los meses reales que no se habían
+# cruzado todavía (una vez por versión de los datos)
+@st.cache_resource(max_entries=1, show_spinner="Evaluando pronósticos anteriores...")
+def actualizar_precision(version):
+    return precision.almacen().actualizar(cargar_indice().df)
+
+# MAPE, RMSE y cobertura por modelo (y por horizonte) desde los agregados guardados
+@st.cache_data(max_entries=64, show_spinner=False)
+def resumen_precision(municipio, estrato, servicio, generacion, por_horizonte=False):
+    return precision.almacen().resumen(municipio, estrato, servicio, por_horizonte=por_horizonte)
+
+try:
+    generacion = actualizar_precision(tabla_datos.version)
+except Exception as e:
+    print("No se pudo actualizar la precisión de los pronósticos:", e)
+    generacion = None
 
 st.markdown("## 📊 Evaluación de Modelos")
 
-col1, col2 = st.columns(2)
-with col1:
-    fig_mape = go.Figure()
-    fig_mape.add_trace(go.Bar(
-        x=[metricas[m]["MAPE"] for m in modelos_ordenados],
-        y=modelos_ordenados,
-        orientation='h',
-        marker_color=[colores[m] for m in modelos_ordenados]
-    ))
-    fig_mape.update_layout(
-        title="MAPE (%)",
-        xaxis_title="Error porcentual",
-        yaxis_title="Modelo",
-        height=400
+# Precisión histórica de la serie; si aún no tiene pronósticos evaluados, la de todas las series
+alcance, filtro_precision = f"{municipio}, {estrato}, {servicio}", (municipio, estrato, servicio)
+resumen = pd.DataFrame(columns=['Modelo'])
+if generacion is not None:
+    resumen = resumen_precision(*filtro_precision, generacion)
+    if resumen.empty:
+        alcance, filtro_precision = "todas las series", (None, None, None)
+        resumen = resumen_precision(*filtro_precision, generacion)
+resumen = resumen[resumen['Modelo'].isin(modelos_seleccionados)]
+metricas = resumen.set_index('Modelo').to_dict('index')
+
+if not metricas:
+    mejor_modelo = None
+    st.info(
+        "Todavía no hay pronósticos evaluados de estos modelos. Cada pronóstico que se calcula queda guardado "
+        "y se compara con los valores reales a medida que llegan los meses nuevos."
     )
-    st.plotly_chart(fig_mape, use_container_width=True)
-
-with col2:
-    fig_rmse = go.Figure()
-    fig_rmse.add_trace(go.Bar(
-        x=[metricas[m]["RMSE"] for m in modelos_ordenados],
-        y=modelos_ordenados,
-        orientation='h',
-        marker_color=[colores[m] for m in modelos_ordenados]
-    ))
-    fig_rmse.update_layout(
-        title="RMSE ($COP)",
-        xaxis_title="Error cuadrático medio",
-        yaxis_title="Modelo",
+else:
+    # Ordenar por MAPE
+    modelos_ordenados = sorted(metricas, key=lambda x: metricas[x]["MAPE"])
+    mejor_modelo = modelos_ordenados[0]
+    st.caption(f"Errores de los pronósticos anteriores contra los valores reales ({alcance}).")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        fig_mape = go.Figure()
+        fig_mape.add_trace(go.Bar(
+            x=[metricas[m]["MAPE"] for m in modelos_ordenados],
+            y=modelos_ordenados,
+            orientation='h',
+            marker_color=[colores[m] for m in modelos_ordenados],
+            customdata=[metricas[m]["N"] for m in modelos_ordenados],
+            hovertemplate="%{x:.2f}% (%{customdata} meses evaluados)<extra></extra>"
+        ))
+        fig_mape.update_layout(
+            title="MAPE (%)",
+            xaxis_title="Error porcentual",
+            yaxis_title="Modelo",
+            height=400
+        )
+        st.plotly_chart(fig_mape, use_container_width=True)
+
+    with col2:
+        fig_rmse = go.Figure()
+        fig_rmse.add_trace(go.Bar(
+            x=[metricas[m]["RMSE"] for m in modelos_ordenados],
+            y=modelos_ordenados,
+            orientation='h',
+            marker_color=[colores[m] for m in modelos_ordenados]
+        ))
+        fig_rmse.update_layout(
+            title="RMSE ($COP)",
+            xaxis_title="Error cuadrático medio",
+            yaxis_title="Modelo",
+            height=400
+        )
+        st.plotly_chart(fig_rmse, use_container_width=True)
+
+    # Error según la distancia del mes pronosticado al último dato
+    por_horizonte = resumen_precision(*filtro_precision, generacion, por_horizonte=True)
+    fig_horizonte = go.Figure()
+    for modelo in modelos_ordenados:
+        filas = por_horizonte[por_horizonte['Modelo'] == modelo]
+        fig_horizonte.add_trace(go.Scatter(
+            x=filas['Horizonte'], y=filas['MAPE'], mode='lines+markers', name=modelo, line=dict(color=colores[modelo]),
+            customdata=filas['N'], hovertemplate="%{y:.2f}% (%{customdata} meses)"
+        ))
+    fig_horizonte.update_layout(
+        title="MAPE por horizonte",
+        xaxis_title="Meses después del último dato",
+        yaxis_title="MAPE (%)",
+        hovermode="x unified",
         height=400
     )
-    st.plotly_chart(fig_rmse, use_container_width=True)
+    st.plotly_chart(fig_horizonte, use_container_width=True)
 
 # Métricas clave del mejor modelo
-st.markdown(f"<h3>🔍 Modelo recomendado: {mejor_modelo}</h3>", unsafe_allow_html=True)
-col1, col2, col3 = st.columns(3)
-with col1:
-    st.metric("MAPE", f"{metricas[mejor_modelo]['MAPE']:.2f}%")
-with col2:
-    st.metric("RMSE", f"${int(metricas[mejor_modelo]['RMSE']):,}")
-with col3:
-    if mejor_modelo in predicciones and len(predicciones[mejor_modelo]) >= 3:
-        pred_3m = int(predicciones[mejor_modelo][2])
-        st.metric("Predicción 3 meses", f"${pred_3m:,}")
+if mejor_modelo is not None:
+    st.markdown(f"<h3>🔍 Modelo recomendado: {mejor_modelo}</h3>", unsafe_allow_html=True)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("MAPE", f"{metricas[mejor_modelo]['MAPE']:.2f}%")
+    with col2:
+        st.metric("RMSE", f"${int(metricas[mejor_modelo]['RMSE']):,}")
+    with col3:
+        if mejor_modelo in predicciones and len(predicciones[mejor_modelo]) >= 3:
+            pred_3m = int(predicciones[mejor_modelo][2])
+            st.metric("Predicción 3 meses", f"${pred_3m:,}")
+    st.caption(
+        f"{metricas[mejor_modelo]['N']} meses evaluados · el valor real quedó dentro del intervalo "
+        f"en el {metricas[mejor_modelo]['Cobertura']:.0f}% de los casos"
+    )
 
 # Descripción de cada modelo
 modelos_info = {
@@ -292,7 +440,7 @@ modelos_info = {
 }
 
 
-for modelo in modelos:
+for modelo in modelos_seleccionados:
     if modelo in modelos_info:
         info = modelos_info[modelo]
         
@@ -314,5 +462,15 @@ for modelo in modelos:
         st.markdown("</div>", unsafe_allow_html=True)
 
 
+# Métricas del planificador de ajustes de este proceso
+with st.expander("⚙️ Cola de ajustes de modelos"):
+    estado_ajustes = planificador.planificador().estado()
+    st.markdown(
+        f"{estado_ajustes['trabajadores']} ajustes simultáneos con {estado_ajustes['hilos_por_ajuste']} hilo(s) "
+        f"BLAS/OpenMP cada uno · {estado_ajustes['en_ejecucion']} en ejecución · {estado_ajustes['en_cola']} en cola · "
+        f"{estado_ajustes['sesiones_activas']} sesiones con ajustes activos"
+    )
+    st.dataframe(planificador.planificador().metricas().style.format(precision=3), hide_index=True, use_container_width=True)
+
 st.markdown("---")
 st.caption("© 2025 Sistema de Predicción de Tarifas de acueducto y alcantarillado | Módulo de Predicciones") 
\ No newline at end of file
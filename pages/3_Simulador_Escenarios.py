@@ -0,0 +1,215 @@
+import streamlit as st
+import plotly.express as px
+import plotly.graph_objects as go
+import json
+from tarifas import cache_compartido, datos, escenarios, graficos, indicadores, versiones
+
+# Configuración de la app
+st.set_page_config(page_title="Simulador de Escenarios", page_icon="🧪", layout="wide")
+
+st.title("🧪 Simulador de Escenarios Tarifarios")
+st.markdown("¿Qué pasa con los indicadores si cambian las tarifas? Defina reglas de ajuste y compare escenarios lado a lado")
+
+
+def crear_engine():
+    try:
+        return datos.crear_engine('postgresql+psycopg2')
+    except Exception as e:
+        st.error("Error al conectar con la base de datos.")
+        st.stop()
+
+engine = crear_engine()
+
+# DataFrame compacto de todos los municipios (o solo de `municipios` al recargar por cambios)
+def cargar_datos(municipios=None):
+    # Convertir la columna fecha a datetime y renombrar columnas; un error de
+    # lectura se propaga para que una recarga fallida no deje la tabla vacía
+    return datos.compactar_tarifas(datos.cargar_tarifas(engine, municipios=municipios))
+
+
+# Tabla compartida por todas las sesiones; al cambiar la versión de los datos
+# solo se recargan los municipios afectados
+@st.cache_resource
+def cargar_tabla():
+    try:
+        vigilante = versiones.vigilante(engine)
+    except Exception as e:
+        print("Sin seguimiento de versiones de los datos:", e)
+        vigilante = None
+    try:
+        return versiones.DatosVersionados(cargar_datos, vigilante, nombre=datos.TABLA_TARIFAS)
+    except Exception as e:
+        # Sin tabla no se guarda nada en la caché: la próxima ejecución vuelve a intentarlo
+        st.error("Error al cargar los datos desde la base de datos.")
+        st.exception(e)
+        st.stop()
+
+def cargar_indice():
+    return cargar_tabla().indice
+
+tabla_datos = cargar_tabla()
+tabla_datos.actualizar()
+indice_series = tabla_datos.indice
+
+if indice_series.df.empty:
+    st.error("No se pudo cargar la información desde la base de datos. Verifica la conexión o el contenido.")
+    st.stop()
+
+
+# Tabla histórica + proyección de todas las series, compartida por todos los escenarios
+# (las versiones anteriores de los datos salen de la caché)
+@st.cache_resource(max_entries=8, show_spinner="Proyectando todas las series...")
+def cargar_proyeccion(horizonte, version):
+    return cache_compartido.memorizar(
+        'proyecciones', (horizonte, version), lambda: escenarios.proyectar_tarifas(cargar_indice().df, horizonte)
+    )
+
+
+# Resultados por definición del escenario (mismas reglas = misma clave, sin importar el nombre)
+@st.cache_data(max_entries=32, show_spinner="Evaluando escenario...")
+def evaluar(clave, horizonte, version):
+    tabla = escenarios.evaluar_escenario(cargar_proyeccion(horizonte, version), json.loads(clave))
+    mensual = tabla.groupby(['Municipio', 'Fecha'], observed=True)[['Cargo Fijo', 'Cargo por Consumo']].mean()
+    return escenarios.resumen_anual(tabla), mensual
+
+
+# Escenarios de la sesión: nombre -> lista de reglas
+if 'escenarios' not in st.session_state:
+    st.session_state.escenarios = {
+        "Alza Cargo Fijo estratos 4-6 (2026)": [
+            escenarios.regla('Cargo Fijo', 'Porcentaje', 10, estratos=['4', '5', '6'], desde=2026, hasta=2026)
+        ],
+    }
+if 'reglas_borrador' not in st.session_state:
+    st.session_state.reglas_borrador = []
+if 'nombre_escenario' not in st.session_state:
+    st.session_state.nombre_escenario = f"Escenario {len(st.session_state.escenarios) + 1}"
+
+
+def guardar_escenario():
+    st.session_state.escenarios[st.session_state.nombre_escenario] = list(st.session_state.reglas_borrador)
+    st.session_state.reglas_borrador = []
+    st.session_state.nombre_escenario = f"Escenario {len(st.session_state.escenarios) + 1}"
+
+
+def descartar_reglas():
+    st.session_state.reglas_borrador = []
+
+# Configuración
+st.sidebar.subheader("Configuración de Simulación")
+horizonte = st.sidebar.slider("Horizonte de proyección (meses)", 12, 36, 24, step=12)
+proyeccion = cargar_proyeccion(horizonte, tabla_datos.version)
+años_disponibles = sorted(proyeccion['Año'].unique().tolist())
+
+# --------------------------
+# Definición de escenarios
+# --------------------------
+with st.expander("➕ Definir escenario", expanded=False):
+    with st.form("nueva_regla", clear_on_submit=False):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            cargo = st.selectbox("Cargo", list(escenarios.GRUPOS_CARGO))
+            tipo = st.selectbox("Tipo de ajuste", escenarios.TIPOS_AJUSTE)
+            valor = st.number_input("Valor (% o $COP)", value=10.0, step=1.0)
+        with col2:
+            municipios_regla = st.multiselect("Municipios (vacío = todos)", indice_series.municipios)
+            estratos_regla = st.multiselect("Estratos (vacío = todos)", indice_series.estratos)
+            servicios_regla = st.multiselect("Servicios (vacío = todos)", indice_series.servicios)
+        with col3:
+            desde = st.selectbox("Desde el año", años_disponibles, index=len(años_disponibles) - 1)
+            hasta = st.selectbox("Hasta el año", ["Permanente"] + años_disponibles)
+        if st.form_submit_button("Agregar regla"):
+            st.session_state.reglas_borrador.append(escenarios.regla(
+                cargo, tipo, valor, municipios_regla, estratos_regla, servicios_regla,
+                desde, None if hasta == "Permanente" else hasta
+            ))
+
+    for r in st.session_state.reglas_borrador:
+        st.markdown(f"- {escenarios.describir_regla(r)}")
+
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        st.text_input("Nombre del escenario", key='nombre_escenario')
+    with col2:
+        st.button("Guardar escenario", on_click=guardar_escenario, disabled=not st.session_state.reglas_borrador)
+    with col3:
+        st.button("Descartar reglas", on_click=descartar_reglas)
+
+for nombre_escenario, reglas in st.session_state.escenarios.items():
+    st.markdown(f"**{nombre_escenario}:** " + "; ".join(escenarios.describir_regla(r) for r in reglas))
+
+seleccionados = st.sidebar.multiselect(
+    "Escenarios a comparar", list(st.session_state.escenarios), default=list(st.session_state.escenarios)
+)
+año = st.sidebar.selectbox("Año de evaluación", años_disponibles, index=len(años_disponibles) - 1)
+tipo_indicador = st.sidebar.selectbox("Tipo de indicador", list(indicadores.INDICADORES_CLAVE))
+columnas = ['Cargo Fijo', 'Cargo por Consumo'] + indicadores.INDICADORES_CLAVE[tipo_indicador]
+
+# --------------------------
+# Evaluación
+# --------------------------
+definiciones = {escenarios.ESCENARIO_BASE: []}
+definiciones.update({n: st.session_state.escenarios[n] for n in seleccionados})
+resultados = {n: evaluar(escenarios.clave_escenario(r), horizonte, tabla_datos.version) for n, r in definiciones.items()}
+
+resumenes = {n: anual.xs(año, level='Año')[columnas] for n, (anual, _) in resultados.items()}
+comparacion = escenarios.comparar_escenarios(resumenes)
+
+st.markdown(f"## 📊 Impacto en {año}")
+
+# Cambio promedio de cada indicador (promedio de los municipios) por escenario
+impacto = (
+    comparacion[comparacion['Escenario'] != escenarios.ESCENARIO_BASE]
+    .groupby(['Indicador', 'Escenario'], sort=False)['Cambio %'].mean()
+    .unstack('Escenario')
+    .reindex(columnas)
+)
+if impacto.empty:
+    st.info("Seleccione al menos un escenario para compararlo con el escenario base.")
+else:
+    st.dataframe(impacto.style.format('{:+.2f}%', na_rep='–'), use_container_width=True)
+
+indicador = st.selectbox("Indicador", columnas, index=2)
+por_municipio = comparacion[comparacion['Indicador'] == indicador]
+fig = px.bar(
+    por_municipio, x='Municipio', y='Valor', color='Escenario', barmode='group',
+    title=f"{indicador} por municipio y escenario ({año})",
+    hover_data={'Cambio %': ':.2f'}
+)
+fig.update_layout(height=500, xaxis_title="Municipio", yaxis_title=indicador)
+st.plotly_chart(fig, use_container_width=True)
+
+tabla = por_municipio.pivot(index='Municipio', columns='Escenario', values='Valor')[list(definiciones)]
+st.dataframe(tabla.style.format('{:,.4f}'), use_container_width=True)
+
+# --------------------------
+# Trayectoria de tarifas
+# --------------------------
+st.markdown("## 📈 Trayectoria del Cargo Fijo")
+municipio = st.selectbox("Municipio", indice_series.municipios)
+inicio_proyeccion = proyeccion.loc[proyeccion['Proyectado'], 'Fecha'].min()
+
+fig = go.Figure()
+for n, (_, mensual) in resultados.items():
+    serie = mensual.xs(municipio, level='Municipio')['Cargo Fijo']
+    fig.add_trace(graficos.traza_linea(serie.index, serie.to_numpy(), mode='lines', name=n))
+fig.add_vline(x=inicio_proyeccion, line_dash='dot', line_color='gray')
+fig.update_layout(
+    title=f"Cargo Fijo promedio - {municipio} (proyección desde {inicio_proyeccion:%Y-%m})",
+    xaxis_title="Fecha",
+    yaxis_title="Cargo Fijo ($COP)",
+    hovermode="x unified",
+    height=500
+)
+st.plotly_chart(fig, use_container_width=True)
+
+with st.expander("¿Cómo funciona el simulador?"):
+    st.markdown("""
+    - Cada serie (municipio, sector, estrato y servicio) se proyecta con suavizado exponencial de Holt hasta el horizonte elegido
+    - Las reglas de cada escenario ajustan los cargos de las filas que cumplen sus filtros de municipio, estrato, servicio y años
+    - Todos los indicadores se recalculan sobre la tabla ajustada, por lo que un cambio en unos estratos se refleja también en indicadores relativos como el diferencial entre estratos o el ratio municipal
+    - El escenario **Base** es la proyección sin ajustes
+    """)
+
+st.markdown("---")
+st.caption("© 2025 Sistema de Predicción de Tarifas de acueducto y alcantarillado | Simulador de Escenarios")
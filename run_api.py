@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script para ejecutar la API HTTP de tarifas (series, indicadores y pronósticos)
+
+Ejemplos:
+    python run_api.py
+    python run_api.py --origen data/sinteticos/tarifas.parquet --port 8000
+"""
+
+import argparse
+import os
+import sys
+
+import uvicorn
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="API HTTP de tarifas")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=1, help="Procesos de uvicorn (cada uno carga la tabla)")
+    parser.add_argument('--origen', help="Archivo o URL de la tabla (por defecto TARIFAS_ORIGEN o la base de .env)")
+    return parser.parse_args(argv)
+
+
+def run_api(args):
+    """Ejecutar la API con uvicorn"""
+    try:
+        # Obtener la ruta del directorio actual
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        if args.origen:
+            os.environ['TARIFAS_ORIGEN'] = args.origen
+
+        uvicorn.run("tarifas.api:app", host=args.host, port=args.port, workers=args.workers)
+
+    except Exception as e:
+        print(f"Error al ejecutar la API: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_api(parse_args())
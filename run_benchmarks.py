@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script para ejecutar los benchmarks de carga, agregaciones, predicciones,
+GeoJSON y migración sobre datos sintéticos, y compararlos con un baseline
+
+Ejemplos:
+    python run_benchmarks.py --escalas 1 10 100
+    python run_benchmarks.py --baseline benchmarks/baseline.json --guardar-baseline
+    python run_benchmarks.py --grupos carga agregaciones --postgres postgresql://...
+"""
+
+import argparse
+import ast
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from tarifas import anomalias, calidad, datos, escenarios, espacial, geo, indicadores, jerarquia, lago, modelos, sinteticos, tabla_compartida, ubicacion, versiones
+from tarifas.cache_compartido import CacheDisco
+from tarifas.indice import IndiceSeries
+
+GRUPOS = ['arranque', 'carga', 'agregaciones', 'pronosticos', 'geojson', 'migracion']
+TABLA_BENCHMARK = 'benchmark_tarifas'
+
+PAGINAS = {
+    'home': 'home.py',
+    'visor': 'pages/1_Visor_Geografico.py',
+    'predicciones': 'pages/2_Predicciones.py',
+}
+
+# Pilas que las páginas cargan de forma diferida, como referencia
+PILAS_DIFERIDAS = {
+    'pila_modelos': 'import prophet\nimport statsmodels.tsa.arima.model\nimport xgboost',
+    'pila_sig': 'import geopandas\nimport folium',
+}
+
+# Diferencia mínima en segundos para considerar una regresión (evita ruido en
+# mediciones de pocos milisegundos)
+UMBRAL_ABSOLUTO = 0.005
+PUNTOS_UBICACION = 100_000
+
+
+def medir(funcion, repeticiones):
+    """Ejecutar la función varias veces y devolver los tiempos en segundos"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def registrar(resultados, nombre, escala, tiempos, elementos=None):
+    """Agregar el resultado de un benchmark e imprimirlo"""
+    mediana = statistics.median(tiempos)
+    resultado = {
+        'nombre': nombre,
+        'escala': escala,
+        'repeticiones': len(tiempos),
+        'mediana_s': mediana,
+        'min_s': min(tiempos),
+        'max_s': max(tiempos),
+    }
+    if elementos:
+        resultado['elementos'] = elementos
+        resultado['elementos_por_s'] = elementos / mediana if mediana > 0 else None
+    resultados.append(resultado)
+    print(f"  {nombre:<45} x{escala:<4} mediana {mediana * 1000:10.2f} ms")
+
+
+def conectar_postgres(url):
+    """Conexión de psycopg2 a partir de una URL de SQLAlchemy"""
+    import psycopg2
+    from sqlalchemy.engine import make_url
+
+    return psycopg2.connect(make_url(url).set(drivername='postgresql').render_as_string(hide_password=False))
+
+
+def importaciones_pagina(ruta):
+    """Sentencias import de nivel superior de una página"""
+    with open(ruta, encoding='utf-8') as f:
+        arbol = ast.parse(f.read())
+    return '\n'.join(ast.unparse(nodo) for nodo in arbol.body if isinstance(nodo, (ast.Import, ast.ImportFrom)))
+
+
+def tiempo_importacion(codigo):
+    """Segundos que tarda un intérprete nuevo en ejecutar los imports"""
+    script = f"import time\ninicio = time.perf_counter()\n{codigo}\nprint(time.perf_counter() - inicio)"
+    salida = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    return float(salida.stdout.strip().splitlines()[-1])
+
+
+def bench_arranque(repeticiones, resultados):
+    """Tiempo de importación en frío de cada página y de las pilas diferidas"""
+    casos = {nombre: importaciones_pagina(ruta) for nombre, ruta in PAGINAS.items()}
+    casos.update(PILAS_DIFERIDAS)
+    for nombre, codigo in casos.items():
+        tiempos = [tiempo_importacion(codigo) for _ in range(repeticiones)]
+        registrar(resultados, f'arranque/{nombre}', 1, tiempos)
+
+
+def bench_carga(df, escala, repeticiones, resultados, directorio, postgres=None):
+    """Tiempo de carga de la tabla por origen de datos"""
+    ruta_parquet = os.path.join(directorio, 'tarifas.parquet')
+    ruta_csv = os.path.join(directorio, 'tarifas.csv')
+    ruta_sqlite = os.path.join(directorio, 'tarifas.sqlite')
+
+    sinteticos.escribir_parquet(df, ruta_parquet)
+    df.to_csv(ruta_csv, index=False)
+    sinteticos.escribir_sqlite(df, ruta_sqlite, TABLA_BENCHMARK)
+
+    origenes = {
+        'parquet': ruta_parquet,
+        'csv': ruta_csv,
+        'sqlite': f'sqlite:///{ruta_sqlite}',
+    }
+    if postgres:
+        conn = conectar_postgres(postgres)
+        try:
+            sinteticos.escribir_postgres(df, conn, TABLA_BENCHMARK)
+        finally:
+            conn.close()
+        origenes['postgres'] = postgres
+
+    for nombre, origen in origenes.items():
+        tiempos = medir(lambda: datos.cargar_tarifas(origen, TABLA_BENCHMARK), repeticiones)
+        registrar(resultados, f'carga/{nombre}', escala, tiempos, len(df))
+
+    # Revisión de calidad de la tabla cruda, como al cargar el dashboard
+    registrar(resultados, 'carga/calidad', escala, medir(lambda: calidad.revisar_tabla(df), repeticiones), len(df))
+
+    # Recarga de un solo municipio después de registrar su cambio, como en las páginas y la API
+    origen = origenes['sqlite']
+    tabla = versiones.DatosVersionados(
+        lambda municipios: datos.compactar_tarifas(datos.cargar_tarifas(origen, TABLA_BENCHMARK, municipios)),
+        versiones.VigilanteVersiones(origen, TABLA_BENCHMARK, intervalo=0)
+    )
+    municipio = tabla.indice.municipios[0]
+
+    def actualizar_municipio():
+        versiones.registrar_cambio(origen, [municipio], TABLA_BENCHMARK)
+        tabla.actualizar()
+
+    registrar(resultados, 'carga/sqlite_municipio', escala, medir(actualizar_municipio, repeticiones), len(df))
+
+    # Apertura de la tabla publicada por otro proceso (mapeada en memoria, sin deserializar)
+    cache = CacheDisco(os.path.join(directorio, 'cache'))
+    compacta = IndiceSeries(datos.compactar_tarifas(datos.cargar_tarifas(ruta_parquet))).df
+    tabla_compartida.publicar(compacta, 'benchmark', 1, cache)
+    registrar(resultados, 'carga/mapeada', escala,
+              medir(lambda: tabla_compartida.adjuntar('benchmark', 1, cache), repeticiones), len(df))
+
+    # Dataset particionado por año: tabla completa y un período de dos años con una columna
+    ruta_lago = os.path.join(directorio, 'lago')
+    preparada = datos.cargar_tarifas(ruta_parquet)
+    lago.escribir_lago(preparada.drop(columns='fecha', errors='ignore'), ruta_lago)
+    registrar(resultados, 'carga/lago', escala, medir(lambda: datos.cargar_tarifas(ruta_lago), repeticiones), len(df))
+    ultimo = int(preparada['Año'].max())
+    periodo = lago.leer_lago(ruta_lago, ['Municipio'], ultimo - 1, ultimo)
+    registrar(resultados, 'carga/lago_periodo', escala,
+              medir(lambda: lago.leer_lago(ruta_lago, ['Municipio', 'Fecha', 'indice_carga'], ultimo - 1, ultimo),
+                    repeticiones), len(periodo))
+
+
+def bench_agregaciones(df, escala, repeticiones, resultados):
+    """Tiempo de las agregaciones del dashboard principal"""
+    municipio, estrato, servicio = df['Municipio'].iloc[0], df['Estrato'].iloc[0], df['Servicio'].iloc[0]
+    anno_inicio, anno_fin = df['Año'].min(), df['Año'].max()
+    indice_series = IndiceSeries(df)
+
+    casos = {
+        'opciones_filtros': lambda: [sorted(df[c].unique()) for c in ('Municipio', 'Estrato', 'Servicio')],
+        'filtrar_serie': lambda: indicadores.filtrar_serie(df, municipio, estrato, servicio),
+        'indice_series': lambda: IndiceSeries(df),
+        'serie_indice': lambda: indice_series.serie(municipio, estrato, servicio),
+        'estructura_tarifaria': lambda: indicadores.estructura_tarifaria(df, municipio, servicio),
+        'variacion_geografica': lambda: indicadores.variacion_geografica(df, estrato, servicio),
+        'tarifa_promedio_municipio': lambda: indicadores.tarifa_promedio_municipio(df, anno_inicio, anno_fin),
+        'matriz_comparacion': lambda: indicadores.matriz_comparacion(
+            indicadores.promedio_por_municipio(df, 'Cargo Fijo', estrato, servicio, anno_inicio, anno_fin)
+        ),
+    }
+    for tipo, columnas in indicadores.INDICADORES_CLAVE.items():
+        casos[f'indicadores_{tipo.split(" ")[0]}'] = lambda columnas=columnas: indicadores.indicadores_por_municipio(df, columnas)
+
+    for nombre, funcion in casos.items():
+        registrar(resultados, f'agregaciones/{nombre}', escala, medir(funcion, repeticiones), len(df))
+
+    # Simulador: proyección de todas las series y evaluación de un escenario con todos los indicadores
+    proyeccion = escenarios.proyectar_tarifas(df, 24)
+    reglas = [escenarios.regla('Cargo Fijo', 'Porcentaje', 10, estratos=['4', '5', '6'], desde=int(proyeccion['Año'].max()))]
+    registrar(resultados, 'agregaciones/escenarios_proyeccion', escala,
+              medir(lambda: escenarios.proyectar_tarifas(df, 24), repeticiones), len(df))
+    registrar(resultados, 'agregaciones/escenarios_evaluacion', escala,
+              medir(lambda: escenarios.evaluar_escenario(proyeccion, reglas), repeticiones), len(proyeccion))
+
+    # Anomalías y cambios estructurales de todas las series y cargos en una pasada
+    registrar(resultados, 'agregaciones/anomalias_deteccion', escala,
+              medir(lambda: anomalias.detectar_eventos(df), repeticiones), len(df))
+
+
+def bench_pronosticos(df, escala, repeticiones, resultados, series_lote, horizonte=12):
+    """Tiempo de cada modelo por serie y en lote de varias series"""
+    claves = df[['Municipio', 'Estrato', 'Servicio']].drop_duplicates().head(series_lote)
+    series = [
+        modelos.preparar_serie(indicadores.filtrar_serie(df, m, e, s))
+        for m, e, s in claves.itertuples(index=False)
+    ]
+    frecuencia = modelos.inferir_frecuencia(series[0]['ds'])
+
+    for modelo in modelos.MODELOS_DISPONIBLES:
+        tiempos = medir(lambda: modelos.pronosticar(series[0], modelo, horizonte, 95, frecuencia), repeticiones)
+        registrar(resultados, f'pronosticos/{modelo}/serie', escala, tiempos, 1)
+
+        def lote():
+            for serie in series:
+                modelos.pronosticar(serie, modelo, horizonte, 95, frecuencia)
+        registrar(resultados, f'pronosticos/{modelo}/lote', escala, medir(lote, 1), len(series))
+
+    # Toda la jerarquía (Total → Región → Municipio → Servicio → Estrato) en una pasada
+    for metodo in ('Bottom-up', 'MinT'):
+        tiempos = medir(lambda: jerarquia.pronostico_jerarquico(df, horizonte=horizonte, metodo=metodo), repeticiones)
+        series_inferiores = df[['Municipio', 'Estrato', 'Servicio']].drop_duplicates().shape[0]
+        registrar(resultados, f'pronosticos/jerarquico/{metodo}', escala, tiempos, series_inferiores)
+
+
+def bench_geojson(df, escala, repeticiones, resultados):
+    """Tiempo de generación del GeoJSON del visor"""
+    municipios = sorted(df['Municipio'].unique())
+    gdf_municipios = geo.preparar_municipios(sinteticos.generar_municipios(municipios))
+    df_tarifas = df.copy()
+    df_tarifas['Municipio_norm'] = df_tarifas['Municipio'].apply(geo.normalizar_nombre)
+
+    tiempos = medir(lambda: geo.geojson_indicador(gdf_municipios, df_tarifas, 'indice_carga'), repeticiones)
+    registrar(resultados, 'geojson/indicador', escala, tiempos, len(municipios))
+
+    tiempos = medir(lambda: espacial.pesos_municipios(gdf_municipios), repeticiones)
+    registrar(resultados, 'geojson/pesos_espaciales', escala, tiempos, len(municipios))
+    W = espacial.pesos_municipios(gdf_municipios)
+    tiempos = medir(lambda: espacial.lisa_indicador(gdf_municipios, df_tarifas, 'indice_carga', W), repeticiones)
+    registrar(resultados, 'geojson/lisa', escala, tiempos, len(municipios))
+
+    # Ubicación de 100.000 puntos al azar dentro del área de los municipios
+    localizador = ubicacion.LocalizadorMunicipios(gdf_municipios)
+    oeste, sur, este, norte = gdf_municipios.total_bounds
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(sur, norte, PUNTOS_UBICACION), rng.uniform(oeste, este, PUNTOS_UBICACION)
+    tiempos = medir(lambda: localizador.localizar(lat, lon), repeticiones)
+    registrar(resultados, 'geojson/ubicacion_puntos', escala, tiempos, PUNTOS_UBICACION)
+
+
+def bench_migracion(df, escala, repeticiones, resultados, postgres=None):
+    """Throughput de la verificación y la inserción por lotes de migrate_db"""
+    import migrate_db
+
+    filas = list(df.itertuples(index=False, name=None))
+    tiempos = medir(lambda: migrate_db.check_data_quality(filas, list(df.columns)), repeticiones)
+    registrar(resultados, 'migracion/verificacion', escala, tiempos, len(filas))
+
+    if postgres:
+        columnas = list(df.columns)
+        definiciones = ', '.join(
+            f'"{c}" double precision' if pd.api.types.is_float_dtype(df[c]) else
+            f'"{c}" bigint' if pd.api.types.is_integer_dtype(df[c]) else f'"{c}" text'
+            for c in columnas
+        )
+        conn = conectar_postgres(postgres)
+        try:
+            def insertar():
+                with conn.cursor() as cur:
+                    cur.execute(f'DROP TABLE IF EXISTS {TABLA_BENCHMARK}_migracion; CREATE TABLE {TABLA_BENCHMARK}_migracion ({definiciones})')
+                    conn.commit()
+                    migrate_db.insert_batches(conn, cur, f'{TABLA_BENCHMARK}_migracion', columnas, filas)
+            registrar(resultados, 'migracion/insercion_postgres', escala, medir(insertar, 1), len(filas))
+        finally:
+            conn.close()
+
+
+def comparar(resultados, baseline, tolerancia):
+    """Comparar con el baseline y devolver la lista de regresiones"""
+    referencia = {(r['nombre'], r['escala']): r for r in baseline.get('resultados', [])}
+    regresiones = []
+    for resultado in resultados:
+        base = referencia.get((resultado['nombre'], resultado['escala']))
+        if base is None:
+            continue
+        actual, anterior = resultado['mediana_s'], base['mediana_s']
+        resultado['baseline_s'] = anterior
+        resultado['cambio'] = (actual / anterior - 1) if anterior > 0 else None
+        if actual > anterior * (1 + tolerancia) and actual - anterior > UMBRAL_ABSOLUTO:
+            regresiones.append(resultado)
+    return regresiones
+
+
+def metadatos(args):
+    """Información del entorno para reproducir la ejecución"""
+    import numpy as np
+
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'procesador': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'escalas': args.escalas,
+        'semilla': args.semilla,
+        'meses': args.meses,
+        'repeticiones': args.repeticiones,
+    }
+
+
+def run_benchmarks(args):
+    """Ejecutar los grupos de benchmarks seleccionados en cada escala"""
+    # Silenciar los mensajes de entrenamiento de Prophet/cmdstanpy y statsmodels
+    logging.getLogger('cmdstanpy').disabled = True
+    logging.getLogger('prophet').setLevel(logging.WARNING)
+    warnings.filterwarnings('ignore')
+
+    resultados = []
+    if 'arranque' in args.grupos:
+        print("\nArranque en frío (importaciones)")
+        bench_arranque(args.repeticiones, resultados)
+
+    for escala in args.escalas:
+        print(f"\nEscala {escala}x")
+        inicio = time.perf_counter()
+        df_crudo = sinteticos.generar_tarifas(escala, meses=args.meses, semilla=args.semilla)
+        registrar(resultados, 'generacion/tarifas', escala, [time.perf_counter() - inicio], len(df_crudo))
+        df = datos.compactar_tarifas(datos.preparar_tarifas(df_crudo.copy()))
+
+        with tempfile.TemporaryDirectory() as directorio:
+            if 'carga' in args.grupos:
+                bench_carga(df_crudo, escala, args.repeticiones, resultados, directorio, args.postgres)
+        if 'agregaciones' in args.grupos:
+            bench_agregaciones(df, escala, args.repeticiones, resultados)
+        if 'pronosticos' in args.grupos:
+            bench_pronosticos(df, escala, args.repeticiones, resultados, args.series_lote)
+        if 'geojson' in args.grupos:
+            bench_geojson(df, escala, args.repeticiones, resultados)
+        if 'migracion' in args.grupos:
+            bench_migracion(df_crudo, escala, args.repeticiones, resultados, args.postgres)
+
+    salida = {'metadatos': metadatos(args), 'resultados': resultados}
+
+    regresiones = []
+    if args.baseline and os.path.exists(args.baseline) and not args.guardar_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerancia)
+        salida['regresiones'] = [r['nombre'] + f" x{r['escala']}" for r in regresiones]
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(salida, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {args.salida}")
+
+    if args.guardar_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(salida, f, indent=2, ensure_ascii=False)
+        print(f"Baseline actualizado en {args.baseline}")
+
+    if regresiones:
+        print(f"\nSe encontraron {len(regresiones)} regresiones (tolerancia {args.tolerancia:.0%}):")
+        for r in regresiones:
+            print(f"  {r['nombre']} x{r['escala']}: {r['baseline_s'] * 1000:.2f} ms -> {r['mediana_s'] * 1000:.2f} ms ({r['cambio']:+.0%})")
+        return False
+    return True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del Sistema de Predicción de Tarifas")
+    parser.add_argument('--escalas', type=int, nargs='+', default=[1, 10, 100],
+                        help="Escalas del conjunto sintético (1 = tamaño de la tabla real)")
+    parser.add_argument('--grupos', nargs='+', choices=GRUPOS, default=GRUPOS)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--meses', type=int, default=96, help="Meses de historia por serie")
+    parser.add_argument('--series-lote', type=int, default=10, help="Series por lote en los pronósticos")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--postgres', default=os.getenv('BENCHMARK_DATABASE_URL'),
+                        help="URL de PostgreSQL para medir carga e inserción (opcional)")
+    parser.add_argument('--salida', default='benchmarks/resultados.json')
+    parser.add_argument('--baseline', default='benchmarks/baseline.json')
+    parser.add_argument('--tolerancia', type=float, default=0.25,
+                        help="Aumento relativo de la mediana a partir del cual se reporta regresión")
+    parser.add_argument('--guardar-baseline', action='store_true',
+                        help="Guardar esta ejecución como nuevo baseline")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.exit(0 if run_benchmarks(parse_args()) else 1)
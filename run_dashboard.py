@@ -3,35 +3,184 @@
 
 """
 Script para ejecutar el dashboard de Streamlit
+
+Con --trabajadores N se inician N procesos de Streamlit en puertos locales
+detrás de un proxy inverso (tarifas/proxy.py) con sesiones fijas por
+navegador; los procesos comparten la tabla cargada y los pronósticos en una
+caché en disco (tarifas/cache_compartido.py). Con --trabajadores auto se usa
+un trabajador por núcleo.
+
+Si hay mapas base sembrados (seed_tiles.py) se inicia también el servidor
+local de teselas (run_tiles.py), del que el visor carga esas capas.
+
+Ejemplos:
+    python run_dashboard.py
+    python run_dashboard.py --trabajadores auto
+    python run_dashboard.py --trabajadores 4 --port 8501 --cache-dir /var/cache/tarifas
+    python run_dashboard.py --lago data/lago_tarifas
 """
 
+import argparse
 import os
+import secrets
+import shutil
+import signal
 import subprocess
 import sys
+import tempfile
+
+from tarifas import lago, teselas
+from tarifas.cache_compartido import ENTORNO_DIRECTORIO, CacheDisco
+from tarifas.planificador import VARIABLES_HILOS
+
+PUERTO_BASE_TRABAJADORES = 8600
+INTERVALO_SUPERVISION = 5
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Dashboard de tarifas")
+    parser.add_argument('--port', type=int, default=8501)
+    parser.add_argument('--address', default='0.0.0.0')
+    parser.add_argument('--trabajadores', default='1',
+                        help="Procesos de Streamlit detrás del proxy ('auto' = uno por núcleo)")
+    parser.add_argument('--puerto-base', type=int, default=PUERTO_BASE_TRABAJADORES,
+                        help="Primer puerto local de los trabajadores")
+    parser.add_argument('--cache-dir', help="Directorio de la caché compartida, del usuario y sin escritura para otros; "
+                                            "nuevo, vacío o usado antes como caché, porque se vacía al arrancar "
+                                            "(por defecto uno temporal nuevo en cada arranque)")
+    parser.add_argument('--puerto-teselas', type=int, default=teselas.PUERTO_TESELAS,
+                        help="Puerto del servidor local de teselas")
+    parser.add_argument('--sin-teselas', action='store_true', help="No iniciar el servidor local de teselas")
+    parser.add_argument('--url-teselas', help="URL del servidor de teselas tal como la ve el navegador "
+                                              "(por defecto http://localhost:<puerto-teselas>/teselas, "
+                                              "válida solo en la máquina del servidor)")
+    parser.add_argument('--lago', help="Dataset particionado (build_data_lake.py) que leen el visor y la comparación "
+                                       "de municipios; sin esta opción ni TARIFAS_LAGO se lee la base")
+    return parser.parse_args(argv)
+
+
+def numero_trabajadores(valor):
+    if valor == 'auto':
+        return os.cpu_count() or 1
+    return max(1, int(valor))
+
+
+def comando_streamlit(puerto, direccion, *opciones):
+    return [
+        sys.executable,
+        "-m",
+        "streamlit",
+        "run",
+        "home.py",
+        f"--server.port={puerto}",
+        f"--server.address={direccion}",
+        *opciones,
+    ]
+
+
+def iniciar_teselas(args):
+    """
+    Servidor local de teselas si hay capas sembradas (None si no). Su URL
+    queda en TARIFAS_TESELAS_URL, y sin ella el visor usa los proveedores remotos.
+    """
+    if args.sin_teselas or not teselas.capas_locales():
+        return None
+    url = args.url_teselas or os.getenv(teselas.ENTORNO_URL) or f"http://localhost:{args.puerto_teselas}/teselas"
+    os.environ[teselas.ENTORNO_URL] = url
+    return subprocess.Popen([sys.executable, "run_tiles.py", f"--port={args.puerto_teselas}"])
 
-def run_dashboard():
+
+def run_dashboard(args=None):
     """Ejecutar el dashboard de Streamlit"""
+    args = args or parse_args([])
+    servidor_teselas = None
     try:
         # Obtener la ruta del directorio actual
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        
+
         # Cambiar al directorio del dashboard
         os.chdir(current_dir)
-        
-        # Ejecutar Streamlit
-        subprocess.run([
-            sys.executable,
-            "-m",
-            "streamlit",
-            "run",
-            "home.py",
-            "--server.port=8501",
-            "--server.address=0.0.0.0"
-        ])
-        
+
+        if args.lago:
+            if not lago.es_lago(args.lago):
+                raise ValueError(f"{args.lago} no es un dataset escrito con build_data_lake.py")
+            os.environ[lago.ENTORNO_LAGO] = os.path.abspath(args.lago)
+        servidor_teselas = iniciar_teselas(args)
+        trabajadores = numero_trabajadores(args.trabajadores)
+        if trabajadores == 1:
+            # Ejecutar Streamlit
+            subprocess.run(comando_streamlit(args.port, args.address))
+        else:
+            run_trabajadores(args, trabajadores)
+
     except Exception as e:
         print(f"Error al ejecutar el dashboard: {str(e)}")
         sys.exit(1)
+    finally:
+        if servidor_teselas is not None:
+            servidor_teselas.terminate()
+
+
+def run_trabajadores(args, trabajadores):
+    """Iniciar los trabajadores y el proxy, y reiniciar los trabajadores que terminen"""
+    from tornado import ioloop
+
+    from tarifas import proxy
+
+    # Caché compartida nueva en cada arranque: las claves sin versión de datos no sobreviven.
+    # Por defecto un directorio privado (0700) de nombre impredecible, que se borra al terminar
+    directorio = args.cache_dir or tempfile.mkdtemp(prefix='tarifas_cache_')
+    CacheDisco(directorio).vaciar()
+    # Mismo secreto de cookies en todos: el token XSRF de una sesión es válido en cualquiera
+    entorno = {
+        **os.environ,
+        ENTORNO_DIRECTORIO: directorio,
+        'STREAMLIT_SERVER_COOKIE_SECRET': os.getenv('STREAMLIT_SERVER_COOKIE_SECRET') or secrets.token_hex(32),
+        # Los núcleos se reparten entre los trabajadores: ajustes simultáneos por proceso
+        # y un hilo BLAS/OpenMP por ajuste (ver tarifas/planificador.py)
+        'TARIFAS_AJUSTES': os.getenv('TARIFAS_AJUSTES') or str(max(1, (os.cpu_count() or 1) // trabajadores)),
+        'TARIFAS_HILOS_AJUSTE': os.getenv('TARIFAS_HILOS_AJUSTE') or '1',
+    }
+    # El límite de BLAS/OpenMP rige desde el arranque de cada trabajador
+    for variable in VARIABLES_HILOS:
+        entorno.setdefault(variable, entorno['TARIFAS_HILOS_AJUSTE'])
+    opciones = ["--server.headless=true"]
+    puertos = [args.puerto_base + i for i in range(trabajadores)]
+    procesos = {}
+
+    def iniciar(puerto):
+        procesos[puerto] = subprocess.Popen(comando_streamlit(puerto, '127.0.0.1', *opciones), env=entorno)
+
+    def supervisar():
+        for puerto, proceso in list(procesos.items()):
+            if proceso.poll() is not None:
+                print(f"Trabajador en el puerto {puerto} terminó (código {proceso.returncode}); reiniciando")
+                iniciar(puerto)
+
+    for puerto in puertos:
+        iniciar(puerto)
+    try:
+        proxy.iniciar_proxy([proxy.Trabajador(i, p) for i, p in enumerate(puertos)], args.port, args.address)
+        ioloop.PeriodicCallback(supervisar, INTERVALO_SUPERVISION * 1000).start()
+        # SIGTERM se trata como Ctrl+C para detener también a los trabajadores
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        print(f"Dashboard en http://{args.address}:{args.port} con {trabajadores} trabajadores "
+              f"(puertos {puertos[0]}-{puertos[-1]}, caché en {directorio})")
+        print(f"Salud de los trabajadores: http://{args.address}:{args.port}/_proxy/salud")
+        ioloop.IOLoop.current().start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proceso in procesos.values():
+            proceso.terminate()
+        for proceso in procesos.values():
+            try:
+                proceso.wait(10)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+        if not args.cache_dir:
+            shutil.rmtree(directorio, ignore_errors=True)
+
 
 if __name__ == "__main__":
-    run_dashboard() 
\ No newline at end of file
+    run_dashboard(parse_args())
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script para ejecutar el servidor local de teselas de mapa base (MBTiles
+sembrados con seed_tiles.py, ver tarifas/teselas.py)
+
+Ejemplos:
+    python run_tiles.py
+    python run_tiles.py --port 8510 --cache-mb 128
+"""
+
+import argparse
+import os
+import sys
+
+from tarifas import teselas
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local de teselas")
+    parser.add_argument('--port', type=int, default=teselas.PUERTO_TESELAS)
+    parser.add_argument('--address', default='0.0.0.0')
+    parser.add_argument('--directorio', help="Directorio de los MBTiles (por defecto data/teselas o TARIFAS_TESELAS_DIR)")
+    parser.add_argument('--cache-mb', type=int, default=teselas.MAX_BYTES_CACHE // 1024 ** 2,
+                        help="Tamaño de la caché LRU en memoria")
+    return parser.parse_args(argv)
+
+
+def run_tiles(args):
+    """Servir las capas sembradas hasta Ctrl+C"""
+    from tornado import ioloop
+
+    try:
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        capas = teselas.capas_locales(args.directorio)
+        if not capas:
+            print("No hay capas sembradas; ejecute primero python seed_tiles.py")
+        teselas.iniciar_servidor(args.port, args.address, args.directorio, args.cache_mb * 1024 ** 2)
+        print(f"Teselas en http://{args.address}:{args.port}/teselas/<capa>/<z>/<x>/<y> "
+              f"(capas: {', '.join(capas) or 'ninguna'})")
+        ioloop.IOLoop.current().start()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"Error al ejecutar el servidor de teselas: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_tiles(parse_args())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script para sembrar los archivos MBTiles del servidor local de teselas con los
+mapas base del Valle de Aburrá y el Oriente cercano (ver tarifas/teselas.py)
+
+Las teselas se descargan una sola vez del proveedor de cada capa; las ya
+guardadas se omiten. Respete las políticas de uso del proveedor: para zooms
+altos o áreas grandes use un servidor propio con --url.
+
+Ejemplos:
+    python seed_tiles.py
+    python seed_tiles.py --capas satelite terreno --zoom-maximo 15
+    python seed_tiles.py --capas osm --url http://teselas.intranet/osm/{z}/{x}/{y}.png --hilos 8
+"""
+
+import argparse
+import sys
+import time
+
+from tarifas import teselas
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Siembra de teselas de mapa base en MBTiles")
+    parser.add_argument('--capas', nargs='+', default=list(teselas.FUENTES), help="Capas a sembrar")
+    parser.add_argument('--directorio', help="Directorio de los MBTiles (por defecto data/teselas o TARIFAS_TESELAS_DIR)")
+    parser.add_argument('--bbox', nargs=4, type=float, default=teselas.BBOX_VALLE,
+                        metavar=('OESTE', 'SUR', 'ESTE', 'NORTE'))
+    parser.add_argument('--zoom-minimo', type=int, default=teselas.ZOOM_MINIMO)
+    parser.add_argument('--zoom-maximo', type=int, default=teselas.ZOOM_MAXIMO)
+    parser.add_argument('--url', help="Plantilla {z}/{x}/{y} del origen (por defecto el proveedor de la capa)")
+    parser.add_argument('--hilos', type=int, default=2, help="Descargas simultáneas")
+    parser.add_argument('--reemplazar', action='store_true', help="Descargar también las teselas ya guardadas")
+    return parser.parse_args(argv)
+
+
+def seed_tiles(args):
+    """Sembrar cada capa pedida"""
+    zooms = range(args.zoom_minimo, args.zoom_maximo + 1)
+    total = sum(1 for _ in teselas.teselas_bbox(args.bbox, zooms))
+    for capa in args.capas:
+        if capa not in teselas.FUENTES and not args.url:
+            raise ValueError(f"Capa desconocida '{capa}' (use --url): {', '.join(teselas.FUENTES)}")
+        inicio = time.perf_counter()
+        print(f"Sembrando {capa}: {total:,} teselas (zoom {args.zoom_minimo}-{args.zoom_maximo})")
+        resumen = teselas.sembrar(
+            capa, args.directorio, tuple(args.bbox), args.zoom_minimo, args.zoom_maximo, args.url,
+            args.hilos, args.reemplazar,
+            progreso=lambda r, pendientes: print(f"  {r['descargadas']:,}/{pendientes:,} descargadas"),
+        )
+        print(f"{capa}: {resumen['descargadas']:,} descargadas, {resumen['omitidas']:,} ya guardadas, "
+              f"{resumen['fallidas']:,} fallidas en {time.perf_counter() - inicio:.1f} s "
+              f"({teselas.ruta_capa(capa, args.directorio)})")
+
+
+if __name__ == "__main__":
+    try:
+        seed_tiles(parse_args())
+    except Exception as e:
+        print(f"Error al sembrar las teselas: {str(e)}")
+        sys.exit(1)
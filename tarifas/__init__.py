@@ -0,0 +1,5 @@
+"""
+Lógica compartida del Sistema de Predicción de Tarifas: carga de datos,
+indicadores, modelos predictivos y utilidades geográficas usadas por las
+páginas de Streamlit, los scripts y los benchmarks.
+"""
@@ -0,0 +1,172 @@
+"""
+Animación coroplética del visor: el indicador se reproduce periodo a periodo
+(año o mes) sobre los polígonos de municipios sin reruns de Streamlit.
+
+La geometría se envía una sola vez como GeoJSON y los valores como una
+matriz compacta (periodos x municipios) calculada con `geo.matriz_indicador`;
+el componente Leaflet recolorea los polígonos en el navegador.
+"""
+
+import json
+from string import Template
+
+import numpy as np
+
+from tarifas.geo import ESTILO_RESALTADO
+
+LEAFLET_JS = "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js"
+LEAFLET_CSS = "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css"
+
+_PLANTILLA = Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<link rel="stylesheet" href="$leaflet_css">
+<script src="$leaflet_js"></script>
+<style>
+    html, body { margin: 0; height: 100%; font-family: arial, sans-serif; }
+    #mapa { position: absolute; top: 48px; bottom: 0; width: 100%; }
+    #controles { height: 48px; display: flex; align-items: center; gap: 12px; padding: 0 12px; }
+    #periodo { font-weight: bold; min-width: 70px; color: #0D47A1; }
+    #deslizador { flex: 1; }
+    .leyenda { background: white; padding: 6px 8px; border-radius: 4px; font-size: 12px; }
+    .leyenda .barra { width: 160px; height: 10px; background: linear-gradient(to right, $gradiente); }
+</style>
+</head>
+<body>
+<div id="controles">
+    <button id="reproducir">▶</button>
+    <input id="deslizador" type="range" min="0" max="$ultimo" value="0">
+    <span id="periodo"></span>
+</div>
+<div id="mapa"></div>
+<script>
+    var geometria = $geometria;
+    var valores = $valores;
+    var periodos = $periodos;
+    var colores = $colores;
+    var vmin = $vmin, vmax = $vmax;
+    var resaltado = $resaltado;
+    var estiloResaltado = $estilo_resaltado;
+
+    var mapa = L.map('mapa').setView($centro, 10);
+    L.tileLayer($url_teselas, $opciones_teselas).addTo(mapa);
+
+    var poligonos = [];
+    L.geoJSON(geometria, {
+        onEachFeature: function (feature, capa) { capa.bindTooltip(''); poligonos.push(capa); }
+    }).addTo(mapa);
+
+    function hexRgb(hex) {
+        return [1, 3, 5].map(function (i) { return parseInt(hex.substr(i, 2), 16); });
+    }
+    var paradas = colores.map(hexRgb);
+
+    function color(v) {
+        if (v === null) return '#808080';
+        var t = vmax > vmin ? Math.min(Math.max((v - vmin) / (vmax - vmin), 0), 1) : 0;
+        var x = t * (paradas.length - 1), i = Math.min(Math.floor(x), paradas.length - 2), f = x - i;
+        var rgb = paradas[i].map(function (c, k) { return Math.round(c + f * (paradas[i + 1][k] - c)); });
+        return 'rgb(' + rgb.join(',') + ')';
+    }
+
+    var deslizador = document.getElementById('deslizador');
+    var etiqueta = document.getElementById('periodo');
+    var boton = document.getElementById('reproducir');
+
+    function mostrar(i) {
+        var fila = valores[i];
+        poligonos.forEach(function (capa, j) {
+            var nombre = capa.feature.properties.MpNombre;
+            var estilo = {fillColor: color(fila[j]), fillOpacity: 0.7, color: '#0D47A1', weight: 1};
+            if (nombre === resaltado) Object.assign(estilo, estiloResaltado);
+            capa.setStyle(estilo);
+            capa.setTooltipContent(nombre + ': ' + (fila[j] === null ? 'sin datos' : fila[j].toFixed(3)));
+        });
+        etiqueta.textContent = periodos[i];
+        deslizador.value = i;
+    }
+
+    var temporizador = null;
+    boton.onclick = function () {
+        if (temporizador) {
+            clearInterval(temporizador); temporizador = null; boton.textContent = '▶';
+            return;
+        }
+        boton.textContent = '⏸';
+        temporizador = setInterval(function () {
+            mostrar((parseInt(deslizador.value) + 1) % periodos.length);
+        }, $intervalo);
+    };
+    deslizador.oninput = function () { mostrar(parseInt(deslizador.value)); };
+
+    var leyenda = L.control({position: 'bottomright'});
+    leyenda.onAdd = function () {
+        var div = L.DomUtil.create('div', 'leyenda');
+        div.innerHTML = $titulo + '<div class="barra"></div>' +
+            '<span>' + vmin.toFixed(2) + '</span><span style="float:right">' + vmax.toFixed(2) + '</span>';
+        return div;
+    };
+    leyenda.addTo(mapa);
+    mostrar(0);
+</script>
+</body>
+</html>
+""")
+
+
+def etiquetas_periodo(periodos):
+    """Etiquetas legibles: el año tal cual y AAAAMM como AAAA-MM"""
+    return [f"{p // 100}-{p % 100:02d}" if p > 9999 else str(p) for p in (int(p) for p in periodos)]
+
+
+def url_teselas(tiles):
+    """URL y atribución de un mapa base (URL directa o nombre de proveedor de folium)"""
+    if '{z}' in tiles:
+        return tiles, None
+    import xyzservices
+
+    # Igual que folium: "OpenStreetMap" es el proveedor "OpenStreetMap Mapnik"
+    if tiles.lower() == 'openstreetmap':
+        tiles = 'OpenStreetMap Mapnik'
+    proveedor = xyzservices.providers.query_name(tiles)
+    return proveedor.build_url(), proveedor.html_attribution
+
+
+def html_animacion(gdf_municipios, periodos, matriz, colores, titulo, centro, tiles,
+                   atribucion=None, resaltado=None, intervalo_ms=800, decimales=4, zoom_nativo=None):
+    """
+    Documento HTML autónomo con la animación coroplética.
+
+    `matriz` tiene una fila por periodo y una columna por polígono de
+    `gdf_municipios`; la geometría viaja una sola vez y solo con el nombre
+    del municipio como propiedad. Con `zoom_nativo` (teselas locales sembradas
+    hasta ese zoom) Leaflet amplía las de ese zoom en lugar de pedir otras.
+    """
+    url, atribucion_proveedor = url_teselas(tiles)
+    opciones_teselas = {'attribution': atribucion or atribucion_proveedor or ''}
+    if zoom_nativo is not None:
+        opciones_teselas['maxNativeZoom'] = int(zoom_nativo)
+    geometria = gdf_municipios[['MpNombre', 'geometry']].to_json()
+    valores = np.round(matriz, decimales).astype(object)
+    valores[np.isnan(matriz)] = None
+    finitos = matriz[np.isfinite(matriz)]
+    return _PLANTILLA.substitute(
+        leaflet_js=LEAFLET_JS,
+        leaflet_css=LEAFLET_CSS,
+        gradiente=', '.join(colores),
+        ultimo=len(periodos) - 1,
+        geometria=geometria,
+        valores=json.dumps(valores.tolist(), separators=(',', ':')),
+        periodos=json.dumps(etiquetas_periodo(periodos)),
+        colores=json.dumps(colores),
+        vmin=float(finitos.min()) if finitos.size else 0.0,
+        vmax=float(finitos.max()) if finitos.size else 1.0,
+        resaltado=json.dumps(resaltado),
+        estilo_resaltado=json.dumps(ESTILO_RESALTADO),
+        centro=json.dumps(list(centro)),
+        url_teselas=json.dumps(url),
+        opciones_teselas=json.dumps(opciones_teselas),
+        titulo=json.dumps(titulo),
+        intervalo=int(intervalo_ms),
+    )
@@ -0,0 +1,293 @@
+"""
+Detección de anomalías y cambios estructurales en todas las series
+(Municipio, Estrato, Servicio) en una sola pasada.
+
+Las series se alinean en una matriz (series x meses) con NaN donde no hay
+dato. Las anomalías son puntos aislados lejos de la mediana móvil centrada
+de su serie (z robusto con la MAD, filtro de Hampel); un error de captura
+como un Cargo Fijo multiplicado por 1000 queda muy por encima del umbral,
+mientras que un salto que se mantiene no, porque la mediana lo sigue. Los
+cambios estructurales (p. ej. un reajuste regulatorio) se buscan sobre la
+serie depurada en escala logarítmica y sin su tendencia con segmentación
+binaria: en cada ronda se evalúan a la vez todos los cortes posibles de
+todos los segmentos de todas las series con sumas acumuladas, y un corte
+solo se acepta si el nivel salta en ese mes (medianas de los meses justo
+antes y justo después), no si solo difieren las medias de los segmentos,
+como ocurre con cualquier tendencia o con la indexación anual.
+
+Los eventos forman una tabla larga (una fila por evento); las fechas de
+cambio se pasan a los modelos de `tarifas.modelos` como escalones de nivel
+conocidos y `guardar_eventos` los exporta a la base o a un archivo.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from sqlalchemy import create_engine
+
+from tarifas.indice import COLUMNAS_SERIE
+
+TABLA_EVENTOS = "eventos_series_tarifas"
+ANOMALIA = 'Anomalía'
+CAMBIO = 'Cambio estructural'
+COLUMNAS_EVENTOS = COLUMNAS_SERIE + ['Columna', 'Fecha', 'Tipo', 'Valor', 'Referencia', 'Puntaje']
+
+# Mediana móvil de 13 meses; z robusto a partir del cual un punto es anómalo
+VENTANA = 13
+UMBRAL_Z = 5.0
+# Escala mínima de la MAD: 2 % de la mediana (las tarifas pasan meses sin cambiar)
+PISO_RELATIVO = 0.02
+PISO_ABSOLUTO = 1.0
+MIN_VECINOS = 5
+
+# Salto mínimo en log (≈ 10 %) entre las medianas de VENTANA_SALTO meses antes y
+# después del corte, medido sin la tendencia: la indexación anual (3-10 %) no lo alcanza
+MIN_SALTO = 0.1
+VENTANA_SALTO = 6
+# Rezago de las diferencias con que se estima la pendiente (un año: robusto a la indexación en enero)
+REZAGO_TENDENCIA = 12
+MIN_SEGMENTO = 3
+MAX_CAMBIOS = 5
+PISO_RUIDO = 0.01
+
+
+# ======================== Matriz de series ========================
+
+def matriz_series(df, columnas):
+    """
+    Promedio mensual de cada serie sin rellenar huecos.
+
+    Devuelve (claves, fechas, {columna: Y}) con Y de forma series x meses y
+    NaN en los meses sin observación.
+    """
+    periodos = df['Fecha'].dt.to_period('M')
+    promedios = (
+        df.assign(_periodo=periodos)
+        .groupby(COLUMNAS_SERIE + ['_periodo'], observed=True)[columnas]
+        .mean()
+        .unstack('_periodo')
+    )
+    meses = pd.period_range(periodos.min(), periodos.max(), freq='M')
+    claves = promedios.index.to_frame(index=False).astype(str)
+    matrices = {c: promedios[c].reindex(columns=meses).to_numpy(dtype=float) for c in columnas}
+    return claves, meses.to_timestamp(), matrices
+
+
+# ======================== Anomalías ========================
+
+def _mediana(V):
+    """Mediana del último eje ignorando NaN (ordenando una vez, sin recorrer filas)"""
+    ordenado = np.sort(V, axis=-1)
+    validos = np.isfinite(V).sum(axis=-1)
+    bajo = np.take_along_axis(ordenado, np.maximum((validos - 1) // 2, 0)[..., None], axis=-1)[..., 0]
+    alto = np.take_along_axis(ordenado, np.maximum(validos // 2, 0)[..., None], axis=-1)[..., 0]
+    return np.where(validos > 0, (bajo + alto) / 2, np.nan)
+
+
+def z_robusto(Y, ventana=VENTANA, piso_relativo=PISO_RELATIVO, piso_absoluto=PISO_ABSOLUTO):
+    """
+    (z, mediana) de cada punto respecto a la mediana móvil centrada de su
+    serie; z es 0 donde faltan datos o hay menos de MIN_VECINOS en la ventana.
+    """
+    mitad = ventana // 2
+    relleno = np.pad(Y, ((0, 0), (mitad, mitad)), constant_values=np.nan)
+    ventanas = sliding_window_view(relleno, ventana, axis=1)
+    validos = np.isfinite(ventanas).sum(axis=2)
+    with np.errstate(all='ignore'):
+        mediana = _mediana(ventanas)
+        mad = _mediana(np.abs(ventanas - mediana[..., None]))
+        escala = np.maximum(np.maximum(1.4826 * mad, piso_relativo * np.abs(mediana)), piso_absoluto)
+        z = (Y - mediana) / escala
+    z[~np.isfinite(z) | (validos < MIN_VECINOS)] = 0.0
+    return z, mediana
+
+
+# ======================== Cambios estructurales ========================
+
+def _sse(P1, P2, filas, a, b):
+    """Suma de cuadrados alrededor de la media de Y[filas, a:b] (sumas acumuladas)"""
+    s1 = P1[filas, b] - P1[filas, a]
+    return P2[filas, b] - P2[filas, a] - s1 ** 2 / np.maximum(b - a, 1)
+
+
+def quitar_tendencia(Y, rezago=REZAGO_TENDENCIA):
+    """
+    Y (sin NaN) menos su tendencia lineal por fila, con la pendiente como
+    mediana de las diferencias a `rezago` meses: un cambio de nivel solo
+    afecta `rezago` de esas diferencias y casi no la mueve.
+    """
+    T = Y.shape[1]
+    if T < 2:
+        return Y
+    rezago = rezago if T > rezago else 1
+    pendiente = np.median(Y[:, rezago:] - Y[:, :-rezago], axis=1) / rezago
+    return Y - pendiente[:, None] * np.arange(T)[None, :]
+
+
+def salto_local(Y, filas, cortes, inicios, fines, ventana=VENTANA_SALTO):
+    """
+    Mediana de los `ventana` meses desde cada corte menos la de los
+    `ventana` anteriores, sin salir del segmento [inicio, fin)
+    """
+    desplazamientos = np.arange(ventana)[None, :]
+    antes = cortes[:, None] - 1 - desplazamientos
+    despues = cortes[:, None] + desplazamientos
+    f = filas[:, None]
+    valores_antes = np.where(antes >= inicios[:, None], Y[f, np.maximum(antes, 0)], np.nan)
+    valores_despues = np.where(despues < fines[:, None], Y[f, np.minimum(despues, Y.shape[1] - 1)], np.nan)
+    return _mediana(valores_despues) - _mediana(valores_antes)
+
+
+def segmentacion_binaria(Y, min_salto=MIN_SALTO, min_segmento=MIN_SEGMENTO, max_cambios=MAX_CAMBIOS,
+                         penalizacion=2.0, ventana_salto=VENTANA_SALTO):
+    """
+    Cambios de nivel de cada fila de Y (sin NaN ni tendencia) por
+    segmentación binaria.
+
+    Un corte se acepta si reduce la suma de cuadrados más que
+    `penalizacion`·σ²·log(n) (σ robusto por fila a partir de las
+    diferencias) y si el salto local en el corte (`salto_local`) es al menos
+    `min_salto`. Devuelve (fila, posición, salto, ganancia) con la posición
+    del primer mes del nuevo nivel; cada fila conserva a lo sumo
+    `max_cambios` cortes, los de mayor ganancia.
+    """
+    n, T = Y.shape
+    P1 = np.zeros((n, T + 1))
+    P2 = np.zeros((n, T + 1))
+    np.cumsum(Y, axis=1, out=P1[:, 1:])
+    np.cumsum(Y ** 2, axis=1, out=P2[:, 1:])
+    sigma = np.maximum(1.4826 * np.median(np.abs(np.diff(Y, axis=1)), axis=1) / np.sqrt(2), PISO_RUIDO) if T > 1 \
+        else np.full(n, PISO_RUIDO)
+    umbral = penalizacion * sigma ** 2 * np.log(max(T, 2))
+
+    filas, inicios, fines = np.arange(n), np.zeros(n, dtype=np.int64), np.full(n, T, dtype=np.int64)
+    cortes = []
+    while len(filas):
+        largos = fines - inicios
+        utiles = largos >= 2 * min_segmento
+        filas, inicios, fines, largos = filas[utiles], inicios[utiles], fines[utiles], largos[utiles]
+        if not len(filas):
+            break
+        # Todos los cortes de todos los segmentos activos a la vez
+        desplazamientos = np.arange(min_segmento, largos.max() - min_segmento + 1)
+        k = inicios[:, None] + desplazamientos[None, :]
+        validos = k <= (fines - min_segmento)[:, None]
+        k = np.where(validos, k, inicios[:, None] + min_segmento)
+        f = filas[:, None]
+        ganancia = (
+            _sse(P1, P2, filas, inicios, fines)[:, None]
+            - _sse(P1, P2, f, inicios[:, None], k)
+            - _sse(P1, P2, f, k, fines[:, None])
+        )
+        ganancia[~validos] = -np.inf
+        mejor = np.argmax(ganancia, axis=1)
+        rango = np.arange(len(filas))
+        corte, mejor_ganancia = k[rango, mejor], ganancia[rango, mejor]
+        salto = salto_local(Y, filas, corte, inicios, fines, ventana_salto)
+        aceptados = (mejor_ganancia > umbral[filas]) & (np.abs(salto) >= min_salto)
+        cortes.append((filas[aceptados], corte[aceptados], salto[aceptados], mejor_ganancia[aceptados]))
+
+        # Cada corte aceptado divide su segmento en dos para la ronda siguiente
+        filas = np.repeat(filas[aceptados], 2)
+        inicios, fines = (
+            np.column_stack([inicios[aceptados], corte[aceptados]]).ravel(),
+            np.column_stack([corte[aceptados], fines[aceptados]]).ravel(),
+        )
+
+    if not cortes:
+        return tuple(np.empty(0) for _ in range(4))
+    fila, posicion, salto, ganancia = (np.concatenate(partes) for partes in zip(*cortes))
+    # A lo sumo max_cambios por fila, los de mayor ganancia
+    orden = np.lexsort((-ganancia, fila))
+    fila, posicion, salto, ganancia = fila[orden], posicion[orden], salto[orden], ganancia[orden]
+    rango_fila = np.arange(len(fila)) - np.searchsorted(fila, fila)
+    conservar = rango_fila < max_cambios
+    return fila[conservar], posicion[conservar], salto[conservar], ganancia[conservar]
+
+
+# ======================== Detección ========================
+
+def _rellenar(Y):
+    """Huecos con el último valor conocido (o el primero antes del inicio)"""
+    return pd.DataFrame(Y).ffill(axis=1).bfill(axis=1).to_numpy()
+
+
+def detectar_eventos(df, columnas=('Cargo Fijo', 'Cargo por Consumo'), umbral_z=UMBRAL_Z, min_salto=MIN_SALTO,
+                     ventana=VENTANA, max_cambios=MAX_CAMBIOS):
+    """
+    Anomalías y cambios estructurales de todas las series y columnas.
+
+    Para las anomalías `Valor` es el dato observado, `Referencia` la mediana
+    móvil y `Puntaje` el z robusto; para los cambios `Valor` y `Referencia`
+    son el valor del mes del cambio y del anterior y `Puntaje` el salto en %
+    del nivel en ese mes, descontada la tendencia.
+    """
+    columnas = [c for c in columnas if c in df.columns]
+    if df.empty or not columnas:
+        return pd.DataFrame(columns=COLUMNAS_EVENTOS)
+    claves, fechas, matrices = matriz_series(df, columnas)
+
+    partes = []
+    for columna, Y in matrices.items():
+        z, mediana = z_robusto(Y, ventana)
+        anomalo = np.abs(z) > umbral_z
+        fila, mes = np.nonzero(anomalo)
+        partes.append(pd.DataFrame({
+            'fila': fila, 'Columna': columna, 'Fecha': fechas[mes], 'Tipo': ANOMALIA,
+            'Valor': Y[fila, mes], 'Referencia': mediana[fila, mes], 'Puntaje': z[fila, mes],
+        }))
+
+        # Cambios sobre la serie depurada (anomalías reemplazadas por su mediana) y sin tendencia
+        depurada = _rellenar(np.where(anomalo, mediana, Y))
+        fila, posicion, salto, _ = segmentacion_binaria(
+            quitar_tendencia(np.log1p(np.clip(depurada, 0, None))), min_salto, max_cambios=max_cambios
+        )
+        fila, posicion = fila.astype(np.int64), posicion.astype(np.int64)
+        partes.append(pd.DataFrame({
+            'fila': fila, 'Columna': columna, 'Fecha': fechas[posicion], 'Tipo': CAMBIO,
+            'Valor': depurada[fila, posicion], 'Referencia': depurada[fila, posicion - 1], 'Puntaje': np.expm1(salto) * 100,
+        }))
+
+    eventos = pd.concat(partes, ignore_index=True)
+    eventos = pd.concat([claves.iloc[eventos.pop('fila')].reset_index(drop=True), eventos], axis=1)
+    return eventos.sort_values(COLUMNAS_SERIE + ['Columna', 'Fecha'], kind='stable', ignore_index=True)[COLUMNAS_EVENTOS]
+
+
+def eventos_serie(eventos, municipio, estrato, servicio, columna='Cargo Fijo'):
+    """Eventos de una serie y columna"""
+    mascara = (
+        (eventos['Municipio'] == str(municipio)) & (eventos['Estrato'] == str(estrato))
+        & (eventos['Servicio'] == str(servicio)) & (eventos['Columna'] == columna)
+    )
+    return eventos[mascara]
+
+
+def fechas_cambio(eventos):
+    """Fechas de los cambios estructurales de una tabla de eventos"""
+    return sorted(pd.to_datetime(eventos.loc[eventos['Tipo'] == CAMBIO, 'Fecha']).unique())
+
+
+def depurar_serie(serie, eventos):
+    """Serie ds/y sin los meses marcados como anomalía"""
+    anomalos = pd.to_datetime(eventos.loc[eventos['Tipo'] == ANOMALIA, 'Fecha']).dt.to_period('M')
+    return serie[~serie['ds'].dt.to_period('M').isin(anomalos)]
+
+
+# ======================== Almacenamiento ========================
+
+def guardar_eventos(eventos, destino, tabla=TABLA_EVENTOS):
+    """
+    Guardar los eventos (reemplaza los anteriores) en un engine o URL de
+    base de datos o en un archivo .parquet o .csv.
+    """
+    if isinstance(destino, (str, os.PathLike)):
+        ruta = str(destino)
+        extension = os.path.splitext(ruta)[1].lower()
+        if extension == '.parquet':
+            return eventos.to_parquet(ruta, index=False)
+        if extension == '.csv':
+            return eventos.to_csv(ruta, index=False)
+        destino = create_engine(ruta)
+    eventos.to_sql(tabla, destino, if_exists='replace', index=False)
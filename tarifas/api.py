@@ -0,0 +1,581 @@
+"""
+API HTTP (ASGI) con las series, indicadores y pronósticos de los dashboards
+para otros sistemas (simulaciones de facturación, hojas de planeación).
+
+Usa la misma carga de datos (`datos`), el mismo índice de series y los mismos
+modelos (`modelos.pronosticar`) que `home.py` y `pages/2_Predicciones.py`,
+con el mismo tratamiento de eventos por defecto: las anomalías detectadas se
+excluyen del ajuste y los cambios estructurales se pasan a los modelos
+(`anomalias`, una detección por versión de los datos; `eventos=false` ajusta
+sobre la serie cruda).
+Las respuestas se guardan en memoria por versión de datos y parámetros y se
+sirven con ETag, de modo que los clientes revalidan con If-None-Match y
+reciben 304 sin recalcular. Los modelos se entrenan en el threadpool para no
+bloquear el event loop.
+
+Cuando la tabla se carga desde un origen, una tarea en segundo plano sigue
+la versión de los datos (`versiones`) y recarga solo los municipios que
+cambiaron; los pronósticos y las respuestas por serie usan la versión de su
+municipio, así que los de los demás municipios siguen en caché.
+
+Ejecutar con `python run_api.py` (origen de datos en TARIFAS_ORIGEN o en la
+base configurada en .env).
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from tarifas import anomalias, datos, geo, indicadores, modelos, precision, ubicacion, versiones
+from tarifas.indice import IndiceSeries
+
+MAX_RESPUESTAS_CACHE = 1024
+MAX_PRONOSTICOS_CACHE = 4096
+MAX_SERIES_LOTE = 500
+HORIZONTE_MAXIMO = 60
+MAX_PUNTOS_LOTE = 200_000
+INTERVALO_ACTUALIZACION = 1
+
+
+class _CacheLRU:
+    """Diccionario LRU acotado y seguro entre hilos"""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            if clave not in self._datos:
+                return None
+            self._datos.move_to_end(clave)
+            return self._datos[clave]
+
+    def put(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+
+# ======================== Datos ========================
+
+def cargar_indice(origen=None):
+    """Cargar la tabla compacta e indexada desde `origen` o la base configurada"""
+    origen = origen or os.getenv('TARIFAS_ORIGEN') or datos.crear_engine()
+    return IndiceSeries(datos.compactar_tarifas(datos.cargar_tarifas(origen)))
+
+
+def cargar_tabla(origen=None):
+    """Tabla versionada desde `origen` o la base configurada; se recarga por municipio al cambiar"""
+    origen = origen or os.getenv('TARIFAS_ORIGEN') or datos.crear_engine()
+    return versiones.DatosVersionados(
+        lambda municipios: datos.compactar_tarifas(datos.cargar_tarifas(origen, municipios=municipios)),
+        versiones.vigilante(origen)
+    )
+
+
+def version_datos(df):
+    """Huella de la tabla; cambia cuando cambian los datos y con ella las ETag"""
+    columnas = [c for c in ('Municipio', 'Estrato', 'Servicio', 'Periodo', 'Cargo Fijo') if c in df.columns]
+    huella = pd.util.hash_pandas_object(df[columnas], index=False).to_numpy()
+    return hashlib.sha1(huella.tobytes()).hexdigest()[:16]
+
+
+def _registros(df):
+    """DataFrame a lista de diccionarios JSON (fechas ISO y NaN como null)"""
+    df = df.copy()
+    for columna in df.select_dtypes(include='datetime').columns:
+        df[columna] = df[columna].dt.strftime('%Y-%m-%d')
+    for columna in df.select_dtypes(include='category').columns:
+        df[columna] = df[columna].astype(str)
+    for columna in df.select_dtypes(include='float32').columns:
+        df[columna] = _a_float64(df[columna].to_numpy())
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+
+def _a_float64(valores):
+    # float32 -> float64 por su representación decimal más corta (8556.37, no 8556.3701171875)
+    return valores.astype(str).astype(np.float64) if valores.dtype == np.float32 else valores.astype(np.float64)
+
+
+def _lista(valores):
+    return [None if np.isnan(v) else float(v) for v in _a_float64(np.asarray(valores))]
+
+
+def _columnas_json(df):
+    """DataFrame a un diccionario de listas por columna (más liviano que registros en lotes grandes)"""
+    resultado = {}
+    for columna in df.columns:
+        valores = df[columna]
+        if pd.api.types.is_datetime64_any_dtype(valores):
+            resultado[columna] = valores.dt.strftime('%Y-%m-%d').astype(object).where(valores.notna(), None).tolist()
+        elif pd.api.types.is_float_dtype(valores):
+            resultado[columna] = _lista(valores.to_numpy())
+        else:
+            resultado[columna] = valores.astype(object).where(valores.notna(), None).tolist()
+    return resultado
+
+
+# ======================== Consultas ========================
+
+def listar_series(indice):
+    """Opciones de filtros y resumen de cada serie disponible"""
+    return {
+        'municipios': [str(m) for m in indice.municipios],
+        'estratos': [str(e) for e in indice.estratos],
+        'servicios': [str(s) for s in indice.servicios],
+        'años': [int(a) for a in indice.años],
+        'modelos': modelos.MODELOS_DISPONIBLES,
+        'series': _registros(indice.resumen()),
+    }
+
+
+def datos_serie(indice, municipio, estrato, servicio, columnas):
+    """Observaciones de una serie ordenadas por fecha"""
+    df_serie = indice.serie(municipio, estrato, servicio)
+    if df_serie.empty:
+        raise KeyError(f"No existe la serie {municipio} / {estrato} / {servicio}")
+    return {
+        'municipio': municipio, 'estrato': estrato, 'servicio': servicio,
+        'datos': _registros(df_serie[['Fecha'] + columnas]),
+    }
+
+
+def indicadores_municipios(df, municipios, anno_inicio, anno_fin, columnas):
+    """Tarifa promedio e indicadores promedio por municipio en un rango de años"""
+    df_periodo = df[(df['Año'] >= anno_inicio) & (df['Año'] <= anno_fin)]
+    if municipios:
+        df_periodo = df_periodo[df_periodo['Municipio'].isin(municipios)]
+    resultado = indicadores.tarifa_promedio_municipio(df_periodo, anno_inicio, anno_fin).merge(
+        indicadores.indicadores_por_municipio(df_periodo, columnas), on='Municipio'
+    )
+    return {'desde': anno_inicio, 'hasta': anno_fin, 'municipios': _registros(resultado)}
+
+
+def pronostico_serie(indice, municipio, estrato, servicio, modelo, horizonte, nivel_confianza, columna='Cargo Fijo',
+                     eventos=None):
+    """
+    Pronóstico de un modelo para una serie con sus intervalos. Con `eventos`
+    (la tabla de `anomalias.detectar_eventos`) se ajusta como en las páginas:
+    sin las anomalías de la serie y con sus cambios estructurales.
+    """
+    df_serie = indice.serie(municipio, estrato, servicio)
+    if df_serie.empty:
+        raise KeyError(f"No existe la serie {municipio} / {estrato} / {servicio}")
+    serie = modelos.preparar_serie(df_serie, columna)
+    cambios = None
+    if eventos is not None:
+        eventos = anomalias.eventos_serie(eventos, municipio, estrato, servicio, columna)
+        serie = anomalias.depurar_serie(serie, eventos)
+        cambios = anomalias.fechas_cambio(eventos)
+    frecuencia = modelos.inferir_frecuencia(serie['ds'])
+    pred, inf, sup = modelos.pronosticar(serie, modelo, horizonte, nivel_confianza, frecuencia, cambios)
+    fechas = modelos.fechas_futuras(serie['ds'], horizonte, frecuencia)
+    precision.registrar_pronostico(municipio, estrato, servicio, modelo, serie, fechas, pred, inf, sup,
+                                   nivel_confianza, columna, fuente='api', variante='eventos' if eventos is not None else '')
+    return {
+        'municipio': municipio, 'estrato': estrato, 'servicio': servicio, 'columna': columna,
+        'modelo': modelo, 'horizonte': horizonte, 'nivel_confianza': nivel_confianza, 'eventos': eventos is not None,
+        'fechas': [f.strftime('%Y-%m-%d') for f in fechas],
+        'prediccion': _lista(pred), 'inferior': _lista(inf), 'superior': _lista(sup),
+    }
+
+
+def tarifas_ubicaciones(estado, lat, lon, estrato, servicio, parametros_pronostico=None):
+    """
+    Municipio, tarifa vigente y (opcional) pronosticada de cada punto.
+
+    Los puntos se ubican con una sola consulta al STRtree de municipios y los
+    pronósticos se calculan solo para los municipios encontrados, con la
+    misma caché por serie que `/pronosticos`.
+    """
+    localizador = _localizador(estado)
+    posiciones = localizador.localizar(lat, lon)
+    vigentes = ubicacion.tarifas_vigentes(estado.indice, estrato, servicio)
+    pronosticos = None
+    if parametros_pronostico is not None:
+        modelo, horizonte, nivel_confianza = parametros_pronostico
+
+        def pronostico(municipio, columna):
+            resultado = _pronostico_cacheado(
+                estado, (municipio, estrato, servicio), modelo, horizonte, nivel_confianza, columna
+            )
+            return pd.Timestamp(resultado['fechas'][-1]), resultado['prediccion'][-1]
+
+        pronosticos = ubicacion.pronosticos_municipios(
+            ubicacion.municipios_localizados(localizador, vigentes, posiciones), ubicacion.COLUMNAS_TARIFA, pronostico
+        )
+    # Se serializa la tabla por polígono y cada punto toma su valor ya convertido
+    tabla = ubicacion.tabla_poligonos(localizador, vigentes, pronosticos)
+    tabla = tabla.rename(columns={'MpNombre': 'municipio_poligono', 'Municipio': 'municipio'})
+    columnas = {
+        columna: np.array(valores, dtype=object)[posiciones].tolist()
+        for columna, valores in _columnas_json(tabla).items()
+    }
+    return {
+        'estrato': estrato, 'servicio': servicio, 'puntos': len(posiciones),
+        'sin_municipio': int((posiciones < 0).sum()),
+        'modelo': parametros_pronostico[0] if parametros_pronostico else None,
+        'horizonte': parametros_pronostico[1] if parametros_pronostico else None,
+        **columnas,
+    }
+
+
+def _localizador(estado):
+    """STRtree de municipios, construido en la primera consulta por ubicación"""
+    with estado.lock_localizador:
+        if estado.localizador is None:
+            ruta = os.getenv('TARIFAS_MUNICIPIOS', geo.RUTA_MUNICIPIOS)
+            if not os.path.exists(ruta):
+                raise HTTPException(503, f"No se encontró el shapefile de municipios: {ruta}")
+            estado.localizador = ubicacion.LocalizadorMunicipios(geo.cargar_municipios(ruta))
+        return estado.localizador
+
+
+# ======================== Validación de parámetros ========================
+
+def _entero(valor, nombre, minimo, maximo, defecto):
+    if valor is None:
+        return defecto
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        raise HTTPException(400, f"'{nombre}' debe ser un entero")
+    if not minimo <= valor <= maximo:
+        raise HTTPException(400, f"'{nombre}' debe estar entre {minimo} y {maximo}")
+    return valor
+
+
+def _clave_serie(parametros):
+    try:
+        return str(parametros['municipio']), str(parametros['estrato']), str(parametros['servicio'])
+    except KeyError as e:
+        raise HTTPException(400, f"Falta el parámetro {e}")
+
+
+def _columnas(df, nombres, defecto):
+    columnas = nombres or defecto
+    desconocidas = [c for c in columnas if c not in df.columns]
+    if desconocidas:
+        raise HTTPException(400, f"Columnas desconocidas: {desconocidas}")
+    return columnas
+
+
+def _columnas_indicador(tipo):
+    if not tipo:
+        return indicadores.COLUMNAS_INDICADORES
+    for nombre, columnas in indicadores.INDICADORES_CLAVE.items():
+        if nombre.split(' ')[0] == tipo.upper():
+            return columnas
+    raise HTTPException(400, f"Tipo de indicador desconocido: {tipo}")
+
+
+def _parametros_pronostico(parametros):
+    modelo = parametros.get('modelo', 'Prophet')
+    if modelo not in modelos.MODELOS_DISPONIBLES:
+        raise HTTPException(400, f"Modelo desconocido: {modelo}")
+    return (
+        modelo,
+        _entero(parametros.get('horizonte'), 'horizonte', 1, HORIZONTE_MAXIMO, 12),
+        _entero(parametros.get('nivel_confianza'), 'nivel_confianza', 50, 99, 95),
+    )
+
+
+def _coordenadas(lat, lon):
+    try:
+        lat = np.asarray(lat, dtype=float).reshape(-1)
+        lon = np.asarray(lon, dtype=float).reshape(-1)
+    except (TypeError, ValueError):
+        raise HTTPException(400, "'lat' y 'lon' deben ser números")
+    if len(lat) != len(lon) or not len(lat):
+        raise HTTPException(400, "'lat' y 'lon' deben tener la misma longitud (no vacía)")
+    if len(lat) > MAX_PUNTOS_LOTE:
+        raise HTTPException(400, f"Máximo {MAX_PUNTOS_LOTE} puntos por solicitud")
+    return lat, lon
+
+
+def _estrato_servicio(indice, parametros):
+    # Los valores del índice pueden no ser texto (p. ej. estratos numéricos)
+    estratos = {str(e): e for e in indice.estratos}
+    servicios = {str(s): s for s in indice.servicios}
+    estrato = str(parametros.get('estrato', ''))
+    servicio = str(parametros.get('servicio', ''))
+    if estrato not in estratos:
+        raise HTTPException(400, f"Estrato desconocido: {estrato}")
+    if servicio not in servicios:
+        raise HTTPException(400, f"Servicio desconocido: {servicio}")
+    return estratos[estrato], servicios[servicio]
+
+
+def _bandera(parametros, nombre):
+    valor = parametros.get(nombre, True)
+    return valor if isinstance(valor, bool) else str(valor).lower() not in ('0', 'false', 'no')
+
+
+def _con_pronostico(parametros):
+    return _bandera(parametros, 'pronostico')
+
+
+def _con_eventos(parametros):
+    return _bandera(parametros, 'eventos')
+
+
+async def _cuerpo(request):
+    try:
+        cuerpo = await request.json()
+    except json.JSONDecodeError:
+        raise HTTPException(400, "El cuerpo debe ser JSON")
+    if not isinstance(cuerpo, dict):
+        raise HTTPException(400, "El cuerpo debe ser un objeto JSON")
+    return cuerpo
+
+
+def _series_lote(cuerpo):
+    series = cuerpo.get('series')
+    if not isinstance(series, list) or not series:
+        raise HTTPException(400, "'series' debe ser una lista no vacía")
+    if len(series) > MAX_SERIES_LOTE:
+        raise HTTPException(400, f"Máximo {MAX_SERIES_LOTE} series por solicitud")
+    return [_clave_serie(s) for s in series]
+
+
+# ======================== Caché y ETag ========================
+
+def _version_serie(estado, municipio):
+    """Versión de los datos de un municipio (la global si la tabla no se sigue)"""
+    if estado.tabla is None:
+        return estado.version
+    return ('municipio', estado.tabla.version_municipio(municipio))
+
+
+def _eventos(estado):
+    """Anomalías y cambios estructurales de todas las series, detectados una vez por versión de los datos"""
+    with estado.lock_eventos:
+        if estado.eventos is None or estado.eventos[0] != estado.version:
+            estado.eventos = (estado.version, anomalias.detectar_eventos(estado.indice.df))
+        return estado.eventos[1]
+
+
+def _pronostico_cacheado(estado, clave, modelo, horizonte, nivel_confianza, columna, usar_eventos=True):
+    """Pronóstico de una serie reutilizando los ya calculados (también en lotes)"""
+    clave_cache = (_version_serie(estado, clave[0]), clave, modelo, horizonte, nivel_confianza, columna, usar_eventos)
+    resultado = estado.pronosticos.get(clave_cache)
+    if resultado is None:
+        resultado = pronostico_serie(estado.indice, *clave, modelo, horizonte, nivel_confianza, columna,
+                                     _eventos(estado) if usar_eventos else None)
+        estado.pronosticos.put(clave_cache, resultado)
+    return resultado
+
+
+async def _responder(request, calcular, cuerpo=None, version=None):
+    """Respuesta JSON cacheada por versión de datos (o `version`) y parámetros, con ETag"""
+    estado = request.app.state
+    clave = (
+        estado.version if version is None else version, request.method, request.url.path,
+        tuple(sorted(request.query_params.multi_items())),
+        json.dumps(cuerpo, sort_keys=True, ensure_ascii=False) if cuerpo is not None else None,
+    )
+    guardado = estado.respuestas.get(clave)
+    if guardado is None:
+        try:
+            contenido = await run_in_threadpool(calcular)
+        except KeyError as e:
+            raise HTTPException(404, e.args[0])
+        texto = json.dumps(contenido, ensure_ascii=False, allow_nan=False).encode('utf-8')
+        guardado = (f'"{hashlib.sha1(texto).hexdigest()[:20]}"', texto)
+        estado.respuestas.put(clave, guardado)
+
+    etag, texto = guardado
+    encabezados = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=encabezados)
+    return Response(texto, media_type='application/json', headers=encabezados)
+
+
+# ======================== Endpoints ========================
+
+async def error_http(request, exc):
+    return JSONResponse({'error': exc.detail}, status_code=exc.status_code)
+
+
+async def salud(request):
+    estado = request.app.state
+    return JSONResponse({'estado': 'ok', 'version': estado.version, 'series': len(estado.indice), 'filas': len(estado.indice.df)})
+
+
+async def series(request):
+    return await _responder(request, lambda: listar_series(request.app.state.indice))
+
+
+async def serie_datos(request):
+    indice = request.app.state.indice
+    columnas = _columnas(indice.df, request.query_params.getlist('columna'), ['Cargo Fijo', 'Cargo por Consumo'])
+    clave = _clave_serie(request.query_params)
+    return await _responder(
+        request, lambda: datos_serie(indice, *clave, columnas), version=_version_serie(request.app.state, clave[0])
+    )
+
+
+async def series_datos_lote(request):
+    indice = request.app.state.indice
+    cuerpo = await _cuerpo(request)
+    claves = _series_lote(cuerpo)
+    columnas = _columnas(indice.df, cuerpo.get('columnas'), ['Cargo Fijo', 'Cargo por Consumo'])
+
+    def calcular():
+        resultados = []
+        for clave in claves:
+            try:
+                resultados.append(datos_serie(indice, *clave, columnas))
+            except KeyError as e:
+                resultados.append({'municipio': clave[0], 'estrato': clave[1], 'servicio': clave[2], 'error': e.args[0]})
+        return {'series': resultados}
+
+    return await _responder(request, calcular, cuerpo)
+
+
+async def indicadores_municipio(request):
+    indice = request.app.state.indice
+    parametros = request.query_params
+    años = indice.años or [0]
+    anno_inicio = _entero(parametros.get('desde'), 'desde', 1900, 2100, int(años[0]))
+    anno_fin = _entero(parametros.get('hasta'), 'hasta', 1900, 2100, int(años[-1]))
+    columnas = _columnas_indicador(parametros.get('tipo'))
+    municipios = parametros.getlist('municipio')
+    return await _responder(request, lambda: indicadores_municipios(indice.df, municipios, anno_inicio, anno_fin, columnas))
+
+
+async def pronostico(request):
+    estado = request.app.state
+    parametros = request.query_params
+    clave = _clave_serie(parametros)
+    modelo, horizonte, nivel_confianza = _parametros_pronostico(parametros)
+    columna = _columnas(estado.indice.df, [parametros.get('columna', 'Cargo Fijo')], None)[0]
+    usar_eventos = _con_eventos(parametros)
+    return await _responder(
+        request, lambda: _pronostico_cacheado(estado, clave, modelo, horizonte, nivel_confianza, columna, usar_eventos),
+        version=_version_serie(estado, clave[0])
+    )
+
+
+async def pronosticos_lote(request):
+    estado = request.app.state
+    cuerpo = await _cuerpo(request)
+    claves = _series_lote(cuerpo)
+    modelos_lote = cuerpo.get('modelos') or [cuerpo.get('modelo', 'Prophet')]
+    parametros = [_parametros_pronostico({**cuerpo, 'modelo': m}) for m in modelos_lote]
+    columna = _columnas(estado.indice.df, [cuerpo.get('columna', 'Cargo Fijo')], None)[0]
+    usar_eventos = _con_eventos(cuerpo)
+
+    def calcular():
+        resultados = []
+        for clave in claves:
+            for modelo, horizonte, nivel_confianza in parametros:
+                try:
+                    resultados.append(_pronostico_cacheado(
+                        estado, clave, modelo, horizonte, nivel_confianza, columna, usar_eventos
+                    ))
+                except Exception as e:
+                    resultados.append({
+                        'municipio': clave[0], 'estrato': clave[1], 'servicio': clave[2],
+                        'modelo': modelo, 'error': str(e.args[0]) if e.args else type(e).__name__
+                    })
+        return {'pronosticos': resultados}
+
+    return await _responder(request, calcular, cuerpo)
+
+
+async def ubicacion_tarifas(request):
+    estado = request.app.state
+    parametros = request.query_params
+    lat, lon = _coordenadas(parametros.get('lat'), parametros.get('lon'))
+    estrato, servicio = _estrato_servicio(estado.indice, parametros)
+    pronostico_ = _parametros_pronostico(parametros) if _con_pronostico(parametros) else None
+    return await _responder(request, lambda: tarifas_ubicaciones(estado, lat, lon, estrato, servicio, pronostico_))
+
+
+async def ubicaciones_lote(request):
+    # Sin caché de respuesta: los lotes pueden tener cientos de miles de
+    # puntos; los pronósticos por serie sí se reutilizan
+    estado = request.app.state
+    cuerpo = await _cuerpo(request)
+    lat, lon = _coordenadas(cuerpo.get('lat'), cuerpo.get('lon'))
+    estrato, servicio = _estrato_servicio(estado.indice, cuerpo)
+    pronostico_ = _parametros_pronostico(cuerpo) if _con_pronostico(cuerpo) else None
+    contenido = await run_in_threadpool(tarifas_ubicaciones, estado, lat, lon, estrato, servicio, pronostico_)
+    texto = json.dumps(contenido, ensure_ascii=False, allow_nan=False).encode('utf-8')
+    return Response(texto, media_type='application/json')
+
+
+def crear_app(indice=None, origen=None, localizador=None):
+    """
+    Crear la aplicación ASGI. Con `indice` se usa una tabla ya cargada; si
+    no, se carga al iniciar desde `origen` (TARIFAS_ORIGEN o la base). Sin
+    `localizador`, los polígonos de municipios (TARIFAS_MUNICIPIOS o
+    `geo.RUTA_MUNICIPIOS`) se cargan en la primera consulta por ubicación.
+    """
+    async def seguir_version(estado):
+        while True:
+            await asyncio.sleep(INTERVALO_ACTUALIZACION)
+            try:
+                cambiados = await run_in_threadpool(estado.tabla.actualizar)
+            except Exception:
+                continue
+            if cambiados:
+                estado.indice = estado.tabla.indice
+                estado.version = version_datos(estado.indice.df)
+                # Meses reales nuevos: errores de los pronósticos servidos antes
+                try:
+                    await run_in_threadpool(precision.almacen().actualizar, estado.indice.df)
+                except Exception:
+                    pass
+
+    @asynccontextmanager
+    async def ciclo_vida(app):
+        app.state.tabla = None if indice is not None else await run_in_threadpool(cargar_tabla, origen)
+        app.state.indice = indice if indice is not None else app.state.tabla.indice
+        app.state.version = version_datos(app.state.indice.df)
+        app.state.respuestas = _CacheLRU(MAX_RESPUESTAS_CACHE)
+        app.state.pronosticos = _CacheLRU(MAX_PRONOSTICOS_CACHE)
+        app.state.localizador = localizador
+        app.state.eventos = None
+        app.state.lock_eventos = threading.Lock()
+        app.state.lock_localizador = threading.Lock()
+        tarea = asyncio.create_task(seguir_version(app.state)) if app.state.tabla is not None else None
+        yield
+        if tarea is not None:
+            tarea.cancel()
+
+    return Starlette(routes=[
+        Route('/salud', salud),
+        Route('/series', series),
+        Route('/series/datos', serie_datos),
+        Route('/series/datos/lote', series_datos_lote, methods=['POST']),
+        Route('/indicadores', indicadores_municipio),
+        Route('/pronosticos', pronostico),
+        Route('/pronosticos/lote', pronosticos_lote, methods=['POST']),
+        Route('/ubicacion/tarifas', ubicacion_tarifas),
+        Route('/ubicacion/tarifas/lote', ubicaciones_lote, methods=['POST']),
+    ], exception_handlers={HTTPException: error_http}, lifespan=ciclo_vida)
+
+
+app = crear_app()
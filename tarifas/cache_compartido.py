@@ -0,0 +1,200 @@
+"""
+Caché en disco compartida entre los procesos del dashboard.
+
+Con varios trabajadores de Streamlit (`run_dashboard.py --trabajadores N`)
+cada proceso tiene su propia memoria y sus propias cachés de Streamlit; esta
+caché guarda en un directorio común (TARIFAS_CACHE_DIR) los pronósticos y
+otros resultados, de modo que lo que calcula un trabajador lo reutilizan
+los demás (la tabla se comparte mapeada en memoria, ver `tabla_compartida`). Cada valor es un archivo pickle escrito de forma atómica (archivo
+temporal + `os.replace`); las claves llevan la versión de los datos
+(`versiones`), así que un cambio no deja valores viejos a la vista. Cuando
+el directorio supera `max_bytes` se borran los archivos usados hace más
+tiempo. Como los valores se leen con pickle, el directorio debe ser del
+usuario del proceso y nadie más puede escribir en él (`directorio_privado`).
+Como la caché borra lo que hay en el directorio, solo se usa uno vacío, que
+queda marcado con el archivo MARCA, o uno ya marcado (`marcar_directorio`).
+
+Sin TARIFAS_CACHE_DIR (un solo proceso) `memorizar` calcula directamente y
+las páginas dependen solo de las cachés de Streamlit.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import stat
+import tempfile
+import threading
+
+ENTORNO_DIRECTORIO = 'TARIFAS_CACHE_DIR'
+MAX_BYTES = 2 * 1024 ** 3
+# Archivo que identifica un directorio creado por la caché
+MARCA = '.tarifas_cache'
+
+logger = logging.getLogger(__name__)
+
+
+def directorio_privado(directorio):
+    """
+    Crear `directorio` con modo 0700, o comprobar que el existente es un
+    directorio del usuario actual en el que nadie más puede escribir
+    """
+    os.makedirs(directorio, mode=0o700, exist_ok=True)
+    estado = os.lstat(directorio)
+    if not stat.S_ISDIR(estado.st_mode):
+        raise PermissionError(f"{directorio} no es un directorio")
+    if hasattr(os, 'getuid') and (estado.st_uid != os.getuid() or estado.st_mode & 0o022):
+        raise PermissionError(
+            f"El directorio de la caché {directorio} no es privado "
+            f"(dueño {estado.st_uid}, modo {oct(stat.S_IMODE(estado.st_mode))})"
+        )
+    return directorio
+
+
+def marcar_directorio(directorio):
+    """
+    Marcar `directorio` como caché si está vacío, o comprobar que ya lo
+    está; un directorio con otros archivos se rechaza para no borrarlos
+    """
+    contenido = os.listdir(directorio)
+    if MARCA in contenido:
+        return directorio
+    if contenido:
+        raise PermissionError(
+            f"{directorio} no está vacío y no es un directorio de caché (falta {MARCA}); "
+            "use un directorio nuevo o vacío"
+        )
+    with open(os.path.join(directorio, MARCA), 'a'):
+        pass
+    return directorio
+
+
+class CacheDisco:
+    """Valores pickle por (espacio, clave) en un directorio compartido"""
+
+    def __init__(self, directorio, max_bytes=MAX_BYTES):
+        self.directorio = str(directorio)
+        self.max_bytes = max_bytes
+        self._escritos = 0
+        self._lock = threading.Lock()
+        marcar_directorio(directorio_privado(self.directorio))
+
+    def _ruta(self, espacio, clave):
+        huella = hashlib.sha1(repr(clave).encode('utf-8')).hexdigest()
+        return os.path.join(self.directorio, espacio, f"{huella}.pkl")
+
+    def obtener(self, espacio, clave, defecto=None):
+        ruta = self._ruta(espacio, clave)
+        try:
+            with open(ruta, 'rb') as archivo:
+                valor = pickle.load(archivo)
+        except FileNotFoundError:
+            return defecto
+        except Exception as e:
+            # Archivo truncado o de otra versión de las librerías: se recalcula
+            logger.warning("Entrada de caché ilegible %s: %s", ruta, e)
+            return defecto
+        try:
+            os.utime(ruta)
+        except OSError:
+            pass
+        return valor
+
+    def guardar(self, espacio, clave, valor):
+        ruta = self._ruta(espacio, clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as archivo:
+                pickle.dump(valor, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, ruta)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+        with self._lock:
+            self._escritos += os.path.getsize(ruta)
+            if self._escritos > self.max_bytes // 10:
+                self._escritos = 0
+                self.limpiar()
+
+    def memorizar(self, espacio, clave, calcular):
+        """Valor guardado para (espacio, clave) o el resultado de `calcular()`, que se guarda"""
+        marca = object()
+        valor = self.obtener(espacio, clave, marca)
+        if valor is marca:
+            valor = calcular()
+            try:
+                self.guardar(espacio, clave, valor)
+            except Exception as e:
+                logger.warning("No se pudo guardar en la caché %s: %s", espacio, e)
+        return valor
+
+    def limpiar(self):
+        """Borrar los archivos usados hace más tiempo hasta quedar bajo `max_bytes`"""
+        archivos = []
+        for raiz, directorios, nombres in os.walk(self.directorio):
+            # Las tablas mapeadas en memoria se reemplazan completas (tabla_compartida)
+            if raiz == self.directorio and 'tablas' in directorios:
+                directorios.remove('tablas')
+            for nombre in nombres:
+                if raiz == self.directorio and nombre == MARCA:
+                    continue
+                ruta = os.path.join(raiz, nombre)
+                try:
+                    estado = os.stat(ruta)
+                except OSError:
+                    continue
+                archivos.append((estado.st_mtime, estado.st_size, ruta))
+        total = sum(tamaño for _, tamaño, _ in archivos)
+        for _, tamaño, ruta in sorted(archivos):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(ruta)
+                total -= tamaño
+            except OSError:
+                pass
+
+    def vaciar(self):
+        """Borrar todo el contenido del directorio (se conservan el directorio y su marca)"""
+        for nombre in os.listdir(self.directorio):
+            if nombre == MARCA:
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            if os.path.isdir(ruta) and not os.path.islink(ruta):
+                shutil.rmtree(ruta, ignore_errors=True)
+            else:
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+
+
+_cache = None
+_directorio = None
+
+
+def cache_compartido():
+    """Caché del directorio TARIFAS_CACHE_DIR, o None si no está configurado"""
+    global _cache, _directorio
+    directorio = os.getenv(ENTORNO_DIRECTORIO)
+    if directorio != _directorio:
+        _directorio = directorio
+        _cache = None
+        if directorio:
+            try:
+                _cache = CacheDisco(directorio)
+            except PermissionError as e:
+                # Sin la caché compartida cada proceso calcula lo suyo
+                logger.error("Caché compartida desactivada: %s", e)
+    return _cache
+
+
+def memorizar(espacio, clave, calcular):
+    """`calcular()` a través de la caché compartida si está configurada"""
+    cache = cache_compartido()
+    if cache is None:
+        return calcular()
+    return cache.memorizar(espacio, clave, calcular)
@@ -0,0 +1,258 @@
+"""
+Revisión de calidad de la tabla de tarifas, columna por columna.
+
+La tabla (DataFrame o filas de un cursor) se convierte una sola vez a una
+tabla Arrow y cada chequeo es una operación vectorizada de `pyarrow.compute`
+sobre columnas completas: codificación, nulos, cargos negativos, claves
+(Municipio, Estrato, Servicio, Fecha) duplicadas, meses faltantes por serie
+y formatos mezclados en `Fecha` (que es texto en la tabla
+`_ing_caracteristicas`). Solo las columnas que Arrow no puede convertir
+(textos con caracteres inválidos o tipos mezclados) se recorren en Python.
+
+El resultado es un reporte (DataFrame) con una fila por hallazgo; se usa
+antes de migrar la base (`migrate_db.py`, `check_data_quality.py`) y al
+cargar el dashboard principal.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from tarifas.indicadores import COLUMNAS_PENALIZACION
+
+ERROR = 'error'
+ADVERTENCIA = 'advertencia'
+COLUMNAS_REPORTE = ['Chequeo', 'Columna', 'Severidad', 'Filas', 'Ejemplo']
+
+COLUMNAS_CLAVE = ['Municipio', 'Estrato', 'Servicio', 'Fecha']
+COLUMNAS_CARGO = ['Cargo Fijo', 'Cargo por Consumo', 'Cargo por Consumo Menor', 'Cargo por Consumo Mayor'] \
+    + COLUMNAS_PENALIZACION
+
+# Formatos de fecha reconocidos en columnas de texto: nombre -> (patrón, formato de strptime)
+FORMATOS_FECHA = {
+    'AAAA-MM-DD': (r'^\d{4}-\d{2}-\d{2}$', '%Y-%m-%d'),
+    'AAAA-MM-DD hh:mm:ss': (r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}$', None),
+    'DD/MM/AAAA': (r'^\d{2}/\d{2}/\d{4}$', '%d/%m/%Y'),
+    'AAAA/MM/DD': (r'^\d{4}/\d{2}/\d{2}$', '%Y/%m/%d'),
+    'Serial de Excel': (r'^\d{5}(\.0+)?$', None),
+}
+# Secuencias típicas de UTF-8 leído como Latin-1 ("MedellÃ­n") y el carácter de reemplazo
+PATRON_MOJIBAKE = 'Ã[\u0080-¿]|Â[\u0080-¿]|�'
+
+
+def _hallazgo(chequeo, columna, severidad, filas, ejemplo=None):
+    return {'Chequeo': chequeo, 'Columna': columna, 'Severidad': severidad, 'Filas': int(filas),
+            'Ejemplo': '' if ejemplo is None else str(ejemplo)}
+
+
+# ======================== Conversión a Arrow ========================
+
+def _columna_arrow(nombre, valores, hallazgos):
+    """
+    Arreglo Arrow de una columna. Si Arrow no la puede convertir de una vez
+    se registran los textos con caracteres inválidos o los tipos mezclados
+    y la columna queda como texto.
+    """
+    try:
+        if isinstance(valores, np.ndarray) and valores.dtype == object and _es_numerica(valores):
+            # Números de Python (filas de un cursor): conversión en C sin pasar por Arrow
+            valores = valores.astype(float)
+        arreglo = valores if isinstance(valores, (pa.Array, pa.ChunkedArray)) else pa.array(valores, from_pandas=True)
+        # Los categóricos llegan como diccionario; los chequeos trabajan sobre sus valores
+        if pa.types.is_dictionary(arreglo.type):
+            arreglo = pc.cast(arreglo, arreglo.type.value_type)
+        return arreglo
+    except (pa.ArrowException, UnicodeEncodeError, TypeError, ValueError):
+        pass
+
+    serie = pd.Series(valores, dtype=object)
+    tipos = serie.map(lambda v: None if v is None or v is pd.NaT or (isinstance(v, float) and np.isnan(v))
+                      else type(v).__name__).dropna()
+    conteo = tipos.value_counts()
+    if len(conteo) > 1:
+        hallazgos.append(_hallazgo('Tipos mezclados', nombre, ERROR if nombre == 'Fecha' else ADVERTENCIA,
+                                   len(tipos) - conteo.iloc[0], ', '.join(f"{t}: {n:,}" for t, n in conteo.items())))
+
+    textos = serie.where(serie.isna(), serie.astype(str))
+    invalidos = textos.map(lambda v: isinstance(v, str) and not v.isascii() and _tiene_sustitutos(v))
+    if invalidos.any():
+        posiciones = np.flatnonzero(invalidos.to_numpy())
+        hallazgos.append(_hallazgo('Codificación inválida', nombre, ERROR, len(posiciones),
+                                   f"fila {posiciones[0]}: {textos.iloc[posiciones[0]]!r}"))
+        textos[invalidos] = textos[invalidos].str.encode('utf-8', 'replace').str.decode('utf-8')
+    return pa.array(textos, type=pa.string(), from_pandas=True)
+
+
+def _es_numerica(valores):
+    """Si el primer valor no nulo de una columna de objetos es un número"""
+    for valor in valores:
+        if valor is not None:
+            return isinstance(valor, (int, float, np.number)) and not isinstance(valor, bool)
+    return False
+
+
+def _tiene_sustitutos(texto):
+    try:
+        texto.encode('utf-8')
+        return False
+    except UnicodeEncodeError:
+        return True
+
+
+def tabla_arrow(datos, columnas=None, hallazgos=None):
+    """
+    Tabla Arrow a partir de un DataFrame, una tabla Arrow o una lista de
+    filas (tuplas, como las de `cursor.fetchall()`) con sus `columnas`.
+    """
+    hallazgos = [] if hallazgos is None else hallazgos
+    if isinstance(datos, pa.Table):
+        return datos
+    if isinstance(datos, pd.DataFrame):
+        columnas = [str(c) for c in datos.columns]
+        valores = [datos.iloc[:, i] for i in range(datos.shape[1])]
+    else:
+        matriz = np.empty((len(datos), len(columnas)), dtype=object)
+        if len(datos):
+            matriz[:] = datos
+        valores = [matriz[:, i] for i in range(len(columnas))]
+    return pa.table({nombre: _columna_arrow(nombre, v, hallazgos) for nombre, v in zip(columnas, valores)})
+
+
+# ======================== Fechas ========================
+
+def fechas_arrow(columna):
+    """
+    (fechas como timestamp, {formato: filas}) de una columna de fechas; los
+    textos se interpretan con cada formato de FORMATOS_FECHA y los que no
+    coinciden con ninguno quedan nulos.
+    """
+    if pa.types.is_timestamp(columna.type):
+        return columna, {'timestamp': len(columna) - columna.null_count}
+    if pa.types.is_date(columna.type):
+        return pc.cast(columna, pa.timestamp('s')), {'fecha': len(columna) - columna.null_count}
+    if not pa.types.is_string(columna.type) and not pa.types.is_large_string(columna.type):
+        columna = pc.cast(columna, pa.string())
+
+    texto = pc.utf8_trim_whitespace(columna)
+    # Camino rápido: toda la columna en el primer formato
+    nombre, (_, formato) = next(iter(FORMATOS_FECHA.items()))
+    fechas = pc.strptime(texto, format=formato, unit='s', error_is_null=True)
+    if fechas.null_count == texto.null_count:
+        return fechas, {nombre: len(texto) - texto.null_count}
+
+    formatos, partes = {}, []
+    for nombre, (patron, formato) in FORMATOS_FECHA.items():
+        coincide = pc.match_substring_regex(texto, patron)
+        filas = pc.sum(coincide).as_py() or 0
+        if not filas:
+            continue
+        formatos[nombre] = filas
+        if nombre == 'Serial de Excel':
+            dias = pc.cast(pc.cast(pc.if_else(coincide, texto, None), pa.float64()), pa.int64())
+            segundos = pc.multiply(pc.subtract(dias, 25569), 86400)
+            partes.append(pc.cast(segundos, pa.timestamp('s')))
+        elif formato is None:
+            partes.append(pc.cast(pc.utf8_slice_codeunits(pc.if_else(coincide, texto, None), 0, 10), pa.date32()))
+        else:
+            partes.append(pc.strptime(pc.if_else(coincide, texto, None), format=formato, unit='s', error_is_null=True))
+    partes = [pc.cast(p, pa.timestamp('s')) for p in partes]
+    fechas = pc.coalesce(*partes) if partes else pa.nulls(len(columna), pa.timestamp('s'))
+    return fechas, formatos
+
+
+# ======================== Revisión ========================
+
+def revisar_tabla(datos, columnas=None, claves=COLUMNAS_CLAVE):
+    """
+    Reporte de calidad (COLUMNAS_REPORTE) de un DataFrame, una tabla Arrow o
+    una lista de filas con sus `columnas`.
+    """
+    hallazgos = []
+    tabla = tabla_arrow(datos, columnas, hallazgos)
+    n = tabla.num_rows
+
+    for nombre in tabla.column_names:
+        columna = tabla[nombre]
+        tipo = columna.type
+
+        # Nulos (y NaN en columnas numéricas)
+        nulos = columna.null_count
+        if pa.types.is_floating(tipo):
+            nulos += pc.sum(pc.is_nan(columna)).as_py() or 0
+        if nulos:
+            hallazgos.append(_hallazgo('Nulos', nombre, ERROR if nombre in claves else ADVERTENCIA, nulos))
+
+        # Texto mal decodificado
+        if (pa.types.is_string(tipo) or pa.types.is_large_string(tipo)) and not pc.all(pc.string_is_ascii(columna)).as_py():
+            mojibake = pc.match_substring_regex(columna, PATRON_MOJIBAKE)
+            filas = pc.sum(mojibake).as_py() or 0
+            if filas:
+                ejemplo = pc.filter(columna, mojibake)[0].as_py()
+                hallazgos.append(_hallazgo('Codificación sospechosa', nombre, ADVERTENCIA, filas, ejemplo))
+
+        # Cargos negativos
+        if nombre in COLUMNAS_CARGO and (pa.types.is_integer(tipo) or pa.types.is_floating(tipo)):
+            negativos = pc.less(columna, 0)
+            filas = pc.sum(negativos).as_py() or 0
+            if filas:
+                hallazgos.append(_hallazgo('Cargos negativos', nombre, ERROR, filas, pc.min(columna).as_py()))
+
+    if 'Fecha' in tabla.column_names:
+        fechas, formatos = fechas_arrow(tabla['Fecha'])
+        if len(formatos) > 1:
+            hallazgos.append(_hallazgo('Formatos de fecha mezclados', 'Fecha', ADVERTENCIA,
+                                       n - max(formatos.values()), ', '.join(f"{f}: {c:,}" for f, c in formatos.items())))
+        sin_fecha = fechas.null_count - tabla['Fecha'].null_count
+        if sin_fecha:
+            invalidas = pc.and_(pc.is_null(fechas), pc.is_valid(tabla['Fecha']))
+            hallazgos.append(_hallazgo('Fechas no interpretables', 'Fecha', ERROR, sin_fecha,
+                                       pc.filter(tabla['Fecha'], invalidas)[0].as_py()))
+        tabla = tabla.set_column(tabla.column_names.index('Fecha'), 'Fecha', fechas)
+
+    if all(c in tabla.column_names for c in claves):
+        hallazgos.extend(_revisar_claves(tabla, claves))
+    return pd.DataFrame(hallazgos, columns=COLUMNAS_REPORTE)
+
+
+def _revisar_claves(tabla, claves):
+    """Claves duplicadas y meses faltantes por serie"""
+    hallazgos = []
+    series = [c for c in claves if c != 'Fecha']
+    meses = pc.add(pc.multiply(pc.year(tabla['Fecha']), 12), pc.subtract(pc.month(tabla['Fecha']), 1))
+    # Las claves de texto se agrupan por su código de diccionario
+    base = pa.table({
+        c: pc.dictionary_encode(tabla[c]) if pa.types.is_string(tabla[c].type) else tabla[c] for c in series
+    }).append_column('Fecha', tabla['Fecha']).append_column('_mes', meses)
+
+    por_clave = base.group_by(series + ['Fecha']).aggregate([([], 'count_all')])
+    repetidas = pc.filter(por_clave, pc.greater(por_clave['count_all'], 1))
+    if repetidas.num_rows:
+        ejemplo = ', '.join(str(repetidas[c][0].as_py()) for c in series + ['Fecha'])
+        hallazgos.append(_hallazgo('Claves duplicadas', ' + '.join(claves), ADVERTENCIA,
+                                   pc.sum(repetidas['count_all']).as_py(), ejemplo))
+
+    # Meses faltantes: meses entre la primera y la última observación de cada serie sin ninguna fila
+    rangos = base.group_by(series).aggregate([('_mes', 'min'), ('_mes', 'max'), ('_mes', 'count_distinct')])
+    esperados = pc.add(pc.subtract(rangos['_mes_max'], rangos['_mes_min']), 1)
+    faltantes = pc.subtract(esperados, rangos['_mes_count_distinct'])
+    con_huecos = pc.greater(faltantes, 0)
+    n_series = pc.sum(con_huecos).as_py() or 0
+    if n_series:
+        peor = pc.index(faltantes, pc.max(faltantes)).as_py()
+        ejemplo = ', '.join(str(rangos[c][peor].as_py()) for c in series) + f": {faltantes[peor].as_py()} meses"
+        hallazgos.append(_hallazgo('Meses faltantes', ' + '.join(series), ADVERTENCIA,
+                                   pc.sum(faltantes).as_py(), f"{n_series} series; peor {ejemplo}"))
+    return hallazgos
+
+
+def errores(reporte):
+    """Hallazgos de severidad ERROR"""
+    return reporte[reporte['Severidad'] == ERROR]
+
+
+def formatear_reporte(reporte):
+    """Reporte como texto para la consola"""
+    if reporte.empty:
+        return "Sin hallazgos de calidad"
+    return reporte.to_string(index=False, formatters={'Filas': '{:,}'.format})
@@ -0,0 +1,152 @@
+"""
+Carga de la tabla de tarifas e indicadores desde los distintos orígenes
+soportados (PostgreSQL, SQLite, Parquet, dataset Parquet particionado, CSV
+y Excel)
+"""
+
+import os
+
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, create_engine, text
+
+from tarifas import lago
+
+TABLA_TARIFAS = "tarifas_acueductos_aguas_residuales_med_ing_caracteristicas"
+COLUMNAS_CATEGORICAS = ['Municipio', 'Sector', 'Estrato', 'Servicio', 'Mes']
+
+# Renombrar columnas para mantener compatibilidad
+COLUMNAS_RENOMBRADAS = {
+    'municipio': 'Municipio',
+    'estrato': 'Estrato',
+    'servicio': 'Servicio',
+    'Cargo Fijo': 'Cargo Fijo',
+    'Cargo por Consumo': 'Cargo por Consumo',
+    'año': 'Año'
+}
+
+
+def url_base_datos(driver="postgresql"):
+    """Construir la URL de conexión a partir de las variables de entorno"""
+    load_dotenv()
+    DB_USER = os.getenv("DB_USER")
+    DB_PASSWORD = os.getenv("DB_PASSWORD")
+    DB_HOST = os.getenv("DB_HOST")
+    DB_PORT = os.getenv("DB_PORT")
+    DB_NAME = os.getenv("DB_NAME")
+    return f"{driver}://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+
+def crear_engine(driver="postgresql"):
+    """Crear el engine de SQLAlchemy para la base de datos configurada"""
+    return create_engine(url_base_datos(driver))
+
+
+def preparar_tarifas(df):
+    """Convertir la fecha a datetime y normalizar los nombres de columnas"""
+    if 'Fecha' in df.columns:
+        df['Fecha'] = pd.to_datetime(df['Fecha'])
+    elif 'fecha' in df.columns:
+        df['Fecha'] = pd.to_datetime(df['fecha'])
+    else:
+        raise KeyError(f"No se encontró la columna de fecha. Columnas disponibles: {df.columns.tolist()}")
+
+    return df.rename(columns=COLUMNAS_RENOMBRADAS)
+
+
+def compactar_tarifas(df):
+    """
+    Representación compacta de la tabla para compartirla entre sesiones.
+
+    Los textos repetidos pasan a categóricos, los números se reducen a
+    float32 y al entero más pequeño posible, y se agrega la clave entera
+    `Periodo` (AAAAMM) para filtrar por fecha sin comparar timestamps.
+    """
+    df = df.drop(columns=[c for c in ('fecha',) if c in df.columns and 'Fecha' in df.columns])
+    for columna in COLUMNAS_CATEGORICAS:
+        if columna in df.columns:
+            df[columna] = df[columna].astype('category')
+    for columna in df.select_dtypes(include='float').columns:
+        df[columna] = pd.to_numeric(df[columna], downcast='float')
+    for columna in df.select_dtypes(include='integer').columns:
+        df[columna] = pd.to_numeric(df[columna], downcast='integer')
+    if 'Fecha' in df.columns and pd.api.types.is_datetime64_any_dtype(df['Fecha']):
+        df['Periodo'] = (df['Fecha'].dt.year * 100 + df['Fecha'].dt.month).astype('int32')
+    return df
+
+
+def solo_lectura(df):
+    """
+    Copia de `df` con cada columna en su propio arreglo de solo lectura.
+
+    Es la forma de la tabla compartida entre sesiones (st.cache_resource):
+    una asignación en el lugar desde una página (`.loc`, `.iloc`, `fillna`
+    con `inplace`) falla en lugar de modificar la tabla de todas las
+    sesiones; las operaciones que devuelven un DataFrame nuevo no cambian.
+    """
+    columnas = {}
+    for nombre, serie in df.items():
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigos = serie.cat.codes.to_numpy(copy=True)
+            codigos.flags.writeable = False
+            columnas[nombre] = pd.Categorical.from_codes(codigos, dtype=serie.dtype, validate=False)
+        else:
+            valores = serie.to_numpy(copy=True)
+            if valores.dtype != object:
+                valores.flags.writeable = False
+            columnas[nombre] = valores
+    return pd.DataFrame(columnas, index=df.index, copy=False)
+
+
+def leer_tarifas(origen, tabla=TABLA_TARIFAS, municipios=None, años=None, columnas=None):
+    """
+    Leer la tabla de tarifas sin procesar.
+
+    `origen` puede ser un engine de SQLAlchemy, una URL de base de datos
+    (postgresql://, sqlite:///...), la ruta de un archivo .parquet, .csv o
+    .xlsx o la carpeta de un dataset particionado por año (`tarifas.lago`).
+    Con `municipios` solo se leen sus filas (en la base, con un WHERE sobre
+    la columna "Municipio"). `años` (inicio, fin) y `columnas` se aplican al
+    leer en Parquet (solo las particiones, grupos de filas y columnas
+    necesarios) y después de leer en los demás orígenes.
+    """
+    if isinstance(origen, (str, os.PathLike)) and lago.es_lago(origen):
+        inicio, fin = años or (None, None)
+        return lago.leer_lago(origen, columnas, inicio, fin, Municipio=None if municipios is None else list(municipios))
+
+    if isinstance(origen, (str, os.PathLike)):
+        ruta = str(origen)
+        extension = os.path.splitext(ruta)[1].lower()
+        if extension == '.parquet':
+            filtros = [('Municipio', 'in', [str(m) for m in municipios])] if municipios is not None else []
+            if años is not None:
+                filtros += [('Año', '>=', años[0]), ('Año', '<=', años[1])]
+            return pd.read_parquet(ruta, columns=columnas, filters=filtros or None)
+        lectores = {'.csv': pd.read_csv, '.xlsx': pd.read_excel, '.xls': pd.read_excel}
+        if extension in lectores:
+            df = lectores[extension](ruta)
+            df = df if municipios is None else df[df['Municipio'].astype(str).isin(list(map(str, municipios)))]
+            return _filtrar_años_columnas(df, años, columnas)
+        origen = create_engine(ruta)
+
+    if municipios is None:
+        df = pd.read_sql(f'SELECT * FROM {tabla}', origen)
+    else:
+        consulta = text(f'SELECT * FROM {tabla} WHERE "Municipio" IN :municipios').bindparams(
+            bindparam('municipios', expanding=True)
+        )
+        df = pd.read_sql(consulta, origen, params={'municipios': [str(m) for m in municipios]})
+    return _filtrar_años_columnas(df, años, columnas)
+
+
+def _filtrar_años_columnas(df, años, columnas):
+    """Años y columnas pedidos en los orígenes que no los filtran al leer"""
+    if años is not None:
+        columna_año = 'Año' if 'Año' in df.columns else 'año'
+        df = df[(df[columna_año] >= años[0]) & (df[columna_año] <= años[1])]
+    return df if columnas is None else df[[c for c in df.columns if c in columnas]]
+
+
+def cargar_tarifas(origen, tabla=TABLA_TARIFAS, municipios=None, años=None, columnas=None):
+    """Leer la tabla de tarifas y dejarla lista para los dashboards"""
+    return preparar_tarifas(leer_tarifas(origen, tabla, municipios, años, columnas))
@@ -0,0 +1,153 @@
+"""
+Simulador de escenarios tarifarios: reglas de ajuste sobre la tabla de
+tarifas (histórica y proyectada) y recálculo de todos los indicadores.
+
+La tabla se extiende una sola vez con la proyección de todos los cargos de
+todas las series (`jerarquia.pronostico_base`, vectorizado). Cada escenario
+aplica sus reglas con máscaras sobre esa tabla y recalcula los indicadores
+con `indicadores.calcular_indicadores` en una sola pasada. La definición del
+escenario se normaliza a una clave estable para guardar sus resultados.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from tarifas import datos, jerarquia
+from tarifas.indicadores import COLUMNAS_INDICADORES, COLUMNAS_PENALIZACION, calcular_indicadores
+from tarifas.sinteticos import MESES
+
+# Cargos que puede ajustar una regla y las columnas que modifica cada uno
+GRUPOS_CARGO = {
+    'Cargo Fijo': ['Cargo Fijo'],
+    'Cargo por Consumo': ['Cargo por Consumo', 'Cargo por Consumo Menor', 'Cargo por Consumo Mayor'],
+    'Penalizaciones': COLUMNAS_PENALIZACION,
+}
+TIPOS_AJUSTE = ['Porcentaje', 'Monto', 'Valor fijo']
+COLUMNAS_SERIE_ESCENARIO = ['Municipio', 'Sector', 'Estrato', 'Servicio']
+ESCENARIO_BASE = 'Base'
+
+
+def regla(cargo, tipo, valor, municipios=(), estratos=(), servicios=(), desde=None, hasta=None):
+    """
+    Regla de ajuste normalizada. Las listas vacías aplican a todos; `desde`
+    y `hasta` son años (inclusive) y sin `hasta` el ajuste es permanente.
+    """
+    if cargo not in GRUPOS_CARGO:
+        raise ValueError(f"Cargo desconocido: {cargo}")
+    if tipo not in TIPOS_AJUSTE:
+        raise ValueError(f"Tipo de ajuste desconocido: {tipo}")
+    return {
+        'cargo': cargo,
+        'tipo': tipo,
+        'valor': float(valor),
+        'municipios': sorted(map(str, municipios)),
+        'estratos': sorted(map(str, estratos)),
+        'servicios': sorted(map(str, servicios)),
+        'desde': None if desde is None else int(desde),
+        'hasta': None if hasta is None else int(hasta),
+    }
+
+
+def clave_escenario(reglas):
+    """Texto estable que identifica un escenario (mismas reglas, misma clave)"""
+    return json.dumps([regla(**r) for r in reglas], sort_keys=True, ensure_ascii=False)
+
+
+def describir_regla(r):
+    """Descripción corta de una regla para tablas y leyendas"""
+    r = regla(**r)
+    ajuste = {'Porcentaje': f"{r['valor']:+g}%", 'Monto': f"{r['valor']:+,g} $", 'Valor fijo': f"= {r['valor']:,g} $"}[r['tipo']]
+    alcance = [
+        ', '.join(r[campo]) if r[campo] else f'todos los {campo}'
+        for campo in ('municipios', 'estratos', 'servicios')
+    ]
+    periodo = f"desde {r['desde'] or 'el inicio'}" + (f" hasta {r['hasta']}" if r['hasta'] else '')
+    return f"{r['cargo']} {ajuste} · " + ' · '.join(alcance) + f" · {periodo}"
+
+
+def proyectar_tarifas(df, horizonte=24, metodo='Holt'):
+    """
+    Tabla histórica más `horizonte` meses proyectados de cada serie
+    (municipio, sector, estrato, servicio), marcados con `Proyectado`.
+
+    Todos los cargos de todas las series se pronostican en una sola llamada
+    a `jerarquia.pronostico_base` (una fila por serie y cargo).
+    """
+    columnas = [c for grupo in GRUPOS_CARGO.values() for c in grupo if c in df.columns]
+    tablas = list(jerarquia.matrices_mensuales(df, COLUMNAS_SERIE_ESCENARIO, columnas).values())
+    claves, fechas = tablas[0].index, tablas[0].columns
+    n = len(claves)
+    pred, _ = jerarquia.pronostico_base(np.vstack([t.to_numpy(dtype=float) for t in tablas]), horizonte, metodo)
+
+    futuras = pd.date_range(fechas[-1] + pd.offsets.MonthBegin(1), periods=horizonte, freq='MS')
+    futuro = claves.to_frame(index=False).astype(str).iloc[np.repeat(np.arange(n), horizonte)].reset_index(drop=True)
+    futuro['Fecha'] = np.tile(futuras, n)
+    for k, columna in enumerate(columnas):
+        futuro[columna] = np.clip(pred[k * n:(k + 1) * n].ravel(), 0, None)
+    futuro['Año'] = futuro['Fecha'].dt.year
+    futuro['Mes_num'] = futuro['Fecha'].dt.month
+    futuro['Mes'] = np.asarray(MESES, dtype=object)[futuro['Mes_num'] - 1]
+
+    historico = df.drop(columns=[c for c in ('Periodo',) if c in df.columns]).assign(Proyectado=False)
+    futuro['Proyectado'] = True
+    tabla = pd.concat([historico.astype({c: str for c in datos.COLUMNAS_CATEGORICAS if c in historico}), futuro],
+                      ignore_index=True)
+    return datos.compactar_tarifas(tabla)
+
+
+def aplicar_reglas(tabla, reglas):
+    """Copia de la tabla con los ajustes de cada regla, en orden"""
+    tabla = tabla.copy()
+    for r in (regla(**r) for r in reglas):
+        mascara = np.ones(len(tabla), dtype=bool)
+        for columna, valores in (('Municipio', r['municipios']), ('Estrato', r['estratos']), ('Servicio', r['servicios'])):
+            if valores:
+                mascara &= tabla[columna].astype(str).isin(valores).to_numpy()
+        if r['desde'] is not None:
+            mascara &= (tabla['Año'] >= r['desde']).to_numpy()
+        if r['hasta'] is not None:
+            mascara &= (tabla['Año'] <= r['hasta']).to_numpy()
+
+        for columna in GRUPOS_CARGO[r['cargo']]:
+            if columna not in tabla.columns:
+                continue
+            valores = tabla[columna].to_numpy(dtype=float)
+            if r['tipo'] == 'Porcentaje':
+                ajustados = valores * (1 + r['valor'] / 100)
+            elif r['tipo'] == 'Monto':
+                ajustados = np.clip(valores + r['valor'], 0, None)
+            else:
+                ajustados = np.full_like(valores, r['valor'])
+            tabla[columna] = np.where(mascara, ajustados, valores).astype(tabla[columna].dtype)
+    return tabla
+
+
+def evaluar_escenario(tabla_proyectada, reglas):
+    """Tabla con las reglas aplicadas y todos los indicadores recalculados"""
+    return calcular_indicadores(aplicar_reglas(tabla_proyectada, reglas))
+
+
+def resumen_anual(tabla, columnas=None):
+    """Promedio de cargos e indicadores por municipio y año"""
+    columnas = columnas or ['Cargo Fijo', 'Cargo por Consumo'] + COLUMNAS_INDICADORES
+    return tabla.groupby(['Municipio', 'Año'], observed=True)[columnas].mean()
+
+
+def comparar_escenarios(resumenes):
+    """
+    Tabla larga (Escenario, Municipio, Indicador, Valor, Cambio %) a partir
+    de {nombre: promedios por municipio}; el cambio es respecto a
+    ESCENARIO_BASE.
+    """
+    largo = pd.concat(
+        {nombre: resumen.rename_axis('Municipio').rename_axis(columns='Indicador').stack() for nombre, resumen in resumenes.items()},
+        names=['Escenario'],
+    ).rename('Valor').reset_index()
+    if ESCENARIO_BASE in resumenes:
+        base = largo[largo['Escenario'] == ESCENARIO_BASE].set_index(['Municipio', 'Indicador'])['Valor']
+        referencia = base.reindex(pd.MultiIndex.from_frame(largo[['Municipio', 'Indicador']])).to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            largo['Cambio %'] = np.where(referencia != 0, (largo['Valor'].to_numpy() / referencia - 1) * 100, np.nan)
+    return largo
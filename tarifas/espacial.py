@@ -0,0 +1,228 @@
+"""
+Análisis espacial de los indicadores: matriz de pesos entre municipios y
+autocorrelación espacial (I de Moran global y local / LISA).
+
+La matriz de pesos se construye una vez a partir de los polígonos (vecinos
+por contigüidad con un STRtree, o k vecinos más cercanos por centroides) y
+se guarda como matriz dispersa estandarizada por filas. Los estadísticos se
+calculan con productos matriz dispersa-vector y las pruebas de
+permutación se reparten en bloques que se ejecutan en paralelo con joblib.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy import sparse
+
+from tarifas.geo import unir_indicador
+
+# CRS proyectado (MAGNA-SIRGAS origen nacional) para distancias y longitudes
+CRS_METRICO = "EPSG:9377"
+PERMUTACIONES = 999
+NIVEL_SIGNIFICANCIA = 0.05
+
+CUADRANTES = {1: 'Alto-Alto', 2: 'Bajo-Alto', 3: 'Bajo-Bajo', 4: 'Alto-Bajo'}
+COLORES_CUADRANTES = {
+    'Alto-Alto': '#d7191c',
+    'Bajo-Alto': '#abd9e9',
+    'Bajo-Bajo': '#2c7bb6',
+    'Alto-Bajo': '#fdae61',
+    'No significativo': '#eeeeee',
+}
+
+
+# ======================== Matriz de pesos ========================
+
+def estandarizar_filas(W):
+    """Dividir cada fila por su suma (las filas sin vecinos quedan en cero)"""
+    W = sparse.csr_matrix(W, dtype=float)
+    suma = np.asarray(W.sum(axis=1)).ravel()
+    inversa = np.divide(1.0, suma, out=np.zeros_like(suma), where=suma > 0)
+    return sparse.diags(inversa) @ W
+
+
+def pesos_contiguidad(gdf_municipios, criterio='queen'):
+    """
+    Matriz de vecindad por contigüidad estandarizada por filas.
+
+    `queen`: comparten al menos un punto del borde; `rook`: comparten un
+    tramo de borde de longitud positiva.
+    """
+    import shapely
+
+    geometrias = gdf_municipios.to_crs(CRS_METRICO).geometry.to_numpy()
+    arbol = shapely.STRtree(geometrias)
+    i, j = arbol.query(geometrias, predicate='intersects')
+    distintos = i != j
+    i, j = i[distintos], j[distintos]
+    if criterio == 'rook':
+        compartido = shapely.length(shapely.intersection(geometrias[i], geometrias[j]))
+        i, j = i[compartido > 0], j[compartido > 0]
+    elif criterio != 'queen':
+        raise ValueError(f"Criterio de contigüidad desconocido: {criterio}")
+    n = len(geometrias)
+    return estandarizar_filas(sparse.csr_matrix((np.ones(len(i)), (i, j)), shape=(n, n)))
+
+
+def pesos_knn(gdf_municipios, k=4):
+    """Matriz de los k vecinos más cercanos (por centroides) estandarizada por filas"""
+    from scipy.spatial import cKDTree
+
+    centroides = gdf_municipios.to_crs(CRS_METRICO).geometry.centroid
+    puntos = np.column_stack([centroides.x, centroides.y])
+    n = len(puntos)
+    k = min(k, n - 1)
+    _, vecinos = cKDTree(puntos).query(puntos, k=k + 1)
+    i = np.repeat(np.arange(n), k)
+    j = vecinos[:, 1:].ravel()
+    return estandarizar_filas(sparse.csr_matrix((np.ones(len(i)), (i, j)), shape=(n, n)))
+
+
+def pesos_municipios(gdf_municipios, criterio='queen', k=4):
+    """
+    Pesos por contigüidad; los municipios sin vecinos contiguos (islas o
+    polígonos separados) toman sus k vecinos más cercanos.
+    """
+    W = pesos_contiguidad(gdf_municipios, criterio)
+    islas = np.asarray(W.sum(axis=1)).ravel() == 0
+    if islas.any() and len(gdf_municipios) > 1:
+        knn = pesos_knn(gdf_municipios, k)
+        W = estandarizar_filas(W + sparse.diags(islas.astype(float)) @ knn)
+    return W
+
+
+def submatriz(W, mascara):
+    """Pesos restringidos a las observaciones de `mascara`, reestandarizados"""
+    indices = np.flatnonzero(mascara)
+    return estandarizar_filas(W[indices][:, indices])
+
+
+# ======================== I de Moran ========================
+
+def _bloques(total, n_bloques):
+    limites = np.linspace(0, total, max(1, min(n_bloques, total)) + 1).astype(int)
+    return [(a, b) for a, b in zip(limites[:-1], limites[1:]) if b > a]
+
+
+def _moran_permutado(z, W, n_perm, semilla):
+    rng = np.random.default_rng(semilla)
+    z_perm = rng.permuted(np.tile(z, (n_perm, 1)), axis=1).T
+    return (z_perm * (W @ z_perm)).sum(axis=0)
+
+
+def moran_global(valores, W, permutaciones=PERMUTACIONES, semilla=0, n_jobs=-1):
+    """
+    I de Moran global con prueba de permutación.
+
+    Devuelve I, su valor esperado bajo aleatoriedad, la media y desviación de
+    la distribución permutada, el z y el p-valor (una cola, según el signo).
+    """
+    y = np.asarray(valores, dtype=float)
+    n = len(y)
+    z = y - y.mean()
+    m2 = z @ z
+    factor = n / W.sum() / m2
+    I = factor * (z @ (W @ z))
+
+    bloques = _bloques(permutaciones, 4 * _n_trabajadores(n_jobs))
+    semillas = np.random.SeedSequence(semilla).spawn(len(bloques))
+    resultados = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(_moran_permutado)(z, W, b - a, s) for (a, b), s in zip(bloques, semillas)
+    )
+    simulados = factor * np.concatenate(resultados)
+    mayores = (simulados >= I).sum()
+    extremos = min(mayores, permutaciones - mayores)
+    return {
+        'I': float(I),
+        'esperado': -1.0 / (n - 1),
+        'media_permutada': float(simulados.mean()),
+        'desviacion_permutada': float(simulados.std()),
+        'z': float((I - simulados.mean()) / simulados.std()) if simulados.std() > 0 else 0.0,
+        'p_valor': float((extremos + 1) / (permutaciones + 1)),
+        'n': n,
+    }
+
+
+def _lisa_permutado(z, W, observaciones, permutaciones, semilla):
+    """Rezagos espaciales permutados condicionalmente para un bloque de observaciones"""
+    rng = np.random.default_rng(semilla)
+    n = len(z)
+    rezagos = np.zeros((len(observaciones), permutaciones))
+    for fila, i in enumerate(observaciones):
+        inicio, fin = W.indptr[i], W.indptr[i + 1]
+        k = fin - inicio
+        if k == 0:
+            continue
+        # Valores de los demás municipios (sin i) tomados al azar sin reemplazo
+        otros = np.delete(z, i)
+        elegidos = rng.random((permutaciones, n - 1)).argpartition(k - 1, axis=1)[:, :k] if k < n - 1 \
+            else np.tile(np.arange(n - 1), (permutaciones, 1))
+        rezagos[fila] = otros[elegidos] @ W.data[inicio:fin]
+    return rezagos
+
+
+def _n_trabajadores(n_jobs):
+    return (os.cpu_count() or 1) if n_jobs in (None, -1) else max(1, n_jobs)
+
+
+def moran_local(valores, W, permutaciones=PERMUTACIONES, semilla=0, n_jobs=-1):
+    """
+    I de Moran local (LISA) con permutación condicional.
+
+    Devuelve un DataFrame con Ii, el rezago espacial, el cuadrante del
+    diagrama de Moran (1 Alto-Alto, 2 Bajo-Alto, 3 Bajo-Bajo, 4 Alto-Bajo)
+    y el p-valor de cada observación.
+    """
+    W = sparse.csr_matrix(W)
+    y = np.asarray(valores, dtype=float)
+    n = len(y)
+    z = y - y.mean()
+    m2 = (z @ z) / (n - 1)  # misma normalización que esda/PySAL
+    rezago = W @ z
+    Ii = z * rezago / m2
+
+    bloques = _bloques(n, 4 * _n_trabajadores(n_jobs))
+    semillas = np.random.SeedSequence(semilla).spawn(len(bloques))
+    resultados = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(_lisa_permutado)(z, W, range(a, b), permutaciones, s) for (a, b), s in zip(bloques, semillas)
+    )
+    simulados = z[:, None] * np.vstack(resultados) / m2
+    mayores = (simulados >= Ii[:, None]).sum(axis=1)
+    extremos = np.minimum(mayores, permutaciones - mayores)
+
+    cuadrante = np.where(z > 0, np.where(rezago > 0, 1, 4), np.where(rezago > 0, 2, 3))
+    return pd.DataFrame({
+        'Ii': Ii,
+        'rezago': rezago,
+        'cuadrante': cuadrante,
+        'p_valor': (extremos + 1) / (permutaciones + 1),
+    })
+
+
+def lisa_indicador(gdf_municipios, df_tarifas_filtrado, columna_indicador, W,
+                   permutaciones=PERMUTACIONES, nivel=NIVEL_SIGNIFICANCIA, semilla=0, n_jobs=-1):
+    """
+    Moran global y LISA del promedio del indicador por municipio.
+
+    Los municipios sin datos se excluyen y los pesos se reestandarizan sobre
+    los restantes. Devuelve (gdf con las columnas de LISA y `cluster`,
+    resultado global).
+    """
+    gdf = unir_indicador(gdf_municipios, df_tarifas_filtrado, columna_indicador)
+    con_datos = gdf[columna_indicador].notna().to_numpy()
+    W_datos = submatriz(W, con_datos)
+    valores = gdf.loc[con_datos, columna_indicador].to_numpy()
+    if len(valores) < 3 or np.ptp(valores) == 0:
+        raise ValueError("Se necesitan al menos 3 municipios con valores distintos del indicador")
+
+    global_ = moran_global(valores, W_datos, permutaciones, semilla, n_jobs)
+    local = moran_local(valores, W_datos, permutaciones, semilla, n_jobs)
+    local.index = gdf.index[con_datos]
+
+    gdf = gdf.join(local)
+    significativo = gdf['p_valor'] <= nivel
+    gdf['cluster'] = np.where(significativo, gdf['cuadrante'].map(CUADRANTES), 'No significativo')
+    gdf.loc[~con_datos, 'cluster'] = None
+    return gdf, global_
@@ -0,0 +1,201 @@
+"""
+Utilidades geográficas del visor: normalización de nombres, carga del
+shapefile de municipios, generación del GeoJSON por indicador y capa de
+teselas vectoriales con los valores unidos en el navegador
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+import unidecode
+
+from tarifas import tabla_compartida
+
+RUTA_MUNICIPIOS = 'data/shp/municipios.shp'
+
+# Estilo del municipio resaltado en el mapa (borde rojo)
+ESTILO_RESALTADO = {'color': '#FF0000', 'fillOpacity': 0.9, 'weight': 3}
+
+# Pirámide MVT de los municipios (build_vector_tiles.py) y su cliente de Leaflet
+# (build_vector_tiles.py guarda una copia local del cliente, que sirve run_tiles.py)
+CAPA_VECTORIAL = 'municipios'
+ARCHIVO_VECTORGRID = 'Leaflet.VectorGrid.bundled.js'
+VECTORGRID_JS = f'https://unpkg.com/leaflet.vectorgrid@1.3.0/dist/{ARCHIVO_VECTORGRID}'
+
+
+# Función para normalizar nombres de municipios
+def normalizar_nombre(texto):
+    if pd.isna(texto):
+        return texto
+    texto = str(texto).lower()
+    texto = unidecode.unidecode(texto)
+    texto = texto.replace(' ', '')
+    return texto
+
+
+def preparar_municipios(gdf_municipios):
+    """Normalizar nombres y asegurar el CRS EPSG:4326"""
+    gdf_municipios['MpNombre_norm'] = gdf_municipios['MpNombre'].apply(normalizar_nombre)
+    if gdf_municipios.crs is None:
+        gdf_municipios.set_crs(epsg=4326, inplace=True)
+    elif gdf_municipios.crs.to_string() != "EPSG:4326":
+        gdf_municipios = gdf_municipios.to_crs("EPSG:4326")
+    return gdf_municipios
+
+
+def cargar_municipios(ruta=RUTA_MUNICIPIOS):
+    """
+    Leer el shapefile de municipios listo para el visor. Con la caché
+    compartida configurada, el primer proceso lo publica ya preparado y los
+    demás lo leen de ahí.
+    """
+    import geopandas as gpd
+
+    nombre = 'municipios_' + hashlib.sha1(os.path.abspath(ruta).encode('utf-8')).hexdigest()[:12]
+    version = os.stat(ruta).st_mtime_ns
+    gdf_municipios = tabla_compartida.adjuntar_municipios(nombre, version)
+    if gdf_municipios is None:
+        gdf_municipios = tabla_compartida.publicar_municipios(preparar_municipios(gpd.read_file(ruta)), nombre, version)
+    return gdf_municipios
+
+
+def unir_indicador(gdf_municipios, df_tarifas_filtrado, columna_indicador):
+    """Unir el promedio del indicador por municipio con los polígonos"""
+    promedios_municipio = df_tarifas_filtrado.groupby('Municipio_norm', observed=True)[columna_indicador].mean().reset_index()
+    return gdf_municipios.merge(
+        promedios_municipio,
+        left_on='MpNombre_norm',
+        right_on='Municipio_norm',
+        how='left'
+    )
+
+
+def geojson_indicador(gdf_municipios, df_tarifas_filtrado, columna_indicador):
+    """Devolver (geojson, vmin, vmax) del indicador promediado por municipio"""
+    gdf_municipios_temp = unir_indicador(gdf_municipios, df_tarifas_filtrado, columna_indicador)
+    vmin = gdf_municipios_temp[columna_indicador].min()
+    vmax = gdf_municipios_temp[columna_indicador].max()
+    return gdf_municipios_temp.to_json(), vmin, vmax
+
+
+def valores_indicador(gdf_municipios, df_tarifas_filtrado, columna_indicador):
+    """
+    Promedio del indicador por nombre normalizado, solo de los municipios de
+    `gdf_municipios` y sin geometría, con (vmin, vmax)
+    """
+    promedios = df_tarifas_filtrado.groupby('Municipio_norm', observed=True)[columna_indicador].mean().dropna()
+    promedios.index = pd.Index([str(clave) for clave in promedios.index])
+    promedios = promedios[promedios.index.isin(gdf_municipios['MpNombre_norm'])]
+    return promedios, promedios.min(), promedios.max()
+
+
+def agregar_capa_vectorial(mapa, url, tabla, titulo, capa=CAPA_VECTORIAL, clave='MpNombre_norm',
+                           etiqueta='MpNombre', zoom_nativo=None, estilo=None, nombre='Municipios', url_js=None):
+    """
+    Agregar a un mapa de folium la capa de teselas vectoriales `url` con los
+    valores unidos en el navegador.
+
+    `tabla` es {clave: [valor, color]}: es lo único que cambia con el
+    indicador o el período, y viaja en la página en lugar de la geometría.
+    `url_js` es la copia local del cliente (Leaflet.VectorGrid); sin ella se
+    carga de unpkg. Devuelve el nombre de la variable JavaScript de la capa.
+    """
+    from folium import MacroElement
+    from folium.plugins import VectorGridProtobuf
+    from folium.template import Template
+
+    estilo = json.dumps(estilo or {'color': '#0D47A1', 'fillOpacity': 0.7, 'weight': 1})
+    opciones_nativas = f"maxNativeZoom: {int(zoom_nativo)}," if zoom_nativo is not None else ""
+    capa_teselas = VectorGridProtobuf(url, name=nombre, options='{}')
+    variable = capa_teselas.get_name()
+    capa_teselas.options = f"""{{
+        vectorTileLayerStyles: {{
+            {json.dumps(capa)}: function (propiedades) {{
+                var fila = {variable}_valores[propiedades[{json.dumps(clave)}]];
+                return Object.assign({{fill: true, fillColor: fila ? fila[1] : '#808080'}}, {estilo});
+            }}
+        }},
+        interactive: true,
+        {opciones_nativas}
+        getFeatureId: function (elemento) {{ return elemento.properties[{json.dumps(clave)}]; }}
+    }}"""
+    capa_teselas.default_js = [('vectorGrid', url_js or VECTORGRID_JS)]
+
+    # La tabla se declara antes de la capa y el tooltip después
+    valores = MacroElement()
+    valores._template = Template(
+        "{% macro script(this, kwargs) %}{% raw %}"
+        f"var {variable}_valores = {json.dumps(tabla, ensure_ascii=False, separators=(',', ':'))};"
+        "{% endraw %}{% endmacro %}"
+    )
+    valores.add_to(mapa)
+    capa_teselas.add_to(mapa)
+
+    tooltip = MacroElement()
+    tooltip._template = Template(
+        "{% macro script(this, kwargs) %}{% raw %}"
+        f"""
+        var {variable}_tooltip = L.tooltip();
+        {variable}.on('mouseover', function (e) {{
+            var p = e.layer.properties, fila = {variable}_valores[p[{json.dumps(clave)}]];
+            {variable}_tooltip.setLatLng(e.latlng)
+                .setContent('<b>' + p[{json.dumps(etiqueta)}] + '</b><br>' + {json.dumps(titulo)} + ': ' + (fila ? fila[0] : '–'))
+                .openOn({mapa.get_name()});
+        }});
+        {variable}.on('mouseout', function () {{ {mapa.get_name()}.closeTooltip({variable}_tooltip); }});
+        """
+        "{% endraw %}{% endmacro %}"
+    )
+    tooltip.add_to(mapa)
+    return variable
+
+
+def resaltar_municipio(html, capa, municipio, estilo=ESTILO_RESALTADO, vectorial=False):
+    """
+    Resaltar un municipio en el HTML ya renderizado de un mapa de folium.
+
+    Agrega al final del documento un script que cambia el estilo del polígono
+    en la capa GeoJSON `capa` (nombre de la variable JavaScript), de modo que
+    cambiar el resaltado no obliga a volver a construir el mapa. Con
+    `vectorial`, `capa` es la capa de teselas de `agregar_capa_vectorial`.
+    """
+    if not municipio:
+        return html
+    if vectorial:
+        clave = json.dumps(normalizar_nombre(municipio))
+        script = f"""<script>
+    var fila = {capa}_valores[{clave}];
+    {capa}.setFeatureStyle({clave}, Object.assign({{fill: true, fillColor: fila ? fila[1] : '#808080'}}, {json.dumps(estilo)}));
+</script>
+"""
+    else:
+        script = f"""<script>
+    {capa}.eachLayer(function (poligono) {{
+        if (poligono.feature.properties.MpNombre === {json.dumps(municipio)}) {{
+            poligono.setStyle({json.dumps(estilo)});
+            poligono.bringToFront();
+        }}
+    }});
+</script>
+"""
+    posicion = html.rfind('</html>')
+    return html[:posicion] + script + html[posicion:] if posicion >= 0 else html + script
+
+
+def matriz_indicador(gdf_municipios, df_tarifas_filtrado, columna_indicador, periodo='Año'):
+    """
+    Promedio del indicador por periodo y municipio en una sola agregación.
+
+    Devuelve (periodos, matriz) con una fila por periodo y una columna por
+    polígono de `gdf_municipios` (en su mismo orden; NaN sin datos).
+    """
+    tabla = (
+        df_tarifas_filtrado.groupby([periodo, 'Municipio_norm'], observed=True)[columna_indicador]
+        .mean()
+        .unstack('Municipio_norm')
+    )
+    tabla.columns = tabla.columns.astype(str)
+    tabla = tabla.reindex(columns=gdf_municipios['MpNombre_norm'].to_numpy())
+    return tabla.index.to_numpy(), tabla.to_numpy(dtype=float)
@@ -0,0 +1,130 @@
+"""
+Construcción de gráficos Plotly con tamaño acotado.
+
+Las series largas se reducen con LTTB (largest-triangle-three-buckets), que
+conserva la forma visual con pocos puntos, y por encima de un umbral se usan
+trazas WebGL (`Scattergl`) en lugar de SVG. Los indicadores por municipio se
+muestran en una sola figura con subgráficos que comparten el eje de
+municipios, en lugar de una figura por columna.
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from tarifas.anomalias import ANOMALIA, CAMBIO
+
+# Puntos a partir de los cuales se usa WebGL y máximo de puntos por traza
+UMBRAL_WEBGL = 1000
+MAX_PUNTOS = 2000
+
+
+def lttb(x, y, n_salida):
+    """Índices de los `n_salida` puntos elegidos por LTTB (incluye extremos)"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_salida >= n or n_salida < 3:
+        return np.arange(n)
+
+    indices = np.empty(n_salida, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    # n_salida - 2 cubetas entre el primer y el último punto
+    bordes = np.floor(np.linspace(1, n - 1, n_salida - 1)).astype(np.int64)
+    a = 0
+    for i in range(n_salida - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        # Vértice C: promedio de la cubeta siguiente (o el último punto)
+        if i + 2 < len(bordes):
+            cx, cy = x[fin:bordes[i + 2]].mean(), y[fin:bordes[i + 2]].mean()
+        else:
+            cx, cy = x[n - 1], y[n - 1]
+        # Punto de la cubeta que forma el triángulo de mayor área con A y C
+        areas = np.abs((x[a] - cx) * (y[inicio:fin] - y[a]) - (x[a] - x[inicio:fin]) * (cy - y[a]))
+        a = inicio + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+
+def reducir_serie(x, y, max_puntos=MAX_PUNTOS):
+    """Serie sin NaN reducida con LTTB a lo sumo a `max_puntos` puntos"""
+    x = pd.Series(x).reset_index(drop=True)
+    y = pd.Series(y).reset_index(drop=True)
+    validos = y.notna().to_numpy()
+    x, y = x[validos], y[validos]
+    if len(x) <= max_puntos:
+        return x.to_numpy(), y.to_numpy()
+
+    x_num = x.to_numpy().astype('datetime64[ns]').astype(np.int64) if pd.api.types.is_datetime64_any_dtype(x) else x
+    indices = lttb(x_num, y, max_puntos)
+    return x.to_numpy()[indices], y.to_numpy()[indices]
+
+
+def traza_linea(x, y, max_puntos=MAX_PUNTOS, umbral_webgl=UMBRAL_WEBGL, **kwargs):
+    """Scatter de línea reducido con LTTB; WebGL si supera `umbral_webgl` puntos"""
+    n = len(x)
+    x, y = reducir_serie(x, y, max_puntos)
+    clase = go.Scattergl if n > umbral_webgl else go.Scatter
+    return clase(x=x, y=y, **kwargs)
+
+
+def barras_indicadores(df, columnas, x='Municipio', colorscale='Viridis', altura_fila=300):
+    """Una figura con un subgráfico de barras por indicador y eje X compartido"""
+    fig = make_subplots(
+        rows=len(columnas), cols=1, shared_xaxes=True, vertical_spacing=0.06,
+        subplot_titles=[columna.replace("_", " ").title() for columna in columnas]
+    )
+    categorias = df[x].astype(str).to_numpy()
+    for fila, columna in enumerate(columnas, start=1):
+        valores = df[columna].to_numpy()
+        fig.add_trace(go.Bar(
+            x=categorias, y=valores, name=columna,
+            marker=dict(color=valores, colorscale=colorscale),
+            hovertemplate=f"%{{x}}<br>{columna}: %{{y:.3f}}<extra></extra>",
+            showlegend=False
+        ), row=fila, col=1)
+    fig.update_layout(height=altura_fila * len(columnas), margin=dict(l=20, r=20, t=50, b=20))
+    return fig
+
+
+def mapa_calor_comparacion(matriz, titulo, relativa=True, referencia=None):
+    """Mapa de calor de una matriz de comparación (filas contra columnas base) centrado en cero"""
+    unidad = "%" if relativa else ""
+    fig = go.Figure(go.Heatmap(
+        z=matriz.to_numpy(), x=matriz.columns.astype(str), y=matriz.index.astype(str),
+        colorscale='RdBu_r', zmid=0, colorbar=dict(title=f"Diferencia{' %' if relativa else ''}"),
+        hovertemplate=f"%{{y}} vs %{{x}}: %{{z:+.2f}}{unidad}<extra></extra>",
+    ))
+    if referencia is not None and referencia in matriz.columns:
+        # Columna del municipio base resaltada
+        posicion = list(matriz.columns).index(referencia)
+        fig.add_shape(type='rect', xref='x', yref='paper', x0=posicion - 0.5, x1=posicion + 0.5, y0=0, y1=1,
+                      line=dict(color='black', width=2))
+    fig.update_layout(
+        title=titulo, xaxis_title="Municipio base", yaxis_title="Municipio",
+        height=max(400, 28 * len(matriz) + 150), margin=dict(l=20, r=20, t=50, b=20)
+    )
+    return fig
+
+
+def marcar_eventos(fig, eventos):
+    """
+    Agregar a `fig` los eventos de una serie (ver `tarifas.anomalias`): las
+    anomalías como marcas sobre el valor esperado (el observado va en la
+    etiqueta, para no deformar el eje) y los cambios estructurales como
+    líneas verticales.
+    """
+    anomalias = eventos[eventos['Tipo'] == ANOMALIA]
+    if len(anomalias):
+        fig.add_trace(go.Scatter(
+            x=anomalias['Fecha'], y=anomalias['Referencia'], mode='markers', name='Anomalía',
+            marker=dict(symbol='x', size=11, color='#D81B60'),
+            customdata=np.column_stack([anomalias['Valor'], anomalias['Puntaje']]),
+            hovertemplate="Anomalía<br>Observado: %{customdata[0]:,.0f}<br>Esperado: %{y:,.0f}<br>z: %{customdata[1]:.1f}<extra></extra>"
+        ))
+    for cambio in eventos[eventos['Tipo'] == CAMBIO].itertuples(index=False):
+        fig.add_vline(x=cambio.Fecha, line_dash='dash', line_color='#8E24AA', opacity=0.6)
+        fig.add_annotation(x=cambio.Fecha, y=1, yref='paper', text=f"{cambio.Puntaje:+.0f}%", showarrow=False,
+                           font=dict(size=10, color='#8E24AA'), yanchor='bottom')
+    return fig
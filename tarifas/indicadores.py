@@ -0,0 +1,197 @@
+"""
+Agregaciones de indicadores tarifarios usadas por el dashboard principal
+y el visor geográfico
+"""
+
+import numpy as np
+import pandas as pd
+
+INDICADORES_CLAVE = {
+    "IET - Estructura Tarifaria": ["ratio_cargo_fijo_variable", "indice_progresividad", "diferencial_estratos", "indice_sectorial"],
+    "IVG - Variación Geográfica": ["dispersion_municipal", "ratio_municipal", "indice_variabilidad"],
+    "ISD - Servicio Diferencial": ["ratio_servicios", "diferencial_por_estrato", "indice_carga"],
+    "ICO - Costos Operativos": ["ratio_penalizacion", "factor_operativo", "indice_penalizacion"]
+}
+
+
+def filtrar_serie(df, municipio, estrato, servicio):
+    """Obtener la serie de un municipio, estrato y servicio ordenada por fecha"""
+    return df[
+        (df['Municipio'] == municipio) &
+        (df['Estrato'] == estrato) &
+        (df['Servicio'] == servicio)
+    ].sort_values('Fecha')
+
+
+def estructura_tarifaria(df, municipio, servicio):
+    """Promedio de Cargo Fijo y Cargo por Consumo por estrato (IET)"""
+    df_iet = df[
+        (df['Municipio'] == municipio) &
+        (df['Servicio'] == servicio)
+    ].groupby('Estrato', observed=True)[['Cargo Fijo', 'Cargo por Consumo']].mean().reset_index()
+
+    # Ordenar por estrato numérico si es posible
+    df_iet = df_iet[df_iet['Estrato'].astype(str).str.isnumeric()]
+    df_iet['Estrato'] = df_iet['Estrato'].astype(str).astype(int)
+    return df_iet.sort_values(by='Estrato')
+
+
+def variacion_geografica(df, estrato, servicio):
+    """Dispersión, promedio y ratio municipal del Cargo Fijo (IVG)"""
+    df_ivg = df[
+        (df['Estrato'] == estrato) &
+        (df['Servicio'] == servicio)
+    ].groupby('Municipio', observed=True)['Cargo Fijo'].agg(['std', 'mean']).reset_index()
+    df_ivg.columns = ['Municipio', 'Dispersión Municipal', 'Tarifa Promedio']
+
+    # Ratio Municipal respecto al promedio regional
+    promedio_total = df_ivg['Tarifa Promedio'].mean()
+    df_ivg['Ratio Municipal'] = df_ivg['Tarifa Promedio'] / promedio_total
+    return df_ivg
+
+
+def tarifa_promedio_municipio(df, anno_inicio, anno_fin):
+    """Cargo Fijo promedio por municipio en un período de años"""
+    df_periodo = df[(df["Año"] >= anno_inicio) & (df["Año"] <= anno_fin)]
+    df_tarifa_mun = df_periodo.groupby("Municipio", observed=True)["Cargo Fijo"].mean().reset_index()
+    df_tarifa_mun.columns = ["Municipio", "Tarifa Promedio"]
+    return df_tarifa_mun
+
+
+def indicadores_por_municipio(df, columnas):
+    """Promedio de las columnas de indicadores por municipio"""
+    return df.groupby("Municipio", observed=True)[columnas].mean().reset_index()
+
+
+# ======================== Comparación entre municipios ========================
+
+def promedio_por_municipio(df, columna, estrato=None, servicio=None, anno_inicio=None, anno_fin=None, municipios=None):
+    """Promedio de `columna` por municipio con filtros opcionales; NaN para los municipios sin datos"""
+    mascara = np.ones(len(df), dtype=bool)
+    if estrato is not None:
+        mascara &= (df['Estrato'] == estrato).to_numpy()
+    if servicio is not None:
+        mascara &= (df['Servicio'] == servicio).to_numpy()
+    if anno_inicio is not None:
+        mascara &= (df['Año'] >= anno_inicio).to_numpy()
+    if anno_fin is not None:
+        mascara &= (df['Año'] <= anno_fin).to_numpy()
+    # Solo la columna y la clave filtradas, sin copiar el resto de la tabla
+    promedios = df[columna][mascara].groupby(df['Municipio'][mascara], observed=True).mean()
+    promedios.index = promedios.index.astype(str)
+    if municipios is None:
+        municipios = sorted(str(m) for m in df['Municipio'].unique())
+    return promedios.reindex(list(municipios)).astype(float)
+
+
+def matriz_comparacion(valores, relativa=True):
+    """
+    Diferencia de cada municipio (filas) contra cada municipio base
+    (columnas) en una sola operación con broadcasting: porcentual
+    (v_i / v_j - 1) * 100 o absoluta v_i - v_j. Las comparaciones con un
+    municipio sin datos (o con base cero) quedan en NaN.
+    """
+    v = valores.to_numpy(dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        matriz = (v[:, None] / v[None, :] - 1) * 100 if relativa else v[:, None] - v[None, :]
+    matriz[~np.isfinite(matriz)] = np.nan
+    return pd.DataFrame(matriz, index=valores.index, columns=valores.index)
+
+
+# ======================== Cálculo de indicadores ========================
+
+COLUMNAS_PENALIZACION = ['Suspensión', 'Reinstalación', 'Reconexión', 'Corte']
+COLUMNAS_INDICADORES = [
+    'ratio_cargo_fijo_variable', 'diferencial_estratos', 'indice_progresividad',
+    'indice_sectorial', 'ratio_servicios', 'diferencial_por_estrato', 'indice_carga',
+    'ratio_penalizacion', 'factor_operativo', 'indice_penalizacion',
+    'dispersion_municipal', 'ratio_municipal', 'indice_variabilidad'
+]
+
+
+class _Grupos:
+    """Códigos enteros de grupo para calcular medias y desviaciones con bincount"""
+
+    def __init__(self, df):
+        self.df = df
+        self._codigos = {}
+
+    def codigos(self, columnas):
+        clave = tuple(columnas)
+        if clave not in self._codigos:
+            combinado = np.zeros(len(self.df), dtype=np.int64)
+            for columna in columnas:
+                codigos, unicos = pd.factorize(self.df[columna], sort=False)
+                combinado = combinado * (len(unicos) + 1) + codigos
+            self._codigos[clave] = pd.factorize(combinado, sort=False)
+        return self._codigos[clave][0]
+
+    def media(self, valores, columnas, mascara=None):
+        codigos = self.codigos(columnas)
+        pesos = np.ones(len(valores)) if mascara is None else mascara.astype(float)
+        suma = np.bincount(codigos, weights=np.where(pesos > 0, valores, 0.0))
+        n = np.bincount(codigos, weights=pesos)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (suma / n)[codigos]
+
+    def std(self, valores, columnas):
+        codigos = self.codigos(columnas)
+        n = np.bincount(codigos)
+        suma = np.bincount(codigos, weights=valores)
+        suma2 = np.bincount(codigos, weights=valores * valores)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            varianza = (suma2 - suma * suma / n) / (n - 1)
+        return np.sqrt(np.clip(varianza, 0, None))[codigos]
+
+
+def _dividir(a, b, defecto=0.0):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        resultado = a / b
+    return np.where(np.isfinite(resultado), resultado, defecto)
+
+
+def calcular_indicadores(df):
+    """
+    Recalcular las columnas de indicadores a partir de los cargos.
+
+    Los indicadores IET, `ratio_penalizacion`, `indice_penalizacion`,
+    `dispersion_municipal` y `ratio_municipal` reproducen exactamente la
+    tabla original; el resto usa definiciones equivalentes con la misma
+    granularidad (por estrato, fecha o municipio). Todo el cálculo es
+    vectorizado, sin apply por fila.
+    """
+    grupos = _Grupos(df)
+    cf = df['Cargo Fijo'].to_numpy(dtype=float)
+    consumo = (df['Cargo por Consumo Menor'] + df['Cargo por Consumo Mayor']).to_numpy(dtype=float)
+    penalizaciones = df[COLUMNAS_PENALIZACION].sum(axis=1).to_numpy(dtype=float)
+    residencial = df['Estrato'].astype(str).str.isnumeric().to_numpy()
+
+    # IET - Estructura Tarifaria
+    df['ratio_cargo_fijo_variable'] = _dividir(cf, consumo)
+    media_estrato = grupos.media(cf, ['Estrato', 'Servicio'])
+    media_estrato_res = np.where(residencial, media_estrato, np.nan)
+    por_servicio = pd.Series(media_estrato_res).groupby(grupos.codigos(['Servicio']))
+    minimo, maximo = por_servicio.transform('min').to_numpy(), por_servicio.transform('max').to_numpy()
+    df['diferencial_estratos'] = np.where(residencial, _dividir(media_estrato, minimo), 0.0)
+    df['indice_progresividad'] = np.where(residencial, _dividir(maximo, minimo) - 1, 0.0)
+    df['indice_sectorial'] = _dividir(cf, grupos.media(cf, ['Sector', 'Servicio']))
+
+    # ISD - Servicio Diferencial
+    clave_par = ['Municipio', 'Sector', 'Estrato', 'Fecha']
+    servicio = df['Servicio'].to_numpy()
+    acueducto = grupos.media(cf, clave_par, servicio == 'Acueducto')
+    alcantarillado = grupos.media(cf, clave_par, servicio == 'Alcantarillado')
+    df['ratio_servicios'] = _dividir(acueducto, alcantarillado, 1.0)
+    df['diferencial_por_estrato'] = _dividir(cf, media_estrato)
+    df['indice_carga'] = _dividir(cf + consumo, grupos.media(cf + consumo, ['Servicio']))
+
+    # ICO - Costos Operativos
+    df['ratio_penalizacion'] = _dividir(penalizaciones, cf)
+    df['factor_operativo'] = _dividir(grupos.media(penalizaciones, ['Estrato']), penalizaciones.mean(), 1.0)
+    df['indice_penalizacion'] = _dividir(grupos.media(penalizaciones, ['Fecha']), penalizaciones.mean(), 1.0)
+
+    # IVG - Variación Geográfica
+    df['dispersion_municipal'] = grupos.std(cf, ['Municipio', 'Servicio'])
+    df['ratio_municipal'] = _dividir(grupos.media(cf, ['Municipio', 'Servicio']), grupos.media(cf, ['Servicio']))
+    df['indice_variabilidad'] = _dividir(grupos.std(cf, ['Municipio']), grupos.media(cf, ['Municipio'])) * 100
+    return df
@@ -0,0 +1,75 @@
+"""
+Índice de series (Municipio, Estrato, Servicio) sobre la tabla de tarifas.
+
+La tabla se ordena una sola vez por serie y fecha, de modo que cada serie
+ocupa un bloque contiguo de filas; seleccionar una serie es un `iloc` sobre
+ese bloque en lugar de tres máscaras booleanas y un ordenamiento sobre toda
+la tabla. Las opciones de los selectores se calculan al construir el índice.
+"""
+
+import numpy as np
+import pandas as pd
+
+COLUMNAS_SERIE = ['Municipio', 'Estrato', 'Servicio']
+
+
+class IndiceSeries:
+    """Tabla ordenada por serie y fecha con la posición de cada serie"""
+
+    def __init__(self, df, ordenada=False):
+        self._posiciones = {}
+        if df.empty:
+            self.df = df
+            self.municipios, self.estratos, self.servicios, self.años = [], [], [], []
+            return
+
+        # Una tabla ya ordenada (por ejemplo, mapeada en memoria) se usa sin copiarla
+        self.df = df if ordenada else df.sort_values(COLUMNAS_SERIE + ['Fecha'], kind='stable', ignore_index=True)
+
+        # Inicio de cada bloque: filas donde cambia alguna de las columnas de la serie
+        cambios = np.zeros(len(self.df), dtype=bool)
+        cambios[0] = True
+        for columna in COLUMNAS_SERIE:
+            codigos = pd.factorize(self.df[columna])[0]
+            cambios[1:] |= codigos[1:] != codigos[:-1]
+        inicios = np.flatnonzero(cambios)
+        fines = np.append(inicios[1:], len(self.df))
+        claves = self.df[COLUMNAS_SERIE].iloc[inicios].itertuples(index=False, name=None)
+        for clave, inicio, fin in zip(claves, inicios, fines):
+            self._posiciones[clave] = (int(inicio), int(fin))
+
+        # Opciones de los selectores
+        self.municipios = sorted({m for m, _, _ in self._posiciones})
+        self.estratos = sorted({e for _, e, _ in self._posiciones})
+        self.servicios = sorted({s for _, _, s in self._posiciones})
+        self.años = sorted(self.df['Año'].unique()) if 'Año' in self.df.columns else []
+
+    def __len__(self):
+        return len(self._posiciones)
+
+    def __contains__(self, clave):
+        return tuple(clave) in self._posiciones
+
+    def claves(self):
+        """Series disponibles como tuplas (municipio, estrato, servicio)"""
+        return list(self._posiciones)
+
+    def resumen(self):
+        """Series con su número de observaciones y primera y última fecha"""
+        posiciones = np.array(list(self._posiciones.values()), dtype=np.int64).reshape(-1, 2)
+        resumen = pd.DataFrame(self.claves(), columns=COLUMNAS_SERIE)
+        resumen['Observaciones'] = posiciones[:, 1] - posiciones[:, 0]
+        if len(resumen):
+            resumen['Desde'] = self.df['Fecha'].to_numpy()[posiciones[:, 0]]
+            resumen['Hasta'] = self.df['Fecha'].to_numpy()[posiciones[:, 1] - 1]
+        return resumen
+
+    def serie(self, municipio, estrato, servicio):
+        """Filas de una serie ordenadas por fecha (vacío si no existe)"""
+        inicio, fin = self._posiciones.get((municipio, estrato, servicio), (0, 0))
+        return self.df.iloc[inicio:fin]
+
+    def ultimas(self, claves):
+        """Fila más reciente de cada serie de `claves` (se omiten las que no existen)"""
+        filas = [self._posiciones[clave][1] - 1 for clave in map(tuple, claves) if clave in self._posiciones]
+        return self.df.iloc[filas]
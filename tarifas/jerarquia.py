@@ -0,0 +1,329 @@
+"""
+Pronóstico jerárquico y reconciliado: Total → Región → Municipio → Servicio
+→ Estrato.
+
+Las series inferiores (municipio, servicio, estrato) se alinean en una
+matriz (series x meses) y los niveles agregados se obtienen con una matriz
+de suma dispersa S. Los pronósticos base de todos los nodos se calculan a la
+vez con álgebra de matrices y se reconcilian en una sola pasada (bottom-up,
+OLS, WLS o MinT), de modo que los agregados regionales y municipales
+coinciden con la suma (o el promedio) de los pronósticos por estrato.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+from tarifas.geo import normalizar_nombre
+
+NIVELES = ['Total', 'Región', 'Municipio', 'Servicio', 'Estrato']
+METODOS_BASE = ['Holt', 'Suavizado simple']
+METODOS_RECONCILIACION = ['MinT', 'WLS', 'OLS', 'Bottom-up']
+AGREGACIONES = ['promedio', 'suma']
+
+# Subregiones de Antioquia de los municipios de la tabla (nombres normalizados)
+REGIONES = {
+    'barbosa': 'Valle de Aburrá',
+    'bello': 'Valle de Aburrá',
+    'caldas': 'Valle de Aburrá',
+    'copacabana': 'Valle de Aburrá',
+    'envigado': 'Valle de Aburrá',
+    'girardota': 'Valle de Aburrá',
+    'itagui': 'Valle de Aburrá',
+    'laestrella': 'Valle de Aburrá',
+    'estrella': 'Valle de Aburrá',
+    'medellin': 'Valle de Aburrá',
+    'sabaneta': 'Valle de Aburrá',
+    'rionegro': 'Oriente',
+    'elretiro': 'Oriente',
+}
+REGION_DEFECTO = 'Otros municipios'
+
+
+def region_municipio(municipio):
+    """Subregión de un municipio (REGION_DEFECTO si no está en REGIONES)"""
+    return REGIONES.get(normalizar_nombre(municipio), REGION_DEFECTO)
+
+
+# ======================== Estructura ========================
+
+def matrices_mensuales(df, columnas_clave, columnas):
+    """
+    Para cada columna, una tabla con una fila por serie (`columnas_clave`) y
+    una columna por mes con su promedio; todas salen de una sola agrupación.
+    Los meses sin dato toman el último valor conocido (o el primero, antes
+    del inicio de la serie).
+    """
+    periodos = df['Fecha'].dt.to_period('M')
+    promedios = (
+        df.assign(_periodo=periodos)
+        .groupby(columnas_clave + ['_periodo'], observed=True)[columnas]
+        .mean()
+        .unstack('_periodo')
+    )
+    meses = pd.period_range(periodos.min(), periodos.max(), freq='M')
+    tablas = {}
+    for columna in columnas:
+        tabla = promedios[columna].reindex(columns=meses).ffill(axis=1).bfill(axis=1)
+        tabla.columns = meses.to_timestamp()
+        tablas[columna] = tabla
+    return tablas
+
+
+def matriz_mensual(df, columnas_clave, columna):
+    """Series de `columna` por mes (ver `matrices_mensuales`)"""
+    return matrices_mensuales(df, columnas_clave, [columna])[columna]
+
+
+def matriz_historica(df, columna='Cargo Fijo'):
+    """
+    Series inferiores alineadas por mes.
+
+    Devuelve (claves, fechas, Y): `claves` con Región, Municipio, Servicio y
+    Estrato de cada fila de Y (series x meses).
+    """
+    tabla = matriz_mensual(df, ['Municipio', 'Servicio', 'Estrato'], columna)
+    claves = tabla.index.to_frame(index=False).astype(str)
+    claves.insert(0, 'Región', claves['Municipio'].map(region_municipio))
+    orden = claves.sort_values(['Región', 'Municipio', 'Servicio', 'Estrato'], kind='stable').index.to_numpy()
+    return claves.iloc[orden].reset_index(drop=True), tabla.columns, tabla.to_numpy(dtype=float)[orden]
+
+
+def matriz_suma(claves, agregacion='promedio'):
+    """
+    Matriz S dispersa (nodos x series inferiores) y la tabla de nodos.
+
+    Los nodos van por nivel, de Total a Estrato; las últimas filas de S son
+    la identidad de las series inferiores. Con `agregacion='promedio'` cada
+    fila se divide por su número de series, de modo que un agregado es el
+    promedio de sus estratos en lugar de la suma.
+    """
+    m = len(claves)
+    filas, columnas, partes = [], [], []
+    inicio = 0
+    for profundidad, nivel in enumerate(NIVELES):
+        llaves = NIVELES[1:profundidad + 1]
+        if llaves:
+            # Grupos numerados en orden de aparición, igual que drop_duplicates
+            codigos = claves.groupby(llaves, sort=False).ngroup().to_numpy()
+            unicos = claves[llaves].drop_duplicates().reset_index(drop=True)
+        else:
+            codigos, unicos = np.zeros(m, dtype=np.int64), pd.DataFrame(index=[0])
+        unicos.insert(0, 'Nivel', nivel)
+        partes.append(unicos)
+        filas.append(inicio + codigos)
+        columnas.append(np.arange(m))
+        inicio += len(unicos)
+
+    S = sparse.csr_matrix(
+        (np.ones(m * len(NIVELES)), (np.concatenate(filas), np.concatenate(columnas))), shape=(inicio, m)
+    )
+    if agregacion == 'promedio':
+        S = sparse.diags(1.0 / np.asarray(S.sum(axis=1)).ravel()) @ S
+    elif agregacion != 'suma':
+        raise ValueError(f"Agregación desconocida: {agregacion}")
+
+    nodos = pd.concat(partes, ignore_index=True).reindex(columns=['Nivel'] + NIVELES[1:]).fillna('')
+    nodos['Nodo'] = nodos[NIVELES[1:]].apply(lambda fila: ' / '.join(v for v in fila if v) or 'Total', axis=1)
+    return S.tocsr(), nodos
+
+
+def incoherencia(Y, S):
+    """Máxima diferencia entre cada nodo y la agregación de sus series inferiores"""
+    m = S.shape[1]
+    return float(np.abs(Y - S @ Y[-m:]).max())
+
+
+# ======================== Pronósticos base ========================
+
+ALFAS = np.linspace(0.05, 0.95, 10)
+BETAS = np.array([0.01, 0.05, 0.1, 0.2, 0.3])
+
+
+def _suavizar(Y, alfa, beta, con_tendencia, guardar_errores=False):
+    """
+    Recursión de Holt (forma de corrección del error) sobre todas las
+    series y combinaciones de parámetros a la vez. `alfa` y `beta` tienen
+    forma (1, P) o (series, 1). Devuelve nivel y tendencia finales, la suma
+    de errores cuadráticos un paso adelante y, si se piden, los errores
+    (series x P x meses-1).
+    """
+    n, n_meses = Y.shape
+    forma = np.broadcast_shapes((n, 1), np.shape(alfa))
+    nivel = np.broadcast_to(Y[:, :1], forma).copy()
+    tendencia = np.zeros(forma)
+    if con_tendencia and n_meses > 1:
+        tendencia += Y[:, 1:2] - Y[:, :1]
+    sse = np.zeros(forma)
+    errores = np.empty(forma + (n_meses - 1,)) if guardar_errores else None
+    for t in range(1, n_meses):
+        error = Y[:, t:t + 1] - (nivel + tendencia)
+        sse += error * error
+        if guardar_errores:
+            errores[..., t - 1] = error
+        nivel += tendencia + alfa * error
+        if con_tendencia:
+            tendencia += alfa * beta * error
+    return nivel, tendencia, sse, errores
+
+
+def pronostico_base(Y, horizonte, metodo='Holt', ventana=36):
+    """
+    Pronóstico base de todas las filas de Y a la vez con suavizado
+    exponencial simple o de Holt.
+
+    Cada serie elige sus parámetros de una grilla por el menor error
+    cuadrático un paso adelante en los últimos `ventana` meses; la grilla
+    entera se evalúa en una sola recursión vectorizada. Devuelve
+    (pronóstico series x horizonte, residuos en muestra series x meses).
+    """
+    if metodo not in METODOS_BASE:
+        raise ValueError(f"Método base desconocido: {metodo}")
+    Y = Y[:, -ventana:]
+    con_tendencia = metodo == 'Holt'
+    alfas, betas = (np.repeat(ALFAS, len(BETAS)), np.tile(BETAS, len(ALFAS))) if con_tendencia else (ALFAS, np.zeros_like(ALFAS))
+    _, _, sse, _ = _suavizar(Y, alfas[None, :], betas[None, :], con_tendencia)
+    mejor = sse.argmin(axis=1)
+
+    nivel, tendencia, _, errores = _suavizar(Y, alfas[mejor][:, None], betas[mejor][:, None], con_tendencia, True)
+    pasos = np.arange(1, horizonte + 1)
+    return nivel + tendencia * pasos, errores[:, 0, :]
+
+
+# ======================== Reconciliación ========================
+
+def _piso(varianzas):
+    # Series constantes (residuo cero) no pueden tener peso infinito
+    positivas = varianzas[varianzas > 0]
+    return np.maximum(varianzas, 1e-6 * (positivas.mean() if positivas.size else 1.0))
+
+
+def bloques_municipio(nodos):
+    """
+    Bloque de cada nodo para la covarianza de MinT: los nodos de un
+    municipio (el municipio, sus servicios y sus estratos) comparten bloque;
+    Total y las regiones quedan cada uno en el suyo.
+    """
+    codigos = nodos.groupby(['Región', 'Municipio'], sort=False).ngroup().to_numpy()
+    sueltos = (nodos['Municipio'] == '').to_numpy()
+    codigos[sueltos] = codigos.max() + 1 + np.arange(sueltos.sum())
+    return codigos
+
+
+def covarianza_contraida(residuos, bloques=None):
+    """
+    Covarianza de los residuos contraída hacia su diagonal (Schäfer-Strimmer),
+    como en MinT-shrink. `residuos` es series x meses.
+
+    Solo se estiman las covarianzas dentro de cada bloque (`bloques`, un
+    código por serie; sin bloques cada serie va sola y W es diagonal), así
+    que W es dispersa y nunca se arma la matriz densa nodos x nodos. La
+    intensidad de la contracción se estima con los pares de cada bloque.
+    Devuelve (W dispersa, intensidad).
+    """
+    E = residuos.T
+    n, k = E.shape
+    varianzas = (E * E).sum(axis=0) / n
+    sd_segura = np.where(varianzas > 0, np.sqrt(varianzas), 1.0)
+    Es = E / sd_segura
+    if bloques is None:
+        bloques = np.arange(k)
+    orden = np.argsort(bloques, kind='stable')
+    cortes = np.flatnonzero(np.diff(bloques[orden])) + 1
+
+    filas, columnas, covarianzas = [], [], []
+    varianza_corr, denominador = 0.0, 0.0
+    for indices in np.split(orden, cortes):
+        if len(indices) < 2:
+            continue
+        cov = E[:, indices].T @ E[:, indices] / n
+        correlacion = cov / np.outer(sd_segura[indices], sd_segura[indices])
+        fuera = ~np.eye(len(indices), dtype=bool)
+        if n > 1:
+            Eb = Es[:, indices]
+            varianza_corr += ((Eb.T ** 2 @ Eb ** 2 - (Eb.T @ Eb) ** 2 / n) / (n * (n - 1)))[fuera].sum()
+        denominador += (correlacion[fuera] ** 2).sum()
+        i, j = np.nonzero(fuera)
+        filas.append(indices[i])
+        columnas.append(indices[j])
+        covarianzas.append(cov[fuera])
+    lambda_ = float(np.clip(varianza_corr / denominador, 0, 1)) if denominador > 0 else 1.0
+
+    diagonal = np.arange(k)
+    W = sparse.csr_matrix(
+        (
+            np.concatenate([_piso(varianzas)] + [(1 - lambda_) * c for c in covarianzas]),
+            (np.concatenate([diagonal] + filas), np.concatenate([diagonal] + columnas)),
+        ),
+        shape=(k, k),
+    )
+    return W, lambda_
+
+
+def restricciones(S):
+    """
+    Matriz dispersa U' = [I  -C] (agregados x nodos), con C las filas
+    agregadas de S: un vector de todos los nodos es coherente si U'y = 0.
+    """
+    n_agregados = S.shape[0] - S.shape[1]
+    return sparse.hstack([sparse.identity(n_agregados), -S[:n_agregados]]).tocsr()
+
+
+def reconciliar(base, S, metodo='MinT', residuos=None, bloques=None):
+    """
+    Pronósticos coherentes de todos los nodos.
+
+    `base` tiene una fila por nodo (en el orden de S) y una columna por
+    periodo; todos los periodos se reconcilian en la misma pasada. Se usa la
+    forma equivalente a S (S' W⁻¹ S)⁻¹ S' W⁻¹ ŷ que proyecta sobre las
+    restricciones, ŷ - W U (U' W U)⁻¹ U' ŷ: solo se resuelve un sistema
+    disperso del tamaño de los agregados. W es la identidad (OLS), la
+    diagonal de varianzas de los residuos (WLS) o su covarianza contraída
+    por `bloques` (MinT, ver `covarianza_contraida`).
+    """
+    m = S.shape[1]
+    if metodo == 'Bottom-up':
+        return S @ base[-m:]
+    if metodo in ('WLS', 'MinT') and residuos is None:
+        raise ValueError(f"{metodo} necesita los residuos en muestra de los pronósticos base")
+
+    Ut = restricciones(S)
+    if metodo == 'OLS':
+        WU = Ut.T
+    elif metodo == 'WLS':
+        WU = sparse.diags(_piso(residuos.var(axis=1))) @ Ut.T
+    elif metodo == 'MinT':
+        W, _ = covarianza_contraida(residuos, bloques)
+        WU = W @ Ut.T
+    else:
+        raise ValueError(f"Método de reconciliación desconocido: {metodo}")
+    K = (Ut @ WU).tocsc()
+    reconciliado = base - WU @ splu(K).solve(np.asarray(Ut @ base))
+    # Los agregados se rearman desde las series inferiores: coherencia exacta
+    return S @ reconciliado[-m:]
+
+
+def pronostico_jerarquico(df, columna='Cargo Fijo', horizonte=12, metodo='MinT', metodo_base='Holt',
+                          agregacion='promedio', ventana=36):
+    """
+    Pronóstico reconciliado de toda la jerarquía.
+
+    Devuelve un diccionario con la tabla de `nodos`, los DataFrames
+    `historico`, `base` y `reconciliado` (una fila por nodo y una columna
+    por fecha) y la máxima incoherencia antes y después de reconciliar.
+    """
+    claves, fechas, Y_inferior = matriz_historica(df, columna)
+    S, nodos = matriz_suma(claves, agregacion)
+    Y = S @ Y_inferior
+    base, residuos = pronostico_base(Y, horizonte, metodo_base, ventana)
+    reconciliado = reconciliar(base, S, metodo, residuos, bloques_municipio(nodos))
+    futuras = pd.date_range(fechas[-1] + pd.offsets.MonthBegin(1), periods=horizonte, freq='MS')
+    return {
+        'nodos': nodos,
+        'historico': pd.DataFrame(Y, columns=fechas),
+        'base': pd.DataFrame(base, columns=futuras),
+        'reconciliado': pd.DataFrame(reconciliado, columns=futuras),
+        'incoherencia_base': incoherencia(base, S),
+        'incoherencia_reconciliado': incoherencia(reconciliado, S),
+    }
@@ -0,0 +1,156 @@
+"""
+Tabla de tarifas e indicadores como dataset Parquet particionado.
+
+Cada año queda en su carpeta `Año=AAAA/` (y, con `por_municipio`, en
+`Año=AAAA/Municipio=.../`), con las filas ordenadas por municipio, estrato,
+servicio y fecha y grupos de filas con estadísticas min/max. Al leer un
+rango de años solo se abren las carpetas de esos años (poda de
+particiones), solo se decodifican las columnas pedidas (proyección) y,
+dentro de cada archivo, pyarrow salta los grupos de filas cuyas
+estadísticas no cumplen el filtro (por ejemplo, un municipio o un
+estrato). Agregar el mes nuevo reescribe solo la carpeta de su año.
+
+El archivo `_version` se reescribe en cada escritura; su fecha de
+modificación es la versión del dataset (`versiones.VigilanteArchivo`).
+
+Las páginas leen el dataset solo si se configura en TARIFAS_LAGO
+(`lago_configurado`): no se actualiza solo con las cargas a la base, así
+que tomarlo por estar en el disco mezclaría en una misma página cifras de
+dos fuentes con versiones distintas.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+RUTA_LAGO = 'data/lago_tarifas'
+ENTORNO_LAGO = 'TARIFAS_LAGO'
+MARCA_VERSION = '_version'
+FILAS_POR_GRUPO = 64 * 1024
+ORDEN = ['Municipio', 'Estrato', 'Servicio', 'Fecha']
+REINTENTOS_LECTURA = 3
+
+
+def es_lago(ruta):
+    """True si `ruta` es un dataset escrito con `escribir_lago`"""
+    return os.path.isfile(ruta_version(ruta))
+
+
+def lago_configurado():
+    """Ruta del dataset de TARIFAS_LAGO si está configurado y escrito, o None"""
+    ruta = os.getenv(ENTORNO_LAGO)
+    return ruta if ruta and es_lago(ruta) else None
+
+
+def ruta_version(ruta):
+    return os.path.join(str(ruta), MARCA_VERSION)
+
+
+def version(ruta):
+    """Versión del dataset (fecha de la última escritura), 0 si no existe"""
+    try:
+        return os.stat(ruta_version(ruta)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def escribir_lago(df, ruta, por_municipio=False, filas_por_grupo=FILAS_POR_GRUPO):
+    """
+    Escribir `df` (tabla preparada, con columna Año) particionado por año.
+    Los años presentes en `df` se reemplazan completos; los demás no se tocan.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    ruta = str(ruta)
+    os.makedirs(ruta, exist_ok=True)
+    df = df.sort_values([c for c in ORDEN if c in df.columns], kind='stable')
+    particiones = ['Año', 'Municipio'] if por_municipio else ['Año']
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+
+    # Se escribe aparte y cada año se cambia con dos renombres (el anterior sale y
+    # el nuevo entra): una lectura simultánea nunca ve un año a medio escribir,
+    # pero entre los dos renombres puede no ver ese año o perder sus archivos a
+    # mitad de la lectura (`leer_lago` reintenta). `_version` se reescribe
+    # después, así lo leído en ese momento queda en las cachés de la versión
+    # anterior y se descarta con la nueva
+    temporal = tempfile.mkdtemp(dir=ruta, prefix='.tmp-')
+    try:
+        ds.write_dataset(
+            tabla, temporal, format='parquet', partitioning=particiones, partitioning_flavor='hive',
+            basename_template='parte-{i}.parquet', max_rows_per_group=filas_por_grupo,
+            min_rows_per_group=min(filas_por_grupo, 8 * 1024), existing_data_behavior='overwrite_or_ignore',
+            file_options=ds.ParquetFileFormat().make_write_options(compression='zstd'),
+        )
+        for carpeta in sorted(os.listdir(temporal)):
+            destino = os.path.join(ruta, carpeta)
+            anterior = None
+            if os.path.exists(destino):
+                anterior = os.path.join(temporal, f".anterior-{carpeta}")
+                os.rename(destino, anterior)
+            os.rename(os.path.join(temporal, carpeta), destino)
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+    with open(ruta_version(ruta), 'w') as marca:
+        marca.write(str(time.time_ns()))
+
+
+def dataset(ruta):
+    import pyarrow.dataset as ds
+
+    return ds.dataset(str(ruta), format='parquet', partitioning='hive')
+
+
+def filtro_lago(anno_inicio=None, anno_fin=None, **valores):
+    """Expresión de pyarrow para un rango de años y valores por columna (uno o una lista)"""
+    import pyarrow.dataset as ds
+
+    condiciones = []
+    if anno_inicio is not None:
+        condiciones.append(ds.field('Año') >= int(anno_inicio))
+    if anno_fin is not None:
+        condiciones.append(ds.field('Año') <= int(anno_fin))
+    for columna, valor in valores.items():
+        if valor is None:
+            continue
+        if isinstance(valor, (list, tuple, set)):
+            condiciones.append(ds.field(columna).isin([str(v) for v in valor]))
+        else:
+            condiciones.append(ds.field(columna) == str(valor))
+    filtro = None
+    for condicion in condiciones:
+        filtro = condicion if filtro is None else filtro & condicion
+    return filtro
+
+
+def leer_lago(ruta, columnas=None, anno_inicio=None, anno_fin=None, **valores):
+    """
+    Filas de los años [anno_inicio, anno_fin] (y de los valores pedidos, p. ej.
+    Municipio=[...], Estrato='1') con solo `columnas`, como DataFrame.
+    """
+    filtro = filtro_lago(anno_inicio, anno_fin, **valores)
+    for intento in range(REINTENTOS_LECTURA):
+        try:
+            return dataset(ruta).to_table(columns=columnas, filter=filtro).to_pandas()
+        except FileNotFoundError:
+            # Un año cambiado por escribir_lago entre el listado y la lectura
+            if intento == REINTENTOS_LECTURA - 1:
+                raise
+            time.sleep(0.05)
+
+
+def años(ruta):
+    """Años disponibles, leídos de los nombres de las carpetas (sin abrir archivos)"""
+    import pyarrow.dataset as ds
+
+    return sorted({
+        int(ds.get_partition_keys(fragmento.partition_expression)['Año'])
+        for fragmento in dataset(ruta).get_fragments()
+    })
+
+
+def valores(ruta, columna):
+    """Valores distintos de una columna leyendo solo esa columna"""
+    return sorted(map(str, dataset(ruta).to_table(columns=[columna]).column(columna).unique().to_pylist()))
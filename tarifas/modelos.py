@@ -0,0 +1,125 @@
+"""
+Modelos predictivos de tarifas (Prophet, ARIMA y XGBoost) compartidos por
+el dashboard principal y el módulo de predicciones.
+
+Prophet, statsmodels y xgboost se importan dentro de cada función: cargar
+este módulo solo cuesta pandas/numpy y las páginas pintan antes de entrenar.
+
+Todos los modelos aceptan `cambios`, fechas de cambios de nivel conocidos
+(ver `tarifas.anomalias`): Prophet y ARIMA los usan como regresores
+escalón (Prophet conserva sus puntos de cambio automáticos de la tendencia)
+y XGBoost como el régimen vigente en cada mes.
+"""
+
+import numpy as np
+import pandas as pd
+
+MODELOS_DISPONIBLES = ["Prophet", "ARIMA", "XGBoost"]
+
+
+def preparar_serie(df_filtrado, columna='Cargo Fijo'):
+    """Convertir una serie filtrada al formato ds/y"""
+    return df_filtrado[['Fecha', columna]].rename(columns={'Fecha': 'ds', columna: 'y'})
+
+
+def inferir_frecuencia(fechas):
+    """Frecuencia de la serie, mensual si no se puede inferir"""
+    return pd.infer_freq(fechas) or 'M'
+
+
+def fechas_futuras(fechas, horizonte, frecuencia):
+    """Fechas del horizonte de predicción a continuación de la serie"""
+    return pd.date_range(
+        start=fechas.iloc[-1] + pd.tseries.frequencies.to_offset(frecuencia),
+        periods=horizonte,
+        freq=frecuencia
+    )
+
+
+def cambios_internos(serie, cambios):
+    """Fechas de `cambios` estrictamente dentro del rango de la serie"""
+    if not cambios:
+        return []
+    inicio, fin = serie['ds'].min(), serie['ds'].max()
+    return sorted({pd.Timestamp(c) for c in cambios if inicio < pd.Timestamp(c) <= fin})
+
+
+def escalones(fechas, cambios):
+    """Matriz (fechas x cambios) con 1 desde cada cambio en adelante"""
+    fechas = pd.to_datetime(pd.Series(fechas)).to_numpy()
+    return (fechas[:, None] >= np.array(cambios, dtype='datetime64[ns]')[None, :]).astype(float)
+
+
+def ajustar_prophet(serie, horizonte, frecuencia='M', interval_width=0.95, cambios=None):
+    """Entrenar Prophet y devolver el pronóstico sobre histórico y futuro"""
+    from prophet import Prophet
+
+    cambios = cambios_internos(serie, cambios)
+    modelo = Prophet(interval_width=interval_width)
+    # Cada cambio de nivel es un regresor escalón; la tendencia sigue con sus puntos de cambio automáticos
+    nombres = [f'cambio_{i}' for i in range(len(cambios))]
+    for nombre in nombres:
+        modelo.add_regressor(nombre)
+    if cambios:
+        serie = serie.assign(**dict(zip(nombres, escalones(serie['ds'], cambios).T)))
+    modelo.fit(serie)
+    future = modelo.make_future_dataframe(periods=horizonte, freq=frecuencia)
+    if cambios:
+        future = future.assign(**dict(zip(nombres, escalones(future['ds'], cambios).T)))
+    return modelo.predict(future)
+
+
+def pronostico_prophet(serie, horizonte, frecuencia, nivel_confianza, cambios=None):
+    """Predicción e intervalos de Prophet para el horizonte"""
+    forecast = ajustar_prophet(serie, horizonte, frecuencia, nivel_confianza / 100, cambios).tail(horizonte)
+    return forecast['yhat'].values, forecast['yhat_lower'].values, forecast['yhat_upper'].values
+
+
+def pronostico_arima(serie, horizonte, frecuencia, nivel_confianza, cambios=None):
+    """Predicción e intervalos de ARIMA(1, 1, 1) para el horizonte"""
+    from statsmodels.tsa.arima.model import ARIMA
+
+    cambios = cambios_internos(serie, cambios)
+    exog = escalones(serie['ds'], cambios) if cambios else None
+    modelo_arima = ARIMA(serie['y'], exog=exog, order=(1, 1, 1)).fit()
+    forecast = modelo_arima.get_forecast(steps=horizonte, exog=np.ones((horizonte, len(cambios))) if cambios else None)
+    conf = forecast.conf_int(alpha=1 - nivel_confianza / 100)
+    return forecast.predicted_mean.values, conf.iloc[:, 0].values, conf.iloc[:, 1].values
+
+
+def pronostico_xgboost(serie, horizonte, frecuencia, nivel_confianza, cambios=None):
+    """Predicción de XGBoost con mes y año (y régimen) como variables e intervalo por residuos"""
+    from xgboost import XGBRegressor
+
+    cambios = cambios_internos(serie, cambios)
+    variables = ['mes', 'año'] + (['regimen'] if cambios else [])
+    df_xgb = serie.copy()
+    df_xgb['mes'] = df_xgb['ds'].dt.month
+    df_xgb['año'] = df_xgb['ds'].dt.year
+    if cambios:
+        df_xgb['regimen'] = escalones(df_xgb['ds'], cambios).sum(axis=1)
+    X = df_xgb[variables]
+    y = df_xgb['y']
+    modelo_xgb = XGBRegressor(n_estimators=100)
+    modelo_xgb.fit(X, y)
+    futuras = pd.DataFrame({'ds': fechas_futuras(serie['ds'], horizonte, frecuencia)})
+    futuras['mes'] = futuras['ds'].dt.month
+    futuras['año'] = futuras['ds'].dt.year
+    futuras['regimen'] = len(cambios)
+    pred = modelo_xgb.predict(futuras[variables])
+    std = np.std(y - modelo_xgb.predict(X))
+    return pred, pred - 1.96 * std, pred + 1.96 * std
+
+
+PRONOSTICADORES = {
+    "Prophet": pronostico_prophet,
+    "ARIMA": pronostico_arima,
+    "XGBoost": pronostico_xgboost
+}
+
+
+def pronosticar(serie, modelo, horizonte, nivel_confianza=95, frecuencia=None, cambios=None):
+    """Devolver (predicción, límite inferior, límite superior) de un modelo"""
+    if frecuencia is None:
+        frecuencia = inferir_frecuencia(serie['ds'])
+    return PRONOSTICADORES[modelo](serie, horizonte, frecuencia, nivel_confianza, cambios)
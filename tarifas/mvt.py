@@ -0,0 +1,268 @@
+"""
+Teselas vectoriales (Mapbox Vector Tiles) de capas de polígonos.
+
+`construir_piramide` corta la capa (municipios, veredas, barrios...) en una
+pirámide de teselas MVT guardada como MBTiles con formato `pbf`, que sirve
+el mismo servidor local de teselas (`run_tiles.py`). En cada zoom la
+geometría se simplifica a la resolución de la tesela, se recorta con un
+margen y se ajusta a la cuadrícula entera de la tesela, de modo que el
+navegador solo descarga la geometría visible y con el detalle del zoom.
+
+Las teselas llevan solo la clave de unión y el nombre de cada polígono; los
+valores del indicador viajan aparte en una tabla compacta y se unen en el
+navegador, así cambiar de indicador o de período no vuelve a generar
+teselas. El codificador implementa el subconjunto de la especificación
+MVT 2.1 que usan los polígonos.
+"""
+
+import gzip
+import json
+import math
+import os
+import struct
+
+import numpy as np
+
+EXTENSION = 4096
+MARGEN = 64
+ZOOM_MINIMO = 6
+ZOOM_MAXIMO = 13
+ORIGEN_MERCATOR = 20037508.342789244
+
+_MOVER, _LINEA, _CERRAR = 1, 2, 7
+_POLIGONO = 3
+
+
+# ======================== Codificación protobuf ========================
+
+def _varint(n):
+    salida = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            salida.append(byte | 0x80)
+        else:
+            salida.append(byte)
+            return bytes(salida)
+
+
+def _zigzag(n):
+    return (n << 1) if n >= 0 else ((-n) << 1) - 1
+
+
+def _clave(numero, tipo):
+    return _varint((numero << 3) | tipo)
+
+
+def _mensaje(numero, datos):
+    return _clave(numero, 2) + _varint(len(datos)) + datos
+
+
+def _empaquetado(numero, enteros):
+    return _mensaje(numero, b''.join(_varint(v) for v in enteros))
+
+
+def _valor(valor):
+    """Mensaje Value de MVT"""
+    if isinstance(valor, (bool, np.bool_)):
+        return _clave(7, 0) + _varint(int(valor))
+    if isinstance(valor, (int, np.integer)):
+        return _clave(6, 0) + _varint(_zigzag(int(valor)))
+    if isinstance(valor, (float, np.floating)):
+        return _clave(3, 1) + struct.pack('<d', float(valor))
+    return _mensaje(1, str(valor).encode('utf-8'))
+
+
+def comandos_poligono(geometria):
+    """
+    Comandos de geometría MVT de un Polygon o MultiPolygon ya en coordenadas
+    enteras de la tesela y con los anillos exteriores de área positiva.
+    """
+    comandos = []
+    cursor_x = cursor_y = 0
+    poligonos = geometria.geoms if geometria.geom_type == 'MultiPolygon' else [geometria]
+    for poligono in poligonos:
+        for anillo in [poligono.exterior, *poligono.interiors]:
+            puntos = np.asarray(anillo.coords, dtype=np.int64)[:-1]
+            if len(puntos) > 1:
+                # Sin vértices repetidos consecutivos (el ajuste a la cuadrícula los produce)
+                distinto = np.any(puntos != np.roll(puntos, 1, axis=0), axis=1)
+                puntos = puntos[distinto]
+            if len(puntos) < 3:
+                continue
+            deltas = np.diff(np.vstack([[cursor_x, cursor_y], puntos]), axis=0)
+            comandos.append(_MOVER | (1 << 3))
+            comandos.extend(_zigzag(int(d)) for d in deltas[0])
+            comandos.append(_LINEA | ((len(puntos) - 1) << 3))
+            for dx, dy in deltas[1:]:
+                comandos.append(_zigzag(int(dx)))
+                comandos.append(_zigzag(int(dy)))
+            comandos.append(_CERRAR | (1 << 3))
+            cursor_x, cursor_y = (int(v) for v in puntos[-1])
+    return comandos
+
+
+def codificar_capa(nombre, elementos, extension=EXTENSION):
+    """
+    Mensaje Layer de MVT. `elementos` son tuplas (id, geometría en
+    coordenadas de la tesela, propiedades).
+    """
+    claves, valores = {}, {}
+    features = []
+    for identificador, geometria, propiedades in elementos:
+        comandos = comandos_poligono(geometria)
+        if not comandos:
+            continue
+        etiquetas = []
+        for clave, valor in propiedades.items():
+            if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+                continue
+            etiquetas.append(claves.setdefault(clave, len(claves)))
+            codificado = _valor(valor)
+            etiquetas.append(valores.setdefault(codificado, len(valores)))
+        features.append(_mensaje(2, (
+            _clave(1, 0) + _varint(int(identificador))
+            + _empaquetado(2, etiquetas)
+            + _clave(3, 0) + _varint(_POLIGONO)
+            + _empaquetado(4, comandos)
+        )))
+    if not features:
+        return b''
+    return (
+        _clave(15, 0) + _varint(2)
+        + _mensaje(1, nombre.encode('utf-8'))
+        + b''.join(features)
+        + b''.join(_mensaje(3, clave.encode('utf-8')) for clave in claves)
+        + b''.join(_mensaje(4, valor) for valor in valores)
+        + _clave(5, 0) + _varint(extension)
+    )
+
+
+def codificar_tesela(capas):
+    """Tesela MVT con las capas ya codificadas (se omiten las vacías)"""
+    return b''.join(_mensaje(3, capa) for capa in capas if capa)
+
+
+# ======================== Pirámide ========================
+
+def tamaño_tesela(z):
+    """Lado de una tesela del zoom `z` en metros (Web Mercator)"""
+    return 2 * ORIGEN_MERCATOR / 2 ** z
+
+
+def teselas_limites(limites, z):
+    """(z, x, y) de las teselas que cubren unos límites en Web Mercator"""
+    minx, miny, maxx, maxy = limites
+    lado = tamaño_tesela(z)
+    ultimo = 2 ** z - 1
+    x0 = min(max(int((minx + ORIGEN_MERCATOR) // lado), 0), ultimo)
+    x1 = min(max(int((maxx + ORIGEN_MERCATOR) // lado), 0), ultimo)
+    y0 = min(max(int((ORIGEN_MERCATOR - maxy) // lado), 0), ultimo)
+    y1 = min(max(int((ORIGEN_MERCATOR - miny) // lado), 0), ultimo)
+    for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+            yield z, x, y
+
+
+def geometrias_tesela(geometrias, arbol, z, x, y, extension=EXTENSION, margen=MARGEN):
+    """
+    Índices y geometrías recortadas de la tesela, en coordenadas enteras
+    (0..extension, eje y hacia abajo) y con los anillos orientados para MVT.
+    """
+    import shapely
+    from shapely.geometry import box
+
+    lado = tamaño_tesela(z)
+    oeste = -ORIGEN_MERCATOR + x * lado
+    norte = ORIGEN_MERCATOR - y * lado
+    borde = margen * lado / extension
+    recorte = (oeste - borde, norte - lado - borde, oeste + lado + borde, norte + borde)
+
+    indices = arbol.query(box(*recorte), predicate='intersects')
+    if len(indices) == 0:
+        return indices, np.array([], dtype=object)
+    recortadas = shapely.clip_by_rect(geometrias[indices], *recorte)
+    escala = extension / lado
+    en_tesela = shapely.transform(
+        recortadas, lambda c: np.column_stack(((c[:, 0] - oeste) * escala, (norte - c[:, 1]) * escala))
+    )
+    # Ajuste a la cuadrícula entera conservando la validez; los polígonos que se
+    # reducen a nada a este zoom quedan vacíos
+    en_tesela = shapely.set_precision(en_tesela, 1.0)
+    en_tesela = shapely.orient_polygons(en_tesela, exterior_cw=False)
+    poligonales = np.isin(shapely.get_type_id(en_tesela), (3, 6)) & ~shapely.is_empty(en_tesela)
+    return indices[poligonales], en_tesela[poligonales]
+
+
+def construir_piramide(gdf, ruta, capa='municipios', clave='MpNombre_norm', propiedades=('MpNombre',),
+                       zoom_minimo=ZOOM_MINIMO, zoom_maximo=ZOOM_MAXIMO, extension=EXTENSION, margen=MARGEN,
+                       progreso=None):
+    """
+    Escribir en el MBTiles `ruta` la pirámide MVT de los polígonos de `gdf`.
+
+    Cada elemento lleva `clave` (con la que el navegador une los valores) y
+    las `propiedades` pedidas. Devuelve un dict con el número de teselas y
+    los bytes escritos por zoom.
+    """
+    import shapely
+
+    from tarifas import teselas
+
+    gdf = gdf.to_crs(epsg=3857)
+    columnas = [clave, *[p for p in propiedades if p != clave]]
+    atributos = gdf[columnas].astype(object).where(gdf[columnas].notna(), None).to_numpy()
+    originales = np.asarray(gdf.geometry.array, dtype=object)
+    limites = tuple(gdf.total_bounds)
+
+    # Se escribe aparte y se reemplaza al final: no quedan teselas de una versión anterior
+    temporal = f"{ruta}.tmp"
+    if os.path.exists(temporal):
+        os.remove(temporal)
+    archivo = teselas.MBTiles(temporal, escritura=True)
+    resumen = {}
+    try:
+        for z in range(zoom_minimo, zoom_maximo + 1):
+            # Simplificación a un cuarto de la unidad de la tesela en este zoom
+            tolerancia = tamaño_tesela(z) / extension / 4
+            geometrias = shapely.simplify(originales, tolerancia, preserve_topology=True)
+            arbol = shapely.STRtree(geometrias)
+            lote, escritos = [], 0
+            for _, x, y in teselas_limites(limites, z):
+                indices, recortadas = geometrias_tesela(geometrias, arbol, z, x, y, extension, margen)
+                if len(indices) == 0:
+                    continue
+                elementos = [
+                    (indice + 1, geometria, dict(zip(columnas, atributos[indice])))
+                    for indice, geometria in zip(indices, recortadas)
+                ]
+                datos = codificar_tesela([codificar_capa(capa, elementos, extension)])
+                if not datos:
+                    continue
+                datos = gzip.compress(datos)
+                lote.append((z, x, y, datos))
+                escritos += len(datos)
+            archivo.escribir(lote)
+            resumen[z] = {'teselas': len(lote), 'bytes': escritos}
+            if progreso:
+                progreso(z, resumen[z])
+
+        oeste, sur, este, norte = gdf.to_crs(epsg=4326).total_bounds
+        archivo.guardar_metadatos({
+            'name': capa,
+            'format': 'pbf',
+            'type': 'overlay',
+            'version': '1.3',
+            'bounds': f"{oeste},{sur},{este},{norte}",
+            'center': f"{(oeste + este) / 2},{(sur + norte) / 2},{zoom_minimo + 2}",
+            'minzoom': zoom_minimo,
+            'maxzoom': zoom_maximo,
+            'json': json.dumps({'vector_layers': [{
+                'id': capa, 'minzoom': zoom_minimo, 'maxzoom': zoom_maximo,
+                'fields': {columna: 'String' for columna in columnas},
+            }]}, ensure_ascii=False),
+        })
+    finally:
+        archivo.cerrar()
+    os.replace(temporal, ruta)
+    return resumen
@@ -0,0 +1,236 @@
+"""
+Planificador de ajustes de modelos con prioridades y control de admisión.
+
+Los ajustes de Prophet, ARIMA y XGBoost de todas las sesiones de un proceso
+pasan por un pool acotado de hilos en lugar de correr en el hilo de cada
+sesión. La cola atiende primero la clase de mayor prioridad:
+
+- INTERACTIVA: el KPI del dashboard principal, que el usuario está esperando.
+- COMPARACION: la comparación detallada de modelos en Predicciones.
+- FONDO: precálculos que nadie espera (otras series del mismo municipio).
+
+Cada sesión puede tener a lo sumo `limite_sesion` ajustes en ejecución, así
+una sesión que pide muchos modelos no acapara el pool; lo que excede espera
+en la cola sin bloquear a las demás. Las colas tienen un tamaño máximo por
+clase y al llenarse se rechaza el ajuste (`ColaLlena`) en lugar de dejar que
+todo se vuelva lento a la vez.
+
+BLAS/OpenMP (xgboost, numpy) se limita a `hilos_por_ajuste` una sola vez
+para todo el proceso (`limitar_hilos`), de modo que trabajadores x hilos no
+supere los núcleos: el límite es global, y cambiarlo por ajuste desde varios
+hilos a la vez deja el valor de otro hilo como "original" al restaurar. Se
+aplica al arrancar, antes de la precarga de módulos (`tarifas.precarga`),
+y no al crear el planificador: threadpoolctl recorre las bibliotecas
+cargadas y, si otro hilo está importando una extensión en C en ese momento,
+el proceso se bloquea. Con varios procesos (`run_dashboard.py --trabajadores
+N`) el reparto lo fijan TARIFAS_AJUSTES y TARIFAS_HILOS_AJUSTE.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import pandas as pd
+
+INTERACTIVA = 0
+COMPARACION = 1
+FONDO = 2
+CLASES = {INTERACTIVA: 'Interactiva', COMPARACION: 'Comparación', FONDO: 'Fondo'}
+
+LIMITE_SESION = 2
+# Variables que leen OpenMP y las bibliotecas BLAS al cargarse
+VARIABLES_HILOS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+MAX_COLA = {INTERACTIVA: 64, COMPARACION: 128, FONDO: 256}
+MUESTRAS_METRICAS = 500
+
+
+class ColaLlena(RuntimeError):
+    """La cola de la clase de prioridad está llena; el ajuste no se admite"""
+
+
+def trabajadores_por_defecto():
+    return int(os.getenv('TARIFAS_AJUSTES') or max(1, (os.cpu_count() or 1)))
+
+
+def hilos_por_defecto(trabajadores):
+    return int(os.getenv('TARIFAS_HILOS_AJUSTE') or max(1, (os.cpu_count() or 1) // trabajadores))
+
+
+_lock_hilos = threading.Lock()
+_hilos_limitados = None
+
+
+def limitar_hilos(hilos=None):
+    """
+    Limitar BLAS/OpenMP a `hilos` (por defecto los del planificador del
+    proceso) una sola vez por proceso: las bibliotecas ya cargadas con
+    threadpoolctl y las que se carguen después con las variables de entorno
+    (si no están ya definidas). Debe llamarse antes de que otro hilo importe
+    módulos con extensiones en C; devuelve el límite aplicado.
+    """
+    global _hilos_limitados
+    with _lock_hilos:
+        if _hilos_limitados is None:
+            from threadpoolctl import threadpool_limits
+
+            hilos = hilos or hilos_por_defecto(trabajadores_por_defecto())
+            for variable in VARIABLES_HILOS:
+                os.environ.setdefault(variable, str(hilos))
+            threadpool_limits(limits=hilos)
+            _hilos_limitados = hilos
+        return _hilos_limitados
+
+
+class _Metricas:
+    """Tiempos recientes de espera y de ajuste de una clase"""
+
+    def __init__(self):
+        self.enviados = 0
+        self.rechazados = 0
+        self.completados = 0
+        self.fallidos = 0
+        self.esperas = deque(maxlen=MUESTRAS_METRICAS)
+        self.ajustes = deque(maxlen=MUESTRAS_METRICAS)
+
+
+class PlanificadorAjustes:
+    """Pool acotado de hilos con cola por prioridad y límite de ajustes por sesión"""
+
+    def __init__(self, trabajadores=None, hilos_por_ajuste=None, limite_sesion=LIMITE_SESION, max_cola=None):
+        self.trabajadores = trabajadores or trabajadores_por_defecto()
+        self.hilos_por_ajuste = hilos_por_ajuste or hilos_por_defecto(self.trabajadores)
+        self.limite_sesion = limite_sesion
+        self.max_cola = {**MAX_COLA, **(max_cola or {})}
+        self._cola = []
+        self._secuencia = itertools.count()
+        self._en_cola = {clase: 0 for clase in CLASES}
+        self._por_sesion = {}
+        self._en_ejecucion = 0
+        self._metricas = {clase: _Metricas() for clase in CLASES}
+        self._condicion = threading.Condition()
+        self._hilos = [
+            threading.Thread(target=self._trabajar, name=f'ajustes-{i}', daemon=True)
+            for i in range(self.trabajadores)
+        ]
+        for hilo in self._hilos:
+            hilo.start()
+
+    def enviar(self, funcion, *args, prioridad=COMPARACION, sesion=None, **kwargs):
+        """Encolar `funcion(*args, **kwargs)`; devuelve un Future o lanza ColaLlena"""
+        futuro = Future()
+        with self._condicion:
+            metricas = self._metricas[prioridad]
+            if self._en_cola[prioridad] >= self.max_cola[prioridad]:
+                metricas.rechazados += 1
+                raise ColaLlena(f"Cola {CLASES[prioridad]} llena ({self.max_cola[prioridad]} ajustes en espera)")
+            metricas.enviados += 1
+            self._en_cola[prioridad] += 1
+            heapq.heappush(self._cola, (prioridad, next(self._secuencia), time.perf_counter(), sesion,
+                                        futuro, funcion, args, kwargs))
+            self._condicion.notify()
+        return futuro
+
+    def ejecutar(self, funcion, *args, prioridad=COMPARACION, sesion=None, **kwargs):
+        """Encolar y esperar el resultado"""
+        return self.enviar(funcion, *args, prioridad=prioridad, sesion=sesion, **kwargs).result()
+
+    def _siguiente(self):
+        """Primera tarea de la cola cuya sesión no está en su límite (con el lock tomado)"""
+        omitidas = []
+        tarea = None
+        while self._cola:
+            candidata = heapq.heappop(self._cola)
+            sesion = candidata[3]
+            if sesion is None or self._por_sesion.get(sesion, 0) < self.limite_sesion:
+                tarea = candidata
+                break
+            omitidas.append(candidata)
+        for omitida in omitidas:
+            heapq.heappush(self._cola, omitida)
+        return tarea
+
+    def _trabajar(self):
+        while True:
+            with self._condicion:
+                tarea = self._siguiente()
+                while tarea is None:
+                    self._condicion.wait()
+                    tarea = self._siguiente()
+                prioridad, _, encolado, sesion, futuro, funcion, args, kwargs = tarea
+                self._en_cola[prioridad] -= 1
+                self._en_ejecucion += 1
+                if sesion is not None:
+                    self._por_sesion[sesion] = self._por_sesion.get(sesion, 0) + 1
+            inicio = time.perf_counter()
+            exito = False
+            if futuro.set_running_or_notify_cancel():
+                try:
+                    futuro.set_result(funcion(*args, **kwargs))
+                    exito = True
+                except BaseException as e:
+                    futuro.set_exception(e)
+            fin = time.perf_counter()
+            with self._condicion:
+                self._en_ejecucion -= 1
+                if sesion is not None:
+                    self._por_sesion[sesion] -= 1
+                    if not self._por_sesion[sesion]:
+                        del self._por_sesion[sesion]
+                metricas = self._metricas[prioridad]
+                metricas.esperas.append(inicio - encolado)
+                metricas.ajustes.append(fin - inicio)
+                if exito:
+                    metricas.completados += 1
+                else:
+                    metricas.fallidos += 1
+                # Un hueco de sesión liberado puede destrabar tareas omitidas
+                self._condicion.notify_all()
+
+    def metricas(self):
+        """Métricas por clase: envíos, rechazos, cola y percentiles de espera y ajuste (s)"""
+        filas = []
+        with self._condicion:
+            for clase, nombre in CLASES.items():
+                metricas = self._metricas[clase]
+                esperas = pd.Series(metricas.esperas, dtype=float)
+                ajustes = pd.Series(metricas.ajustes, dtype=float)
+                filas.append({
+                    'Clase': nombre,
+                    'Enviados': metricas.enviados,
+                    'Rechazados': metricas.rechazados,
+                    'Completados': metricas.completados,
+                    'Fallidos': metricas.fallidos,
+                    'En cola': self._en_cola[clase],
+                    'Espera p50 (s)': esperas.quantile(0.5),
+                    'Espera p95 (s)': esperas.quantile(0.95),
+                    'Ajuste p50 (s)': ajustes.quantile(0.5),
+                    'Ajuste p95 (s)': ajustes.quantile(0.95),
+                })
+        return pd.DataFrame(filas)
+
+    def estado(self):
+        with self._condicion:
+            return {
+                'trabajadores': self.trabajadores,
+                'hilos_por_ajuste': self.hilos_por_ajuste,
+                'en_ejecucion': self._en_ejecucion,
+                'en_cola': sum(self._en_cola.values()),
+                'sesiones_activas': len(self._por_sesion),
+            }
+
+
+_lock = threading.Lock()
+_planificador = None
+
+
+def planificador():
+    """Planificador del proceso (se crea en el primer uso)"""
+    global _planificador
+    with _lock:
+        if _planificador is None:
+            _planificador = PlanificadorAjustes()
+        return _planificador
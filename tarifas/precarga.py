@@ -0,0 +1,46 @@
+"""
+Precarga en segundo plano de las librerías pesadas (modelos y SIG).
+
+Las páginas importan solo pandas y plotly al inicio; este hilo importa
+prophet, statsmodels, xgboost, geopandas y folium mientras se pinta la
+primera vista, de modo que al llegar a un modelo o al mapa ya están en
+`sys.modules`. Se inicia una sola vez por proceso del servidor, después
+de limitar los hilos de BLAS/OpenMP (`planificador.limitar_hilos`), que no
+puede correr mientras otro hilo importa.
+"""
+
+import importlib
+import threading
+
+from tarifas import planificador
+
+# En orden de necesidad: Prophet se usa en la primera vista del Home
+MODULOS_PESADOS = [
+    'prophet',
+    'geopandas',
+    'folium',
+    'statsmodels.tsa.arima.model',
+    'xgboost',
+]
+
+_lock = threading.Lock()
+_hilo = None
+
+
+def _importar(modulos):
+    for modulo in modulos:
+        try:
+            importlib.import_module(modulo)
+        except ImportError:
+            continue
+
+
+def iniciar_precarga(modulos=MODULOS_PESADOS):
+    """Iniciar (una vez por proceso) el hilo que importa los módulos pesados"""
+    global _hilo
+    with _lock:
+        if _hilo is None:
+            planificador.limitar_hilos()
+            _hilo = threading.Thread(target=_importar, args=(list(modulos),), name='precarga-modulos', daemon=True)
+            _hilo.start()
+    return _hilo
@@ -0,0 +1,338 @@
+"""
+Seguimiento de la precisión de los pronósticos contra los valores reales.
+
+Cada pronóstico que se sirve o se precalcula (dashboard principal,
+Predicciones, API) se guarda como una instantánea: serie, modelo, fecha de
+origen (último mes con datos), horizonte, predicción e intervalo. Las
+instantáneas se acumulan en memoria y se escriben en partes Parquet nuevas
+bajo `pronosticos/`; nunca se modifican.
+
+Cuando llegan datos nuevos (`actualizar`, una vez por versión de los
+datos), los errores se calculan de forma incremental: las partes ya
+evaluadas solo se cruzan con los meses posteriores a la marca de su serie
+(el último mes real ya cruzado, con filtro por `Periodo` sobre el Parquet) y
+las partes nuevas con todos los meses. Los errores van a partes de
+`errores/` y sus sumas por serie, modelo y horizonte a `agregados.parquet`,
+de donde las páginas leen MAPE, RMSE y cobertura sin recorrer los errores.
+
+Un mismo pronóstico servido por varios procesos o sesiones tiene el mismo
+`Id` y se cuenta una sola vez.
+"""
+
+import atexit
+import contextlib
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos, los duplicados se descartan por Id
+    fcntl = None
+
+ENTORNO_DIRECTORIO = 'TARIFAS_PRECISION_DIR'
+RUTA_PRECISION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'precision')
+FILAS_BUFFER = 5000
+SEGUNDOS_BUFFER = 60
+MAX_PARTES = 64
+
+CLAVES = ['Municipio', 'Estrato', 'Servicio']
+SERIE = CLAVES + ['Columna']
+SUMAS = ['N', 'NPorc', 'SumaAbsPorc', 'SumaAbs', 'SumaCuad', 'Dentro']
+
+logger = logging.getLogger(__name__)
+
+
+def periodo(fechas):
+    """Clave entera AAAAMM de cada fecha (el día del mes no importa al cruzar)"""
+    fechas = pd.DatetimeIndex(pd.to_datetime(fechas))
+    return (fechas.year * 100 + fechas.month).astype('int32')
+
+
+def instantanea(municipio, estrato, servicio, modelo, origen, fechas, prediccion, inferior, superior,
+                nivel_confianza=95, columna='Cargo Fijo', fuente='', variante=''):
+    """Filas de un pronóstico (una por mes posterior al origen) con su Id"""
+    origen = pd.Timestamp(origen)
+    identificador = hashlib.sha1(repr(
+        (str(municipio), str(estrato), str(servicio), columna, modelo, origen.strftime('%Y-%m'),
+         int(nivel_confianza), fuente, variante)
+    ).encode('utf-8')).hexdigest()[:16]
+    fechas = pd.DatetimeIndex(pd.to_datetime(fechas))
+    # Horizonte en meses calendario desde el origen; con frecuencia 'M' sobre fechas de
+    # inicio de mes la primera fecha cae en el mismo mes del origen y no es un pronóstico
+    horizonte = (fechas.year - origen.year) * 12 + (fechas.month - origen.month)
+    filas = pd.DataFrame({
+        'Id': identificador,
+        'Municipio': str(municipio), 'Estrato': str(estrato), 'Servicio': str(servicio), 'Columna': columna,
+        'Modelo': modelo, 'Fuente': fuente, 'Variante': variante,
+        'Origen': origen, 'Fecha': fechas, 'Periodo': periodo(fechas),
+        'Horizonte': np.asarray(horizonte, dtype='int16'),
+        'Prediccion': np.asarray(prediccion, dtype='float64'),
+        'Inferior': np.asarray(inferior, dtype='float64'),
+        'Superior': np.asarray(superior, dtype='float64'),
+        'Nivel': np.int16(nivel_confianza),
+        'Registrado': pd.Timestamp.now(),
+    })
+    return filas[filas['Horizonte'] > 0].reset_index(drop=True)
+
+
+def _escribir_parte(df, directorio):
+    """Escribir `df` como una parte Parquet nueva (archivo temporal + renombrar)"""
+    os.makedirs(directorio, exist_ok=True)
+    nombre = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}.parquet"
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+    os.close(descriptor)
+    try:
+        df.to_parquet(temporal, index=False)
+        os.replace(temporal, os.path.join(directorio, nombre))
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return nombre
+
+
+def _leer_partes(directorio, nombres, columnas=None, filtros=None):
+    import pyarrow.parquet as pq
+
+    rutas = [os.path.join(directorio, n) for n in nombres]
+    if not rutas:
+        return pd.DataFrame(columns=columnas)
+    return pq.ParquetDataset(rutas, filters=filtros).read(columns=columnas).to_pandas()
+
+
+class AlmacenPrecision:
+    """Instantáneas de pronósticos, errores realizados y sus agregados en un directorio"""
+
+    def __init__(self, directorio):
+        self.directorio = str(directorio)
+        self.dir_pronosticos = os.path.join(self.directorio, 'pronosticos')
+        self.dir_errores = os.path.join(self.directorio, 'errores')
+        self.ruta_estado = os.path.join(self.directorio, 'estado.pkl')
+        self.ruta_agregados = os.path.join(self.directorio, 'agregados.parquet')
+        self._buffer = []
+        self._filas = 0
+        self._desde = None
+        self._lock = threading.Lock()
+
+    # -------------------- Instantáneas --------------------
+
+    def registrar(self, filas):
+        """Agregar las filas de un pronóstico (ver `instantanea`); se escriben por lotes"""
+        with self._lock:
+            self._buffer.append(filas)
+            self._filas += len(filas)
+            self._desde = self._desde or time.monotonic()
+            lleno = self._filas >= FILAS_BUFFER or time.monotonic() - self._desde >= SEGUNDOS_BUFFER
+        if lleno:
+            self.guardar()
+
+    def guardar(self):
+        """Escribir las instantáneas pendientes como una parte nueva"""
+        with self._lock:
+            pendientes, self._buffer, self._filas, self._desde = self._buffer, [], 0, None
+        if pendientes:
+            _escribir_parte(pd.concat(pendientes, ignore_index=True), self.dir_pronosticos)
+
+    def partes(self, directorio=None):
+        return sorted(os.path.basename(r) for r in glob.glob(os.path.join(directorio or self.dir_pronosticos, '*.parquet')))
+
+    def pronosticos(self, columnas=None, filtros=None):
+        """Todas las instantáneas guardadas (con filtros de pyarrow opcionales)"""
+        return _leer_partes(self.dir_pronosticos, self.partes(), columnas, filtros)
+
+    # -------------------- Errores --------------------
+
+    def _estado(self):
+        try:
+            with open(self.ruta_estado, 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return {'partes': set(), 'marcas': pd.DataFrame(columns=CLAVES + ['Marca']), 'generacion': 0}
+
+    def _guardar_estado(self, estado):
+        descriptor, temporal = tempfile.mkstemp(dir=self.directorio, suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as f:
+            pickle.dump(estado, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, self.ruta_estado)
+
+    @contextlib.contextmanager
+    def _bloqueo(self):
+        """Un solo proceso actualiza los errores a la vez"""
+        os.makedirs(self.directorio, exist_ok=True)
+        with open(os.path.join(self.directorio, '.bloqueo'), 'w') as archivo:
+            if fcntl is not None:
+                fcntl.flock(archivo, fcntl.LOCK_EX)
+            yield
+
+    @property
+    def generacion(self):
+        """Número que cambia cada vez que se agregan errores nuevos"""
+        return self._estado()['generacion']
+
+    def actualizar(self, reales):
+        """
+        Calcular los errores de los pronósticos cuyos meses ya tienen valor
+        real en `reales` (tabla de tarifas) sin repetir los ya calculados.
+        Devuelve la generación de los agregados.
+        """
+        self.guardar()
+        with self._bloqueo():
+            estado = self._estado()
+            partes = self.partes()
+            nuevas = [p for p in partes if p not in estado['partes']]
+            viejas = [p for p in partes if p in estado['partes']]
+            marcas = self._marcas(reales)
+
+            candidatas = [_leer_partes(self.dir_pronosticos, nuevas)]
+            if viejas and not estado['marcas'].empty:
+                # Solo los meses posteriores a la marca de cada serie (filtro sobre el Parquet)
+                minima = int(estado['marcas']['Marca'].min())
+                previas = _leer_partes(self.dir_pronosticos, viejas, filtros=[('Periodo', '>', minima)])
+                previas = previas.merge(estado['marcas'], on=CLAVES, how='left')
+                candidatas.append(previas[previas['Marca'].isna() | (previas['Periodo'] > previas['Marca'])].drop(columns='Marca'))
+            candidatas = pd.concat([c for c in candidatas if not c.empty] or [pd.DataFrame()], ignore_index=True)
+
+            errores = self._errores(candidatas, reales) if not candidatas.empty else candidatas
+            if not errores.empty:
+                errores = self._sin_repetidos(errores)
+            if not errores.empty:
+                _escribir_parte(errores, self.dir_errores)
+                self._sumar_agregados(errores)
+                estado['generacion'] += 1
+            estado['partes'] = set(partes)
+            estado['marcas'] = marcas
+            self._guardar_estado(estado)
+            self._compactar(estado)
+            return estado['generacion']
+
+    @staticmethod
+    def _marcas(reales):
+        """Último mes con datos de cada serie"""
+        marcas = reales[CLAVES].astype(str).assign(Marca=periodo(reales['Fecha']))
+        return marcas.groupby(CLAVES, as_index=False)['Marca'].max()
+
+    @staticmethod
+    def _errores(candidatas, reales):
+        """Cruzar las instantáneas con el valor real de su columna y mes"""
+        columnas = [c for c in candidatas['Columna'].unique() if c in reales.columns]
+        largo = reales[CLAVES + ['Fecha'] + columnas].melt(id_vars=CLAVES + ['Fecha'], var_name='Columna', value_name='Real')
+        largo[CLAVES] = largo[CLAVES].astype(str)
+        largo['Periodo'] = periodo(largo['Fecha'])
+        largo = largo.dropna(subset=['Real']).drop(columns='Fecha')
+
+        errores = candidatas.merge(largo, on=SERIE + ['Periodo'], how='inner')
+        errores['Real'] = errores['Real'].astype('float64')
+        errores['Error'] = errores['Real'] - errores['Prediccion']
+        real = errores['Real'].abs()
+        errores['ErrorPorc'] = (errores['Error'].abs() / real * 100).where(real > 0)
+        errores['Dentro'] = errores['Real'].between(errores['Inferior'], errores['Superior'])
+        errores['Evaluado'] = pd.Timestamp.now()
+        return errores.drop_duplicates(['Id', 'Horizonte'])
+
+    def _sin_repetidos(self, errores):
+        """Descartar los (Id, Horizonte) que ya tienen error guardado"""
+        existentes = _leer_partes(self.dir_errores, self.partes(self.dir_errores), ['Id', 'Horizonte'],
+                                  [('Periodo', 'in', sorted(errores['Periodo'].unique().tolist()))])
+        if existentes.empty:
+            return errores
+        clave = pd.MultiIndex.from_frame(errores[['Id', 'Horizonte']])
+        return errores[~clave.isin(pd.MultiIndex.from_frame(existentes[['Id', 'Horizonte']]))]
+
+    # -------------------- Agregados --------------------
+
+    @staticmethod
+    def _sumas(errores):
+        errores = errores.assign(
+            N=1, NPorc=errores['ErrorPorc'].notna().astype(int), SumaAbsPorc=errores['ErrorPorc'].fillna(0),
+            SumaAbs=errores['Error'].abs(), SumaCuad=errores['Error'] ** 2, Dentro=errores['Dentro'].astype(int),
+        )
+        return errores.groupby(SERIE + ['Modelo', 'Horizonte'], as_index=False)[SUMAS].sum()
+
+    def agregados(self):
+        """Sumas de errores por serie, modelo y horizonte"""
+        try:
+            return pd.read_parquet(self.ruta_agregados)
+        except FileNotFoundError:
+            return pd.DataFrame(columns=SERIE + ['Modelo', 'Horizonte'] + SUMAS)
+
+    def _sumar_agregados(self, errores):
+        agregados, nuevos = self.agregados(), self._sumas(errores)
+        if not agregados.empty:
+            nuevos = pd.concat([agregados, nuevos], ignore_index=True)
+            nuevos = nuevos.groupby(SERIE + ['Modelo', 'Horizonte'], as_index=False)[SUMAS].sum()
+        descriptor, temporal = tempfile.mkstemp(dir=self.directorio, suffix='.tmp')
+        os.close(descriptor)
+        nuevos.to_parquet(temporal, index=False)
+        os.replace(temporal, self.ruta_agregados)
+
+    def resumen(self, municipio=None, estrato=None, servicio=None, columna='Cargo Fijo', por_horizonte=False):
+        """MAPE, RMSE, MAE y cobertura del intervalo por modelo (y horizonte) de los pronósticos evaluados"""
+        agregados = self.agregados()
+        agregados = agregados[agregados['Columna'] == columna]
+        for nombre, valor in (('Municipio', municipio), ('Estrato', estrato), ('Servicio', servicio)):
+            if valor is not None:
+                agregados = agregados[agregados[nombre] == str(valor)]
+        grupos = ['Modelo', 'Horizonte'] if por_horizonte else ['Modelo']
+        sumas = agregados.groupby(grupos, as_index=False)[SUMAS].sum()
+        return pd.DataFrame({
+            **{g: sumas[g] for g in grupos},
+            'N': sumas['N'].astype(int),
+            'MAPE': sumas['SumaAbsPorc'] / sumas['NPorc'].where(sumas['NPorc'] > 0),
+            'RMSE': np.sqrt(sumas['SumaCuad'] / sumas['N']),
+            'MAE': sumas['SumaAbs'] / sumas['N'],
+            'Cobertura': sumas['Dentro'] / sumas['N'] * 100,
+        })
+
+    def errores(self, columnas=None, filtros=None):
+        return _leer_partes(self.dir_errores, self.partes(self.dir_errores), columnas, filtros)
+
+    # -------------------- Compactación --------------------
+
+    def _compactar(self, estado):
+        """Unir las partes pequeñas en una sola cuando se acumulan (con el bloqueo tomado)"""
+        for directorio, procesadas in ((self.dir_pronosticos, estado['partes']), (self.dir_errores, None)):
+            partes = [p for p in self.partes(directorio) if procesadas is None or p in procesadas]
+            if len(partes) <= MAX_PARTES:
+                continue
+            nueva = _escribir_parte(_leer_partes(directorio, partes), directorio)
+            if procesadas is not None:
+                estado['partes'] = (estado['partes'] - set(partes)) | {nueva}
+                self._guardar_estado(estado)
+            for parte in partes:
+                os.remove(os.path.join(directorio, parte))
+
+
+_lock = threading.Lock()
+_almacen = None
+
+
+def almacen():
+    """Almacén del directorio TARIFAS_PRECISION_DIR (o data/precision)"""
+    global _almacen
+    with _lock:
+        if _almacen is None:
+            _almacen = AlmacenPrecision(os.getenv(ENTORNO_DIRECTORIO) or RUTA_PRECISION)
+            atexit.register(_almacen.guardar)
+        return _almacen
+
+
+def registrar_pronostico(municipio, estrato, servicio, modelo, serie, fechas, prediccion, inferior, superior,
+                         nivel_confianza=95, columna='Cargo Fijo', fuente='', variante=''):
+    """Guardar la instantánea de un pronóstico sobre `serie` (ds/y); un fallo no afecta al pronóstico"""
+    try:
+        almacen().registrar(instantanea(
+            municipio, estrato, servicio, modelo, serie['ds'].max(), fechas, prediccion, inferior, superior,
+            nivel_confianza, columna, fuente, variante,
+        ))
+    except Exception as e:
+        logger.warning("No se pudo registrar el pronóstico para seguir su precisión: %s", e)
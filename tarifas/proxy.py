@@ -0,0 +1,223 @@
+"""
+Proxy inverso local para varios trabajadores de Streamlit.
+
+Cada navegador queda fijo en un trabajador mediante la cookie
+`tarifas_trabajador`: la sesión de Streamlit vive en la memoria de un
+proceso, así que la página, los recursos y el websocket `/_stcore/stream`
+de una pestaña deben llegar siempre al mismo. Los navegadores nuevos se
+asignan al trabajador sano con menos websockets abiertos.
+
+Un sondeo periódico consulta `/_stcore/health` de cada trabajador; los que
+no responden dejan de recibir sesiones nuevas y sus navegadores se
+reasignan. El estado se publica en `/_proxy/salud` (todos) y
+`/_proxy/salud/<n>` (uno). Usa tornado, que ya instala Streamlit.
+"""
+
+import json
+import time
+
+from tornado import httpclient, ioloop, web, websocket
+
+COOKIE_TRABAJADOR = 'tarifas_trabajador'
+INTERVALO_SALUD = 5
+TIEMPO_ESPERA = 600
+ENCABEZADOS_SALTO = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+    'transfer-encoding', 'upgrade', 'content-length',
+}
+
+
+class Trabajador:
+    """Un proceso de Streamlit escuchando en `puerto`"""
+
+    def __init__(self, numero, puerto, host='127.0.0.1'):
+        self.numero = numero
+        self.puerto = puerto
+        self.host = host
+        self.sano = False
+        self.conexiones = 0
+        self.ultimo_sondeo = None
+        self.error = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.puerto}"
+
+    def estado(self):
+        return {
+            'trabajador': self.numero, 'puerto': self.puerto, 'sano': self.sano,
+            'websockets': self.conexiones, 'ultimo_sondeo': self.ultimo_sondeo, 'error': self.error,
+        }
+
+
+class Balanceador:
+    """Asignación fija de navegadores a trabajadores y sondeo de su salud"""
+
+    def __init__(self, trabajadores):
+        self.trabajadores = list(trabajadores)
+        self.cliente = httpclient.AsyncHTTPClient()
+
+    def por_numero(self, numero):
+        try:
+            trabajador = self.trabajadores[int(numero)]
+        except (TypeError, ValueError, IndexError):
+            return None
+        return trabajador if trabajador.sano else None
+
+    def elegir(self):
+        sanos = [t for t in self.trabajadores if t.sano] or self.trabajadores
+        return min(sanos, key=lambda t: t.conexiones)
+
+    async def sondear(self):
+        for trabajador in self.trabajadores:
+            try:
+                respuesta = await self.cliente.fetch(f"{trabajador.url}/_stcore/health", request_timeout=INTERVALO_SALUD)
+                trabajador.sano, trabajador.error = respuesta.code == 200, None
+            except Exception as e:
+                trabajador.sano, trabajador.error = False, str(e)
+            trabajador.ultimo_sondeo = time.time()
+
+    def estado(self):
+        return {
+            'sanos': sum(t.sano for t in self.trabajadores),
+            'trabajadores': [t.estado() for t in self.trabajadores],
+        }
+
+
+class _ManejadorTrabajador:
+    """Trabajador de la petición según la cookie (o uno nuevo, que se fija en la cookie)"""
+
+    def trabajador(self, fijar=True):
+        balanceador = self.settings['balanceador']
+        trabajador = balanceador.por_numero(self.get_cookie(COOKIE_TRABAJADOR))
+        if trabajador is None:
+            trabajador = balanceador.elegir()
+            if fijar:
+                self.set_cookie(COOKIE_TRABAJADOR, str(trabajador.numero), httponly=True, samesite='Lax')
+        return trabajador
+
+    def encabezados_salida(self):
+        encabezados = {k: v for k, v in self.request.headers.get_all() if k.lower() not in ENCABEZADOS_SALTO}
+        encabezados['X-Forwarded-For'] = self.request.remote_ip
+        encabezados['X-Forwarded-Proto'] = self.request.protocol
+        return encabezados
+
+
+class ProxyHTTP(_ManejadorTrabajador, web.RequestHandler):
+    SUPPORTED_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+    def check_xsrf_cookie(self):
+        # La protección XSRF la aplica cada trabajador de Streamlit
+        pass
+
+    async def _reenviar(self):
+        trabajador = self.trabajador()
+        cuerpo = self.request.body if self.request.method in ('POST', 'PUT', 'PATCH', 'DELETE') else None
+        peticion = httpclient.HTTPRequest(
+            trabajador.url + self.request.uri, method=self.request.method, headers=self.encabezados_salida(),
+            body=cuerpo, allow_nonstandard_methods=True, follow_redirects=False,
+            decompress_response=False, request_timeout=TIEMPO_ESPERA,
+        )
+        try:
+            respuesta = await self.settings['balanceador'].cliente.fetch(peticion, raise_error=False)
+        except Exception as e:
+            raise web.HTTPError(502, f"Trabajador {trabajador.numero} no disponible: {e}")
+        if respuesta.code == 599:
+            raise web.HTTPError(502, f"Trabajador {trabajador.numero} no disponible: {respuesta.error}")
+
+        self.set_status(respuesta.code, respuesta.reason)
+        self._headers.clear()
+        for nombre, valor in respuesta.headers.get_all():
+            if nombre.lower() not in ENCABEZADOS_SALTO:
+                self.add_header(nombre, valor)
+        # La cookie del trabajador (si se acaba de asignar) se conserva
+        if respuesta.body and self.request.method != 'HEAD':
+            self.write(respuesta.body)
+
+    get = head = post = put = patch = delete = options = _reenviar
+
+
+class ProxyWebSocket(_ManejadorTrabajador, websocket.WebSocketHandler):
+    """Websocket de la sesión: se abre otro hacia el trabajador y se copian los mensajes"""
+
+    def select_subprotocol(self, subprotocols):
+        return subprotocols[0] if subprotocols else None
+
+    def check_origin(self, origin):
+        # El trabajador valida el origen con el Host original, que se reenvía
+        return True
+
+    async def open(self, *args, **kwargs):
+        # La respuesta del handshake ya salió: aquí no se puede fijar la cookie
+        self._trabajador = self.trabajador(fijar=False)
+        url = self._trabajador.url.replace('http', 'ws', 1) + self.request.uri
+        encabezados = {k: v for k, v in self.encabezados_salida().items()
+                       if not k.lower().startswith('sec-websocket')}
+        protocolos = [p.strip() for p in self.request.headers.get('Sec-WebSocket-Protocol', '').split(',') if p.strip()]
+        try:
+            self._destino = await websocket.websocket_connect(
+                httpclient.HTTPRequest(url, headers=encabezados), subprotocols=protocolos or None,
+                on_message_callback=self._desde_trabajador, max_message_size=self.settings.get('websocket_max_message_size'),
+            )
+        except Exception:
+            self._destino = None
+            self.close(1011, "Trabajador no disponible")
+            return
+        self._trabajador.conexiones += 1
+
+    def _desde_trabajador(self, mensaje):
+        if mensaje is None:
+            self.close()
+            return
+        try:
+            self.write_message(mensaje, binary=isinstance(mensaje, bytes))
+        except websocket.WebSocketClosedError:
+            pass
+
+    async def on_message(self, mensaje):
+        if self._destino is not None:
+            await self._destino.write_message(mensaje, binary=isinstance(mensaje, bytes))
+
+    def on_close(self):
+        destino, self._destino = getattr(self, '_destino', None), None
+        if destino is not None:
+            self._trabajador.conexiones -= 1
+            destino.close()
+
+
+class Salud(web.RequestHandler):
+    def get(self, numero=None):
+        balanceador = self.settings['balanceador']
+        if numero is None:
+            estado = balanceador.estado()
+            self.set_status(200 if estado['sanos'] else 503)
+        else:
+            if int(numero) >= len(balanceador.trabajadores):
+                raise web.HTTPError(404)
+            estado = balanceador.trabajadores[int(numero)].estado()
+            self.set_status(200 if estado['sano'] else 503)
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(estado))
+
+
+def crear_proxy(trabajadores, max_mensaje=200 * 1024 ** 2):
+    """Aplicación tornado que reparte las sesiones entre `trabajadores`"""
+    balanceador = Balanceador(trabajadores)
+    app = web.Application([
+        (r'/_proxy/salud', Salud),
+        (r'/_proxy/salud/(\d+)', Salud),
+        (r'.*/_stcore/stream', ProxyWebSocket),
+        (r'.*', ProxyHTTP),
+    ], balanceador=balanceador, websocket_max_message_size=max_mensaje)
+    app.balanceador = balanceador
+    return app
+
+
+def iniciar_proxy(trabajadores, puerto, direccion='0.0.0.0'):
+    """Escuchar en `puerto` y sondear la salud de los trabajadores (usar dentro del IOLoop)"""
+    app = crear_proxy(trabajadores)
+    app.listen(puerto, address=direccion, max_body_size=app.settings['websocket_max_message_size'])
+    sondeo = ioloop.PeriodicCallback(app.balanceador.sondear, INTERVALO_SALUD * 1000)
+    sondeo.start()
+    ioloop.IOLoop.current().add_callback(app.balanceador.sondear)
+    return app
@@ -0,0 +1,223 @@
+"""
+Generador de datos sintéticos con el esquema de la tabla de tarifas para
+pruebas de escala y benchmarks.
+
+Las tarifas se construyen como matrices (series x meses) con una base por
+municipio, un factor por estrato/sector y servicio, reajustes anuales de
+indexación, reajustes regulatorios ocasionales y una leve estacionalidad;
+los indicadores se recalculan con `indicadores.calcular_indicadores` para
+que sean consistentes con los cargos.
+"""
+
+import io
+
+import numpy as np
+import pandas as pd
+
+from tarifas.indicadores import COLUMNAS_INDICADORES, calcular_indicadores
+
+# Tabla por defecto de los datos sintéticos: nunca la de producción (datos.TABLA_TARIFAS),
+# porque los escritores la reemplazan con DROP TABLE
+TABLA_SINTETICA = 'tarifas_sinteticas'
+
+MUNICIPIOS_BASE = [
+    'Barbosa', 'Bello', 'Caldas', 'Copacabana', 'Envigado', 'Girardota',
+    'Itaguí', 'La Estrella', 'Medellín', 'Sabaneta', 'Rionegro', 'El Retiro'
+]
+ESTRATOS = ['1', '2', '3', '4', '5', '6']
+SECTORES = ['Comercial', 'Industrial', 'Oficial y Exenta']
+SERVICIOS = ['Acueducto', 'Alcantarillado']
+MESES = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio',
+         'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
+
+# Factores de Cargo Fijo respecto al estrato 4 (subsidios en 1-3,
+# contribuciones en 5-6 y sectores no residenciales)
+FACTORES_ESTRATO = {'1': 0.43, '2': 0.65, '3': 0.94, '4': 1.0, '5': 1.48, '6': 1.51}
+FACTORES_SECTOR = {'Comercial': 1.47, 'Industrial': 1.37, 'Oficial y Exenta': 1.0}
+FACTORES_SERVICIO = {'Acueducto': 1.0, 'Alcantarillado': 0.57}
+
+# Cargos de suspensión, reinstalación, reconexión y corte en el primer año
+PENALIZACIONES_BASE = {'Suspensión': 10935.89, 'Reinstalación': 9374.13, 'Reconexión': 17186.5, 'Corte': 18748.25}
+
+# Esquema de la tabla en PostgreSQL (columnas en el orden del backup)
+TIPOS_POSTGRES = {
+    'Municipio': 'text', 'Sector': 'text', 'Estrato': 'text', 'Servicio': 'text',
+    'Cargo Fijo': 'double precision', 'Cargo por Consumo Menor': 'double precision',
+    'Cargo por Consumo Mayor': 'double precision', 'Cargo por Consumo': 'double precision',
+    'Suspensión': 'double precision', 'Reinstalación': 'double precision',
+    'Reconexión': 'double precision', 'Corte': 'double precision',
+    'Año': 'bigint', 'Mes': 'text', 'Mes_num': 'bigint', 'Fecha': 'text',
+    **{columna: 'double precision' for columna in COLUMNAS_INDICADORES}
+}
+
+
+def nombres_municipios(n):
+    """Nombres de municipios: los reales primero y luego sintéticos"""
+    nombres = MUNICIPIOS_BASE[:n]
+    nombres += [f'Municipio {i:04d}' for i in range(len(nombres), n)]
+    return nombres
+
+
+def _factores_tarifa(rng, n_mun, n_fec, fechas, inflacion, prob_reajuste, estacionalidad):
+    """Matriz (municipios x meses) con la evolución relativa de las tarifas"""
+    # Indexación anual en enero: inflación común del año más un componente municipal
+    años = fechas.year.to_numpy() - fechas.year.min()
+    tasa_año = rng.uniform(*inflacion, años.max() + 1)
+    tasa_mun = rng.normal(0, 0.01, (n_mun, años.max() + 1))
+    crecimiento = np.cumprod(1 + tasa_año + tasa_mun, axis=1) / (1 + tasa_año[0] + tasa_mun[:, :1])
+    factores = crecimiento[:, años]
+
+    # Reajustes regulatorios (cambios de nivel permanentes en meses aleatorios)
+    saltos = rng.random((n_mun, n_fec)) < prob_reajuste
+    factores *= np.cumprod(np.where(saltos, rng.uniform(0.9, 1.2, (n_mun, n_fec)), 1.0), axis=1)
+
+    # Estacionalidad leve (revisiones de consumo a mitad de año)
+    fase = rng.uniform(0, 2 * np.pi, (n_mun, 1))
+    meses = fechas.month.to_numpy()[None, :]
+    return factores * (1 + estacionalidad * np.sin(2 * np.pi * meses / 12 + fase))
+
+
+def generar_tarifas(escala=1, municipios=None, estratos=None, sectores=None, servicios=None,
+                    meses=96, inicio='2017-01-01', inflacion=(0.03, 0.10), prob_reajuste=0.004,
+                    estacionalidad=0.004, ruido=0.002, semilla=0):
+    """
+    Generar una tabla de tarifas sintética con el esquema de
+    `tarifas_acueductos_aguas_residuales_med_ing_caracteristicas`.
+
+    `municipios` puede ser un número o una lista de nombres; si no se indica
+    se usan 12 municipios por unidad de escala (escala 1 ≈ tamaño de la tabla
+    real, ~20 mil filas). Todo se construye con operaciones vectorizadas, por
+    lo que millones de filas se generan en pocos segundos.
+    """
+    rng = np.random.default_rng(semilla)
+    if municipios is None:
+        municipios = 12 * escala
+    if isinstance(municipios, int):
+        municipios = nombres_municipios(municipios)
+    estratos = ESTRATOS if estratos is None else [str(e) for e in estratos]
+    sectores = SECTORES if sectores is None else list(sectores)
+    servicios = SERVICIOS if servicios is None else list(servicios)
+    fechas = pd.date_range(inicio, periods=meses, freq='MS')
+
+    categorias = estratos + sectores
+    factor_categoria = np.array(
+        [FACTORES_ESTRATO.get(e, 1.0) for e in estratos] + [FACTORES_SECTOR.get(s, 1.2) for s in sectores]
+    )
+    factor_servicio = np.array([FACTORES_SERVICIO.get(s, 0.8) for s in servicios])
+
+    n_mun, n_cat, n_ser, n_fec = len(municipios), len(categorias), len(servicios), len(fechas)
+    i_mun, i_cat, i_ser, i_fec = (a.ravel() for a in np.indices((n_mun, n_cat, n_ser, n_fec)))
+    n = i_mun.size
+    residencial = i_cat < len(estratos)
+
+    # Cargo Fijo = base municipal x estrato/sector x servicio x evolución temporal
+    base = rng.lognormal(np.log(6000), 0.08, n_mun)
+    evolucion = _factores_tarifa(rng, n_mun, n_fec, fechas, inflacion, prob_reajuste, estacionalidad)
+    cargo_fijo = (
+        base[i_mun] * factor_categoria[i_cat] * factor_servicio[i_ser]
+        * evolucion[i_mun, i_fec] * rng.normal(1, ruido, n)
+    )
+
+    # Consumo: bloques menor/mayor en residencial y cargo único en los demás sectores
+    consumo = cargo_fijo * rng.uniform(0.33, 0.42, n_mun)[i_mun]
+    menor = np.where(residencial, consumo * np.where(i_cat < 2, 0.8, 1.0), 0.0)
+    mayor = np.where(residencial, consumo, 0.0)
+    unico = np.where(residencial, 0.0, consumo)
+
+    # Penalizaciones: iguales para toda la región en cada fecha, reajustadas con la indexación
+    indexacion = evolucion.mean(axis=0)
+
+    categorias_arr = np.asarray(categorias, dtype=object)
+    df = pd.DataFrame({
+        'Municipio': np.asarray(municipios, dtype=object)[i_mun],
+        'Sector': np.where(residencial, 'Residencial', categorias_arr[i_cat]),
+        'Estrato': categorias_arr[i_cat],
+        'Servicio': np.asarray(servicios, dtype=object)[i_ser],
+        'Cargo Fijo': cargo_fijo.round(2),
+        'Cargo por Consumo Menor': menor.round(2),
+        'Cargo por Consumo Mayor': mayor.round(2),
+        'Cargo por Consumo': unico.round(2),
+        **{columna: (valor * indexacion).round(2)[i_fec] for columna, valor in PENALIZACIONES_BASE.items()},
+        'Año': np.asarray(fechas.year)[i_fec],
+        'Mes': np.asarray(MESES, dtype=object)[fechas.month - 1][i_fec],
+        'Mes_num': np.asarray(fechas.month)[i_fec],
+        'Fecha': np.asarray(fechas.strftime('%Y-%m-%d'), dtype=object)[i_fec],
+    })
+    return calcular_indicadores(df)
+
+
+def generar_municipios(nombres, centro=(6.25184, -75.56359), area_km2=250, semilla=0):
+    """
+    Polígonos sintéticos (teselación de Voronoi) para los municipios.
+
+    Cada municipio ocupa en promedio `area_km2` alrededor de `centro`, de
+    modo que los polígonos son contiguos como los del shapefile real.
+    """
+    import geopandas as gpd
+    import shapely
+    from shapely.geometry import box
+
+    rng = np.random.default_rng(semilla)
+    n = len(nombres)
+    lado = np.sqrt(n * area_km2) / 111.0
+    columnas = int(np.ceil(np.sqrt(n)))
+    paso = lado / columnas
+
+    # Centroides en cuadrícula con perturbación para obtener formas irregulares
+    indices = np.arange(n)
+    x = centro[1] - lado / 2 + (indices % columnas + 0.5 + rng.uniform(-0.35, 0.35, n)) * paso
+    y = centro[0] - lado / 2 + (indices // columnas + 0.5 + rng.uniform(-0.35, 0.35, n)) * paso
+    puntos = shapely.points(x, y)
+
+    extension = box(centro[1] - lado / 2, centro[0] - lado / 2, centro[1] + lado / 2, centro[0] + lado / 2)
+    celdas = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(puntos), extend_to=extension, ordered=True))
+    geometrias = shapely.intersection(celdas, extension)
+
+    gdf = gpd.GeoDataFrame({
+        'MpCodigo': [f'{i:05d}' for i in range(5001, 5001 + n)],
+        'MpNombre': list(nombres),
+        'Depto': 'Antioquia',
+    }, geometry=geometrias, crs="EPSG:4326")
+    gdf['MpArea'] = gdf.to_crs(epsg=9377).area / 1e6
+    return gdf
+
+
+def escribir_parquet(df, ruta, row_group_size=250_000):
+    """Guardar la tabla en Parquet"""
+    df.to_parquet(ruta, index=False, row_group_size=row_group_size)
+
+
+def escribir_sqlite(df, ruta, tabla=TABLA_SINTETICA, tamaño_lote=100_000):
+    """Guardar la tabla en una base SQLite (reemplaza la tabla si existe)"""
+    import sqlite3
+
+    columnas = ', '.join(f'"{c}"' for c in df.columns)
+    marcadores = ', '.join('?' for _ in df.columns)
+    with sqlite3.connect(ruta) as conn:
+        definiciones = ', '.join(f'"{c}" {TIPOS_POSTGRES.get(c, "text").replace("double precision", "real")}' for c in df.columns)
+        conn.execute(f'DROP TABLE IF EXISTS "{tabla}"')
+        conn.execute(f'CREATE TABLE "{tabla}" ({definiciones})')
+        for inicio in range(0, len(df), tamaño_lote):
+            lote = df.iloc[inicio:inicio + tamaño_lote]
+            conn.executemany(
+                f'INSERT INTO "{tabla}" ({columnas}) VALUES ({marcadores})',
+                lote.itertuples(index=False, name=None)
+            )
+
+
+def escribir_postgres(df, conn, tabla=TABLA_SINTETICA, tamaño_lote=500_000):
+    """
+    Cargar la tabla en PostgreSQL con COPY (conexión de psycopg2).
+
+    La tabla se recrea con los tipos del backup (`Fecha` como text).
+    """
+    definiciones = ', '.join(f'"{c}" {TIPOS_POSTGRES.get(c, "text")}' for c in df.columns)
+    columnas = ', '.join(f'"{c}"' for c in df.columns)
+    with conn.cursor() as cur:
+        cur.execute(f'DROP TABLE IF EXISTS "{tabla}"; CREATE TABLE "{tabla}" ({definiciones})')
+        for inicio in range(0, len(df), tamaño_lote):
+            buffer = io.StringIO()
+            df.iloc[inicio:inicio + tamaño_lote].to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            cur.copy_expert(f'COPY "{tabla}" ({columnas}) FROM STDIN WITH (FORMAT csv)', buffer)
+    conn.commit()
@@ -0,0 +1,131 @@
+"""
+Tabla de tarifas publicada una vez y mapeada en memoria por cada proceso.
+
+Con varios trabajadores (`run_dashboard.py --trabajadores N`) o un pool de
+procesos, cada uno tendría su propia copia de la tabla. Aquí la tabla
+compacta y ya ordenada se escribe una sola vez en el directorio de la caché
+compartida, un archivo `.npy` por columna (las categóricas como códigos
+enteros, con sus categorías en `meta.pkl`). Los demás procesos la abren con
+`np.load(mmap_mode='r')` y arman el DataFrame sin copiar: cada columna es
+un bloque sobre el archivo mapeado, así que el sistema operativo comparte
+las mismas páginas entre todos los procesos y abrir la tabla no requiere
+deserializar nada. Las columnas son de solo lectura: una asignación en el
+lugar desde una página falla en lugar de modificar la tabla de todos.
+
+Los polígonos de municipios no se pueden mapear (las geometrías viven en
+GEOS); se publican como GeoArrow (`to_feather`), que se decodifica mucho
+más rápido que leer y reproyectar el shapefile.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from tarifas import cache_compartido
+
+META = 'meta.pkl'
+
+
+def _directorio(nombre, version, cache=None):
+    cache = cache or cache_compartido.cache_compartido()
+    if cache is None:
+        return None
+    return os.path.join(cache.directorio, 'tablas', f"{nombre}-{version}")
+
+
+def _publicar_directorio(destino, escribir):
+    """Escribir en un directorio temporal y renombrarlo (si otro proceso ganó, se descarta)"""
+    if os.path.isdir(destino):
+        return destino
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporal = tempfile.mkdtemp(dir=os.path.dirname(destino), prefix='.tmp-')
+    try:
+        escribir(temporal)
+        os.rename(temporal, destino)
+    except OSError:
+        if not os.path.isdir(destino):
+            raise
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+    return destino
+
+
+def escribir_tabla(df, directorio):
+    """Escribir `df` como un .npy por columna más los metadatos"""
+    columnas = []
+    for i, (nombre, serie) in enumerate(df.items()):
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            valores, categorias = serie.cat.codes.to_numpy(), serie.dtype
+        else:
+            valores, categorias = serie.to_numpy(), None
+        if valores.dtype == object:
+            # Sin representación de tamaño fijo: va copiada en los metadatos
+            columnas.append((nombre, None, categorias, valores))
+            continue
+        archivo = f"{i}.npy"
+        np.save(os.path.join(directorio, archivo), np.ascontiguousarray(valores))
+        columnas.append((nombre, archivo, categorias, None))
+    with open(os.path.join(directorio, META), 'wb') as f:
+        pickle.dump({'filas': len(df), 'columnas': columnas}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def leer_tabla(directorio):
+    """DataFrame sobre los archivos mapeados en memoria (sin copiar)"""
+    with open(os.path.join(directorio, META), 'rb') as f:
+        meta = pickle.load(f)
+    datos = {}
+    for nombre, archivo, categorias, valores in meta['columnas']:
+        if archivo is not None:
+            valores = np.load(os.path.join(directorio, archivo), mmap_mode='r')
+        if categorias is not None:
+            valores = pd.Categorical.from_codes(valores, dtype=categorias, validate=False)
+        datos[nombre] = valores
+    # copy=False: un bloque por columna sobre el mapa, sin consolidar
+    return pd.DataFrame(datos, index=pd.RangeIndex(meta['filas']), copy=False)
+
+
+def _borrar_anteriores(directorio, nombre):
+    """Borrar las versiones anteriores; los procesos que aún las tienen mapeadas no se ven afectados"""
+    padre, actual = os.path.split(directorio)
+    for entrada in os.listdir(padre):
+        if entrada != actual and entrada.rsplit('-', 1)[0] == nombre:
+            shutil.rmtree(os.path.join(padre, entrada), ignore_errors=True)
+
+
+def publicar(df, nombre, version, cache=None):
+    """Publicar la tabla (nombre, versión) en la caché compartida; devuelve la versión mapeada"""
+    directorio = _directorio(nombre, version, cache)
+    if directorio is None:
+        return df
+    _publicar_directorio(directorio, lambda temporal: escribir_tabla(df, temporal))
+    _borrar_anteriores(directorio, nombre)
+    return leer_tabla(directorio)
+
+
+def adjuntar(nombre, version, cache=None):
+    """Tabla (nombre, versión) ya publicada, mapeada en memoria; None si no existe"""
+    directorio = _directorio(nombre, version, cache)
+    if directorio is None or not os.path.exists(os.path.join(directorio, META)):
+        return None
+    return leer_tabla(directorio)
+
+
+def publicar_municipios(gdf, nombre, version, cache=None):
+    directorio = _directorio(nombre, version, cache)
+    if directorio is None:
+        return gdf
+    _publicar_directorio(directorio, lambda temporal: gdf.to_feather(os.path.join(temporal, 'municipios.feather')))
+    return gdf
+
+
+def adjuntar_municipios(nombre, version, cache=None):
+    import geopandas as gpd
+
+    directorio = _directorio(nombre, version, cache)
+    if directorio is None or not os.path.exists(os.path.join(directorio, 'municipios.feather')):
+        return None
+    return gpd.read_feather(os.path.join(directorio, 'municipios.feather'))
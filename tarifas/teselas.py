@@ -0,0 +1,484 @@
+"""
+Servidor local de teselas de mapa base a partir de archivos MBTiles.
+
+Cada capa es un archivo `<capa>.mbtiles` (SQLite con el esquema MBTiles
+1.3, filas en numeración TMS) en `data/teselas` o en `TARIFAS_TESELAS_DIR`.
+`seed_tiles.py` descarga una vez las teselas del Valle de Aburrá y el
+Oriente cercano y `run_tiles.py` las sirve en
+`/teselas/<capa>/<z>/<x>/<y>.<formato>` con una caché LRU en memoria para
+las teselas más pedidas. El visor carga las capas sembradas del servidor
+solo si `TARIFAS_TESELAS_URL` está configurado (lo fija `run_dashboard.py`
+al iniciarlo) y el servidor responde (`servidor_disponible`); si no, usa
+el proveedor remoto, igual que para las capas sin sembrar. La URL es la
+que usa el navegador: para usuarios remotos debe ser una dirección del
+servidor, no `localhost`. En `/teselas/js/` el servidor entrega además las
+bibliotecas de JavaScript guardadas en `<directorio>/js` (el cliente de
+teselas vectoriales, ver `build_vector_tiles.py`).
+
+Usa tornado, que ya instala Streamlit.
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+RUTA_TESELAS = 'data/teselas'
+ENTORNO_DIRECTORIO = 'TARIFAS_TESELAS_DIR'
+ENTORNO_URL = 'TARIFAS_TESELAS_URL'
+PUERTO_TESELAS = 8510
+CARPETA_JS = 'js'
+# Segundos durante los que vale la última comprobación del servidor
+INTERVALO_SERVIDOR = 30
+
+# Valle de Aburrá y Oriente cercano (oeste, sur, este, norte)
+BBOX_VALLE = (-75.80, 5.85, -75.10, 6.60)
+ZOOM_MINIMO = 8
+ZOOM_MAXIMO = 14
+MAX_BYTES_CACHE = 64 * 1024 ** 2
+MAX_EDAD_NAVEGADOR = 7 * 24 * 3600
+
+# Proveedores remotos de cada capa (respaldo sin sembrar y origen de la siembra)
+FUENTES = {
+    'osm': {
+        'url': 'https://tile.openstreetmap.org/{z}/{x}/{y}.png',
+        'formato': 'png',
+        'atribucion': "&copy; <a href='https://www.openstreetmap.org/copyright'>OpenStreetMap</a> contributors",
+    },
+    'cartografia': {
+        'url': 'https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png',
+        'formato': 'png',
+        'atribucion': "&copy; <a href='https://www.openstreetmap.org/copyright'>OpenStreetMap</a> contributors "
+                      "&copy; <a href='https://carto.com/attributions'>CARTO</a>",
+    },
+    'satelite': {
+        'url': 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
+        'formato': 'jpg',
+        'atribucion': "Tiles &copy; Esri &mdash; Source: Esri, i-cubed, USDA, USGS, AEX, GeoEye, Getmapping, "
+                      "Aerogrid, IGN, IGP, UPR-EGP, and the GIS User Community",
+    },
+    # Las teselas de terreno de Stamen ya no se publican; OpenTopoMap es la alternativa libre
+    'terreno': {
+        'url': 'https://{s}.tile.opentopomap.org/{z}/{x}/{y}.png',
+        'formato': 'png',
+        'atribucion': "Map data: &copy; <a href='https://www.openstreetmap.org/copyright'>OpenStreetMap</a> "
+                      "contributors, SRTM | Map style: &copy; <a href='https://opentopomap.org'>OpenTopoMap</a> "
+                      "(<a href='https://creativecommons.org/licenses/by-sa/3.0/'>CC-BY-SA</a>)",
+    },
+}
+
+TIPOS_CONTENIDO = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'pbf': 'application/x-protobuf',
+    'js': 'application/javascript',
+}
+
+
+def directorio_teselas():
+    return os.getenv(ENTORNO_DIRECTORIO) or RUTA_TESELAS
+
+
+def ruta_capa(capa, directorio=None):
+    return os.path.join(directorio or directorio_teselas(), f'{capa}.mbtiles')
+
+
+# ======================== Coordenadas de teselas ========================
+
+def tesela(lon, lat, z):
+    """Columna y fila XYZ (esquema de Google/OSM) del punto en el zoom `z`"""
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def limites_tesela(z, x, y):
+    """(oeste, sur, este, norte) en grados de la tesela XYZ"""
+    n = 2 ** z
+
+    def latitud(fila):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * fila / n))))
+
+    return x / n * 360.0 - 180.0, latitud(y + 1), (x + 1) / n * 360.0 - 180.0, latitud(y)
+
+
+def teselas_bbox(bbox, zooms):
+    """(z, x, y) de todas las teselas que cubren `bbox` en cada zoom"""
+    oeste, sur, este, norte = bbox
+    for z in zooms:
+        x0, y0 = tesela(oeste, norte, z)
+        x1, y1 = tesela(este, sur, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+
+# ======================== Archivos MBTiles ========================
+
+class MBTiles:
+    """Archivo MBTiles: metadatos y teselas (filas TMS en el archivo, XYZ en la interfaz)"""
+
+    def __init__(self, ruta, escritura=False):
+        self.ruta = str(ruta)
+        if escritura:
+            os.makedirs(os.path.dirname(self.ruta) or '.', exist_ok=True)
+            self.conexion = sqlite3.connect(self.ruta, check_same_thread=False)
+            self.conexion.executescript("""
+                CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS tiles (
+                    zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row);
+            """)
+        else:
+            self.conexion = sqlite3.connect(f'file:{self.ruta}?mode=ro', uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def metadatos(self):
+        with self._lock:
+            return dict(self.conexion.execute("SELECT name, value FROM metadata").fetchall())
+
+    def guardar_metadatos(self, metadatos):
+        with self._lock, self.conexion:
+            self.conexion.executemany(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                [(nombre, str(valor)) for nombre, valor in metadatos.items()]
+            )
+
+    def leer(self, z, x, y):
+        """Bytes de la tesela o None"""
+        with self._lock:
+            fila = self.conexion.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, 2 ** z - 1 - y)
+            ).fetchone()
+        return None if fila is None else bytes(fila[0])
+
+    def existentes(self):
+        """Conjunto de (z, x, y) ya guardados"""
+        with self._lock:
+            filas = self.conexion.execute("SELECT zoom_level, tile_column, tile_row FROM tiles").fetchall()
+        return {(z, x, 2 ** z - 1 - fila) for z, x, fila in filas}
+
+    def escribir(self, teselas):
+        """Guardar (z, x, y, bytes) en una transacción"""
+        with self._lock, self.conexion:
+            self.conexion.executemany(
+                "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                [(z, x, 2 ** z - 1 - y, sqlite3.Binary(datos)) for z, x, y, datos in teselas]
+            )
+
+    def zooms(self):
+        """(mínimo, máximo) de los zooms guardados"""
+        with self._lock:
+            return self.conexion.execute("SELECT MIN(zoom_level), MAX(zoom_level) FROM tiles").fetchone()
+
+    def cerrar(self):
+        self.conexion.close()
+
+
+def capas_locales(directorio=None):
+    """Capas con archivo MBTiles en el directorio de teselas"""
+    directorio = directorio or directorio_teselas()
+    if not os.path.isdir(directorio):
+        return []
+    return sorted(nombre[:-len('.mbtiles')] for nombre in os.listdir(directorio) if nombre.endswith('.mbtiles'))
+
+
+def url_servidor():
+    """URL configurada del servidor de teselas, o None"""
+    url = os.getenv(ENTORNO_URL)
+    return url.rstrip('/') if url else None
+
+
+_comprobacion = {'url': None, 'hasta': 0.0, 'disponible': False}
+_lock_comprobacion = threading.Lock()
+
+
+def servidor_disponible():
+    """
+    True si hay un servidor de teselas configurado y responde a
+    `/estado` (la respuesta se recuerda INTERVALO_SERVIDOR segundos)
+    """
+    url = url_servidor()
+    if url is None:
+        return False
+    with _lock_comprobacion:
+        ahora = time.monotonic()
+        if _comprobacion['url'] != url or ahora >= _comprobacion['hasta']:
+            import requests
+
+            try:
+                disponible = requests.get(f"{url}/estado", timeout=1).ok
+            except requests.RequestException:
+                disponible = False
+            _comprobacion.update(url=url, hasta=ahora + INTERVALO_SERVIDOR, disponible=disponible)
+        return _comprobacion['disponible']
+
+
+def capas_disponibles(directorio=None):
+    """Capas sembradas que el visor puede cargar del servidor local (ninguna si no está disponible)"""
+    capas = capas_locales(directorio)
+    return capas if capas and servidor_disponible() else []
+
+
+def url_libreria(archivo, directorio=None):
+    """URL local de una biblioteca de JavaScript guardada en `<directorio>/js`, o None"""
+    ruta = os.path.join(directorio or directorio_teselas(), CARPETA_JS, archivo)
+    if os.path.isfile(ruta) and servidor_disponible():
+        return f"{url_servidor()}/{CARPETA_JS}/{archivo}"
+    return None
+
+
+def capa_base(capa, directorio=None):
+    """
+    URL, atribución y zoom nativo máximo de una capa de mapa base: del
+    servidor local si está sembrada y el servidor está disponible, del
+    proveedor remoto si no.
+    """
+    fuente = FUENTES.get(capa, FUENTES['osm'])
+    ruta = ruta_capa(capa, directorio)
+    if os.path.isfile(ruta) and servidor_disponible():
+        try:
+            archivo = MBTiles(ruta)
+            try:
+                metadatos = archivo.metadatos()
+            finally:
+                archivo.cerrar()
+            formato = metadatos.get('format', fuente['formato'])
+            return {
+                'url': f"{url_servidor()}/{capa}/{{z}}/{{x}}/{{y}}.{formato}",
+                'atribucion': metadatos.get('attribution', fuente['atribucion']),
+                'zoom_nativo': int(metadatos.get('maxzoom', ZOOM_MAXIMO)),
+            }
+        except (sqlite3.Error, ValueError) as e:
+            print(f"No se pudo abrir la capa local {capa}:", e)
+    return {'url': fuente['url'], 'atribucion': fuente['atribucion'], 'zoom_nativo': None}
+
+
+# ======================== Siembra ========================
+
+def descargar_tesela(sesion, plantilla, z, x, y, intentos=3):
+    """Bytes de una tesela del proveedor (None si no existe)"""
+    url = plantilla.format(s='abc'[(x + y) % 3], z=z, x=x, y=y)
+    for intento in range(intentos):
+        try:
+            respuesta = sesion.get(url, timeout=30)
+            if respuesta.status_code == 404:
+                return None
+            respuesta.raise_for_status()
+            return respuesta.content
+        except Exception:
+            if intento == intentos - 1:
+                raise
+            time.sleep(2 ** intento)
+
+
+def sembrar(capa, directorio=None, bbox=BBOX_VALLE, zoom_minimo=ZOOM_MINIMO, zoom_maximo=ZOOM_MAXIMO,
+            url=None, hilos=2, reemplazar=False, lote=256, progreso=None):
+    """
+    Descargar al MBTiles de `capa` las teselas de `bbox` entre los dos zooms.
+    Las ya guardadas se omiten (salvo `reemplazar`). Devuelve un dict con las
+    teselas descargadas, omitidas y fallidas.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    import requests
+
+    if capa in FUENTES:
+        fuente = FUENTES[capa]
+    else:
+        extension = os.path.splitext(url.split('?')[0])[1].lstrip('.').lower()
+        fuente = {'url': url, 'formato': extension if extension in TIPOS_CONTENIDO else 'png', 'atribucion': ''}
+    plantilla = url or fuente['url']
+    archivo = MBTiles(ruta_capa(capa, directorio), escritura=True)
+    try:
+        archivo.guardar_metadatos({
+            'name': capa,
+            'format': fuente['formato'],
+            'bounds': ','.join(str(v) for v in bbox),
+            'center': f"{(bbox[0] + bbox[2]) / 2},{(bbox[1] + bbox[3]) / 2},{zoom_minimo + 2}",
+            'minzoom': zoom_minimo,
+            'maxzoom': zoom_maximo,
+            'attribution': fuente['atribucion'],
+            'type': 'baselayer',
+            'version': '1.3',
+        })
+        todas = list(teselas_bbox(bbox, range(zoom_minimo, zoom_maximo + 1)))
+        guardadas = set() if reemplazar else archivo.existentes()
+        pendientes = [t for t in todas if t not in guardadas]
+        resumen = {'descargadas': 0, 'omitidas': len(todas) - len(pendientes), 'fallidas': 0}
+
+        sesion = requests.Session()
+        sesion.headers['User-Agent'] = 'tarifas-valle-aburra/1.0 (siembra de teselas)'
+
+        def descargar(tesela_xyz):
+            try:
+                return tesela_xyz, descargar_tesela(sesion, plantilla, *tesela_xyz)
+            except Exception as e:
+                print(f"Tesela {tesela_xyz} de {capa}: {e}")
+                return tesela_xyz, None
+
+        pendiente_escritura = []
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            for (z, x, y), datos in pool.map(descargar, pendientes):
+                if datos is None:
+                    resumen['fallidas'] += 1
+                    continue
+                pendiente_escritura.append((z, x, y, datos))
+                resumen['descargadas'] += 1
+                if len(pendiente_escritura) >= lote:
+                    archivo.escribir(pendiente_escritura)
+                    pendiente_escritura = []
+                    if progreso:
+                        progreso(resumen, len(pendientes))
+        if pendiente_escritura:
+            archivo.escribir(pendiente_escritura)
+        # Los zooms publicados son los guardados, sumando las siembras anteriores
+        minimo, maximo = archivo.zooms()
+        if minimo is not None:
+            archivo.guardar_metadatos({'minzoom': minimo, 'maxzoom': maximo})
+        return resumen
+    finally:
+        archivo.cerrar()
+
+
+# ======================== Servidor ========================
+
+class CacheTeselas:
+    """LRU en memoria de teselas, limitada por bytes"""
+
+    def __init__(self, max_bytes=MAX_BYTES_CACHE):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._teselas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, cargar):
+        with self._lock:
+            datos = self._teselas.get(clave)
+            if datos is not None:
+                self._teselas.move_to_end(clave)
+                self.aciertos += 1
+                return datos
+            self.fallos += 1
+        datos = cargar()
+        if datos is None or len(datos) > self.max_bytes:
+            return datos
+        with self._lock:
+            if clave not in self._teselas:
+                self._teselas[clave] = datos
+                self.bytes += len(datos)
+            while self.bytes > self.max_bytes:
+                _, antigua = self._teselas.popitem(last=False)
+                self.bytes -= len(antigua)
+        return datos
+
+    def descartar(self, capa):
+        """Quitar las teselas de una capa (su archivo cambió)"""
+        with self._lock:
+            for clave in [clave for clave in self._teselas if clave[0] == capa]:
+                self.bytes -= len(self._teselas.pop(clave))
+
+    def estado(self):
+        with self._lock:
+            return {
+                'teselas': len(self._teselas), 'bytes': self.bytes,
+                'aciertos': self.aciertos, 'fallos': self.fallos,
+            }
+
+
+class ServidorTeselas:
+    """Capas MBTiles de un directorio (abiertas en el primer uso) detrás de una caché LRU"""
+
+    def __init__(self, directorio=None, max_bytes=MAX_BYTES_CACHE):
+        self.directorio = directorio or directorio_teselas()
+        self.cache = CacheTeselas(max_bytes)
+        self._capas = {}
+        self._lock = threading.Lock()
+
+    def capa(self, nombre):
+        """(MBTiles, metadatos) de la capa, o None si no existe"""
+        ruta = ruta_capa(nombre, self.directorio)
+        try:
+            version = os.stat(ruta).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            abierta = self._capas.get(nombre)
+            if abierta is None or abierta[2] != version:
+                # Archivo nuevo o reescrito (otra siembra, otra pirámide): se reabre
+                if abierta is not None:
+                    abierta[0].cerrar()
+                    self.cache.descartar(nombre)
+                archivo = MBTiles(ruta)
+                abierta = self._capas[nombre] = (archivo, archivo.metadatos(), version)
+            return abierta[0], abierta[1]
+
+    def tesela(self, nombre, z, x, y):
+        """(bytes, formato) de la tesela, o None"""
+        capa = self.capa(nombre)
+        if capa is None:
+            return None
+        archivo, metadatos = capa
+        datos = self.cache.obtener((nombre, z, x, y), lambda: archivo.leer(z, x, y))
+        return None if datos is None else (datos, metadatos.get('format', 'png'))
+
+    def estado(self):
+        capas = {}
+        for nombre in capas_locales(self.directorio):
+            capa = self.capa(nombre)
+            if capa is not None:
+                capas[nombre] = {clave: capa[1].get(clave) for clave in ('format', 'minzoom', 'maxzoom', 'bounds')}
+        return {'capas': capas, 'cache': self.cache.estado()}
+
+
+def crear_app(servidor):
+    from tornado import web
+
+    class Tesela(web.RequestHandler):
+        def set_default_headers(self):
+            # El visor dibuja el mapa en un iframe sin origen propio
+            self.set_header('Access-Control-Allow-Origin', '*')
+
+        def get(self, capa, z, x, y, formato):
+            resultado = servidor.tesela(capa, int(z), int(x), int(y))
+            if resultado is None:
+                raise web.HTTPError(404)
+            datos, formato_capa = resultado
+            self.set_header('Content-Type', TIPOS_CONTENIDO.get(formato_capa, 'application/octet-stream'))
+            if datos[:2] == b'\x1f\x8b':
+                # Las teselas vectoriales de MBTiles suelen guardarse comprimidas con gzip
+                self.set_header('Content-Encoding', 'gzip')
+            self.set_header('Cache-Control', f'public, max-age={MAX_EDAD_NAVEGADOR}')
+            self.write(datos)
+
+    class Libreria(web.StaticFileHandler):
+        def set_default_headers(self):
+            self.set_header('Access-Control-Allow-Origin', '*')
+
+    class Estado(web.RequestHandler):
+        def get(self):
+            self.set_header('Content-Type', 'application/json')
+            self.write(json.dumps(servidor.estado(), ensure_ascii=False))
+
+    return web.Application([
+        (r'/teselas/([\w\-]+)/(\d+)/(\d+)/(\d+)\.(\w+)', Tesela),
+        (r'/teselas/estado', Estado),
+        (rf'/teselas/{CARPETA_JS}/([\w\-.]+\.js)', Libreria, {'path': os.path.join(servidor.directorio, CARPETA_JS)}),
+    ])
+
+
+def iniciar_servidor(puerto=PUERTO_TESELAS, direccion='0.0.0.0', directorio=None, max_bytes=MAX_BYTES_CACHE):
+    """Servidor de teselas en el IOLoop actual (hay que arrancar el loop)"""
+    servidor = ServidorTeselas(directorio, max_bytes)
+    crear_app(servidor).listen(puerto, direccion)
+    return servidor
@@ -0,0 +1,102 @@
+"""
+Ubicación de coordenadas en municipios y consulta de sus tarifas.
+
+Los polígonos de `data/shp/municipios` se indexan una sola vez en un
+STRtree; un lote de puntos (lat/lon) se resuelve con una sola consulta
+vectorizada de shapely, sin recorrer los puntos en Python. Las tarifas
+vigentes y pronosticadas se calculan una vez por municipio en una tabla
+alineada con los polígonos (`tabla_poligonos`), que se reparte a los puntos
+por posición.
+"""
+
+import numpy as np
+import pandas as pd
+
+from tarifas.geo import normalizar_nombre
+
+COLUMNAS_TARIFA = ['Cargo Fijo', 'Cargo por Consumo']
+
+
+class LocalizadorMunicipios:
+    """Índice espacial (STRtree) sobre los polígonos de municipios"""
+
+    def __init__(self, gdf_municipios):
+        import shapely
+
+        if gdf_municipios.crs is not None and gdf_municipios.crs.to_string() != "EPSG:4326":
+            gdf_municipios = gdf_municipios.to_crs("EPSG:4326")
+        self.nombres = gdf_municipios['MpNombre'].to_numpy()
+        self.nombres_norm = gdf_municipios['MpNombre'].map(normalizar_nombre).to_numpy()
+        self.geometrias = gdf_municipios.geometry.to_numpy()
+        self.arbol = shapely.STRtree(self.geometrias)
+
+    def __len__(self):
+        return len(self.geometrias)
+
+    def localizar(self, lat, lon):
+        """
+        Posición del polígono que contiene cada punto (-1 si ninguno).
+
+        Los puntos sobre un límite compartido quedan en el polígono de menor
+        posición, de modo que el resultado no depende del orden del árbol.
+        """
+        import shapely
+
+        puntos = shapely.points(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        i_punto, i_poligono = self.arbol.query(puntos, predicate='intersects')
+        posiciones = np.full(len(puntos), -1, dtype=np.int64)
+        orden = np.lexsort((i_poligono, i_punto))
+        i_punto, i_poligono = i_punto[orden], i_poligono[orden]
+        primero = np.unique(i_punto, return_index=True)[1]
+        posiciones[i_punto[primero]] = i_poligono[primero]
+        return posiciones
+
+
+def tarifas_vigentes(indice, estrato, servicio, columnas=COLUMNAS_TARIFA):
+    """Última observación de cada municipio para un estrato y servicio"""
+    claves = [(municipio, estrato, servicio) for municipio in indice.municipios]
+    vigentes = indice.ultimas(claves)[['Municipio', 'Fecha'] + columnas].reset_index(drop=True)
+    vigentes['Municipio'] = vigentes['Municipio'].astype(str)
+    vigentes['Municipio_norm'] = vigentes['Municipio'].map(normalizar_nombre)
+    return vigentes
+
+
+def pronosticos_municipios(municipios, columnas, pronostico):
+    """
+    Pronóstico de cada municipio y columna con `pronostico(municipio, columna)`
+    -> (fecha, valor). Las series que no se pueden modelar quedan en NaN.
+    """
+    registros = []
+    for municipio in municipios:
+        registro = {'Municipio': municipio, 'Fecha pronóstico': pd.NaT}
+        for columna in columnas:
+            try:
+                fecha, valor = pronostico(municipio, columna)
+            except Exception:
+                fecha, valor = pd.NaT, np.nan
+            registro['Fecha pronóstico'] = registro['Fecha pronóstico'] if pd.isna(fecha) else fecha
+            registro[f'{columna} pronosticado'] = valor
+        registros.append(registro)
+    return pd.DataFrame(registros, columns=['Municipio', 'Fecha pronóstico'] + [f'{c} pronosticado' for c in columnas])
+
+
+def municipios_localizados(localizador, vigentes, posiciones):
+    """Municipios de `vigentes` que contienen al menos uno de los puntos"""
+    nombres_norm = localizador.nombres_norm[np.unique(posiciones[posiciones >= 0])]
+    return vigentes.loc[vigentes['Municipio_norm'].isin(nombres_norm), 'Municipio'].tolist()
+
+
+def tabla_poligonos(localizador, vigentes, pronosticos=None):
+    """
+    Tarifas alineadas con los polígonos del localizador, más una fila vacía
+    al final para los puntos que no caen en ningún polígono (posición -1).
+
+    `vigentes` sale de `tarifas_vigentes` y `pronosticos` (opcional) de
+    `pronosticos_municipios`.
+    """
+    tabla = vigentes.drop_duplicates('Municipio_norm').set_index('Municipio_norm')
+    if pronosticos is not None:
+        tabla = tabla.merge(pronosticos, on='Municipio', how='left').set_index(tabla.index)
+    tabla = tabla.reindex(localizador.nombres_norm).reset_index(drop=True)
+    tabla.insert(0, 'MpNombre', localizador.nombres)
+    return tabla.reindex(range(len(tabla) + 1))
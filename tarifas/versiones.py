@@ -0,0 +1,307 @@
+"""
+Versiones de los datos e invalidación de cachés por cambios.
+
+Cada carga o migración registra un cambio en la tabla `versiones_datos`
+(una fila por municipio afectado, o una sola con municipio nulo si cambió
+toda la tabla) con un número de versión creciente; en PostgreSQL además se
+envía un NOTIFY por el canal `versiones_datos`. Los procesos (páginas y API)
+consultan las versiones posteriores a la última vista (una consulta barata
+sobre un índice) cada INTERVALO_SONDEO segundos, o de inmediato al recibir
+el NOTIFY, y recargan solo las filas de los municipios afectados.
+
+Las cachés usan como parte de su clave la versión global (agregados,
+GeoJSON) o la del municipio (series y pronósticos), de modo que un cambio en
+un municipio no invalida los pronósticos de los demás.
+"""
+
+import logging
+import os
+import select
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import (Column, DateTime, Integer, MetaData, String, Table, create_engine, func, insert, inspect,
+                        select as sql_select, text)
+from sqlalchemy.engine import Engine
+
+from tarifas import cache_compartido, datos, lago, tabla_compartida
+from tarifas.indice import IndiceSeries
+
+TABLA_VERSIONES = "versiones_datos"
+CANAL_VERSIONES = "versiones_datos"
+INTERVALO_SONDEO = 30
+
+logger = logging.getLogger(__name__)
+
+_metadatos = MetaData()
+versiones_datos = Table(
+    TABLA_VERSIONES, _metadatos,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('version', Integer, nullable=False, index=True),
+    Column('tabla', String(128), nullable=False),
+    Column('municipio', String(128)),
+    Column('origen', String(256)),
+    Column('registrado', DateTime, server_default=func.now()),
+)
+
+
+def _engine(origen):
+    return origen if isinstance(origen, Engine) else create_engine(str(origen))
+
+
+def crear_tabla_versiones(origen):
+    """Crear la tabla de versiones si no existe"""
+    _metadatos.create_all(_engine(origen), tables=[versiones_datos])
+
+
+def registrar_cambio(origen, municipios=None, tabla=datos.TABLA_TARIFAS, descripcion=''):
+    """
+    Registrar un cambio en `tabla` (de `municipios`, o de toda la tabla si es
+    None) con una versión nueva y avisar por NOTIFY en PostgreSQL. Devuelve
+    la versión registrada.
+    """
+    engine = _engine(origen)
+    crear_tabla_versiones(engine)
+    with engine.begin() as conn:
+        postgres = conn.dialect.name == 'postgresql'
+        if postgres:
+            # Dos cargas simultáneas no pueden tomar el mismo número
+            conn.execute(text(f"LOCK TABLE {TABLA_VERSIONES} IN SHARE ROW EXCLUSIVE MODE"))
+        version = (conn.execute(sql_select(func.max(versiones_datos.c.version))).scalar() or 0) + 1
+        filas = [{'municipio': None}] if municipios is None else [{'municipio': str(m)} for m in sorted(set(municipios))]
+        conn.execute(insert(versiones_datos), [
+            {**fila, 'version': version, 'tabla': tabla, 'origen': descripcion} for fila in filas
+        ])
+        if postgres:
+            conn.execute(text("SELECT pg_notify(:canal, :carga)"), {'canal': CANAL_VERSIONES, 'carga': f"{tabla}:{version}"})
+    return version
+
+
+def version_actual(origen, tabla=datos.TABLA_TARIFAS):
+    """Última versión registrada de `tabla` (0 si no hay ninguna o no existe la tabla de versiones)"""
+    try:
+        with _engine(origen).connect() as conn:
+            consulta = sql_select(func.max(versiones_datos.c.version)).where(versiones_datos.c.tabla == tabla)
+            return conn.execute(consulta).scalar() or 0
+    except Exception:
+        return 0
+
+
+def cambios_desde(origen, version, tabla=datos.TABLA_TARIFAS):
+    """
+    (versión más reciente, municipios cambiados después de `version`); los
+    municipios son None si alguno de los cambios fue de toda la tabla.
+    """
+    with _engine(origen).connect() as conn:
+        if not inspect(conn).has_table(TABLA_VERSIONES):
+            return version, set()
+        filas = conn.execute(
+            sql_select(versiones_datos.c.version, versiones_datos.c.municipio)
+            .where(versiones_datos.c.tabla == tabla, versiones_datos.c.version > version)
+        ).all()
+    if not filas:
+        return version, set()
+    municipios = {m for _, m in filas}
+    return max(v for v, _ in filas), (None if None in municipios else municipios)
+
+
+# ======================== Vigilantes ========================
+
+class VigilanteVersiones:
+    """
+    Versión de una tabla en la base: sondeo cada `intervalo` segundos y, en
+    PostgreSQL, LISTEN en un hilo para enterarse de inmediato.
+    """
+
+    def __init__(self, origen, tabla=datos.TABLA_TARIFAS, intervalo=INTERVALO_SONDEO, escuchar=True):
+        self.engine = _engine(origen)
+        self.tabla = tabla
+        self.intervalo = intervalo
+        self.version = version_actual(self.engine, tabla)
+        self._ultimo_sondeo = time.monotonic()
+        self._aviso = threading.Event()
+        self._lock = threading.Lock()
+        if escuchar and self.engine.dialect.name == 'postgresql':
+            threading.Thread(target=self._escuchar, daemon=True, name='versiones-listen').start()
+
+    def _escuchar(self):
+        try:
+            conexion = self.engine.raw_connection()
+            conexion.driver_connection.autocommit = True
+            with conexion.cursor() as cursor:
+                cursor.execute(f"LISTEN {CANAL_VERSIONES}")
+            pg = conexion.driver_connection
+            while True:
+                if select.select([pg], [], [], 60) == ([], [], []):
+                    continue
+                pg.poll()
+                if any(n.payload.split(':')[0] == self.tabla for n in pg.notifies):
+                    self._aviso.set()
+                pg.notifies.clear()
+        except Exception as e:
+            # Sin LISTEN queda el sondeo periódico
+            logger.warning("LISTEN %s no disponible: %s", CANAL_VERSIONES, e)
+
+    def cambios(self):
+        """(versión, municipios) si hubo cambios desde la última consulta; si no, None"""
+        with self._lock:
+            ahora = time.monotonic()
+            if not self._aviso.is_set() and ahora - self._ultimo_sondeo < self.intervalo:
+                return None
+            self._aviso.clear()
+            self._ultimo_sondeo = ahora
+            try:
+                version, municipios = cambios_desde(self.engine, self.version, self.tabla)
+            except Exception as e:
+                logger.warning("No se pudo consultar la versión de los datos: %s", e)
+                return None
+            if version == self.version:
+                return None
+            self.version = version
+            return version, municipios
+
+    def reintentar(self, version):
+        """Volver a `version` para que el próximo sondeo informe otra vez los cambios posteriores"""
+        with self._lock:
+            self.version = version
+
+
+class VigilanteArchivo:
+    """Versión de un archivo de datos: su fecha de modificación (toda la tabla cambia)"""
+
+    def __init__(self, ruta, intervalo=INTERVALO_SONDEO):
+        self.ruta = str(ruta)
+        self.intervalo = intervalo
+        self.version = self._mtime()
+        self._ultimo_sondeo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.ruta).st_mtime_ns
+        except OSError:
+            return 0
+
+    def cambios(self):
+        with self._lock:
+            ahora = time.monotonic()
+            if ahora - self._ultimo_sondeo < self.intervalo:
+                return None
+            self._ultimo_sondeo = ahora
+            version = self._mtime()
+            if version == self.version:
+                return None
+            self.version = version
+            return version, None
+
+    def reintentar(self, version):
+        """Volver a `version` para que el próximo sondeo informe otra vez el cambio"""
+        with self._lock:
+            self.version = version
+
+
+def vigilante(origen, tabla=datos.TABLA_TARIFAS, intervalo=INTERVALO_SONDEO):
+    """Vigilante adecuado para `origen` (archivo de datos, dataset particionado, URL o engine de base de datos)"""
+    if isinstance(origen, (str, os.PathLike)) and lago.es_lago(origen):
+        return VigilanteArchivo(lago.ruta_version(origen), intervalo)
+    if isinstance(origen, (str, os.PathLike)) and os.path.splitext(str(origen))[1].lower() in ('.parquet', '.csv', '.xlsx', '.xls'):
+        return VigilanteArchivo(origen, intervalo)
+    return VigilanteVersiones(origen, tabla, intervalo)
+
+
+# ======================== Tabla versionada ========================
+
+def _indice_solo_lectura(df):
+    """Índice sobre la tabla ordenada, con sus columnas de solo lectura"""
+    indice = IndiceSeries(df)
+    if not indice.df.empty:
+        indice.df = datos.solo_lectura(indice.df)
+    return indice
+
+
+class DatosVersionados:
+    """
+    Tabla compacta compartida (en un IndiceSeries) que se actualiza cuando
+    el vigilante informa un cambio. `cargar(municipios)` devuelve la tabla
+    compacta de esos municipios (o completa con None); si el cambio es de
+    unos municipios solo se leen y reemplazan sus filas, y si ya no tienen
+    filas se quitan de la tabla. `cargar` lanza una excepción si no puede
+    leer; entonces (o si una recarga completa queda vacía) se conservan la
+    tabla y la versión anteriores y el próximo sondeo vuelve a intentarlo.
+    Con `nombre` y la
+    caché compartida configurada, cada versión de la tabla la arma un solo
+    proceso y los demás la mapean en memoria (`tabla_compartida`).
+    """
+
+    def __init__(self, cargar, vigilante=None, nombre=None):
+        self._cargar = cargar
+        self.vigilante = vigilante
+        self.nombre = nombre
+        self.version = vigilante.version if vigilante is not None else 0
+        self.indice = self._compartir(self.version, lambda: cargar(None))
+        self._version_tabla = self.version
+        self._versiones_municipio = {}
+        self._lock = threading.Lock()
+
+    def actualizar(self):
+        """Aplicar los cambios pendientes; devuelve los municipios actualizados"""
+        cambios = self.vigilante.cambios() if self.vigilante is not None else None
+        if cambios is None:
+            return set()
+        version, municipios = cambios
+        with self._lock:
+            try:
+                if municipios is None:
+                    def recargar():
+                        tabla = self._cargar(None)
+                        if tabla.empty:
+                            raise ValueError("la recarga devolvió una tabla vacía")
+                        return tabla
+
+                    self.indice = self._compartir(version, recargar)
+                    self._version_tabla = version
+                    self._versiones_municipio.clear()
+                    municipios = set(self.indice.municipios)
+                elif municipios:
+                    anterior = self.indice.df
+
+                    def reemplazar():
+                        nuevas = self._cargar(sorted(municipios))
+                        conservadas = anterior[~anterior['Municipio'].astype(str).isin(municipios)]
+                        if nuevas.empty:
+                            # Municipios sin filas en el origen: se quitan (sus columnas vacías no se concatenan)
+                            if isinstance(conservadas['Municipio'].dtype, pd.CategoricalDtype):
+                                conservadas = conservadas.assign(Municipio=conservadas['Municipio'].cat.remove_unused_categories())
+                            return conservadas.reset_index(drop=True)
+                        return datos.compactar_tarifas(pd.concat([conservadas, nuevas], ignore_index=True))
+
+                    self.indice = self._compartir(version, reemplazar)
+                    self._versiones_municipio.update({m: version for m in municipios})
+            except Exception as e:
+                logger.warning("No se pudo aplicar la versión %s de los datos, se reintentará: %s", version, e)
+                self.vigilante.reintentar(self.version)
+                return set()
+            self.version = version
+        return municipios
+
+    def _compartir(self, version, construir):
+        """
+        Índice de la tabla en `version`: la ya publicada por otro proceso o
+        `construir()`, que se publica. Las columnas son siempre de solo
+        lectura (mapeadas en memoria o `datos.solo_lectura`).
+        """
+        if self.nombre is None or cache_compartido.cache_compartido() is None:
+            return _indice_solo_lectura(construir())
+        df = tabla_compartida.adjuntar(self.nombre, version)
+        if df is not None:
+            return IndiceSeries(df, ordenada=True)
+        indice = _indice_solo_lectura(construir())
+        # Una tabla vacía no se comparte con los demás procesos
+        if indice.df.empty:
+            return indice
+        return IndiceSeries(tabla_compartida.publicar(indice.df, self.nombre, version), ordenada=True)
+
+    def version_municipio(self, municipio):
+        """Versión del último cambio que afectó a `municipio` (clave de las cachés por serie)"""
+        return max(self._version_tabla, self._versiones_municipio.get(str(municipio), 0))